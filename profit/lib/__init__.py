@@ -124,6 +124,7 @@ class Signals(object):
     modelReset = SIGNAL('modelReset()')
     modified = SIGNAL('modified')
     openUrl = SIGNAL('openUrl(PyQt_PyObject)')
+    panned = SIGNAL('panned(int, int)')
     rowsInserted = SIGNAL('rowsInserted(const QModelIndex &, int, int)')
     selectionChanged = SIGNAL('selectionChanged(const QItemSelection &, const QItemSelection &)')
     settingsChanged = SIGNAL('settingsChanged')
@@ -9,11 +9,25 @@
 # This module defines the Plot class for display of plots and
 # associated controls.
 #
+# Plots do not redraw for each message.  A message for a plot marks it
+# dirty and asks the RenderClock for a frame; the clock redraws every
+# dirty plot at once, at most 'maxFrameRate' times a second (from the
+# plot settings).  All plots share one clock, so a burst of messages
+# costs one repaint per plot per frame.  Hidden plots stay dirty and
+# are redrawn when shown.
+#
+# Curves are given only the points needed for the visible range and
+# the canvas width (see profit.series.decimate), recomputed when the
+# plot is zoomed or panned.
+#
 ##
 
-from PyQt4.QtCore import QRectF, QString, QTimer, QVariant
+from time import time
+
+from PyQt4.QtCore import QObject, QRectF, QString, QTimer, QVariant
 from PyQt4.QtCore import Qt, pyqtSignature
-from PyQt4.QtGui import QBrush, QColor, QColorDialog, QFont, QFontDialog
+from PyQt4.QtGui import QAction, QBrush, QColor, QColorDialog, QFont
+from PyQt4.QtGui import QFontDialog
 from PyQt4.QtGui import QStandardItem, QStandardItemModel, QMenu, QPen, QFrame
 from PyQt4.Qwt5 import QwtLegend, QwtPicker, QwtPlot, QwtPlotCurve
 from PyQt4.Qwt5 import QwtPlotGrid, QwtPlotPicker, QwtPlotZoomer, QwtPainter
@@ -26,6 +40,7 @@ from profit.lib.gui import ValueColorItem, colorIcon, complementColor
 from profit.lib.widgets.plotdatadialog import PlotDataDialog
 from profit.lib.widgets.plotitemdialog import PlotItemDialog
 from profit.lib.widgets.ui_plot import Ui_Plot
+from profit.series.decimate import CurveFeed, CurveSummary
 
 
 allAxes = \
@@ -188,6 +203,52 @@ class PlotDataMarker(QwtPlotMarker):
         self.setSymbol(other.symbol())
 
 
+def loadCurveSettings(settings, name, curve):
+    """ Configures a plot curve from saved settings.
+
+    @param settings Settings instance, in the plots group
+    @param name of curve
+    @param curve QwtPlotCurve instance
+    @return None
+    """
+    getv = settings.value
+    curve.setBrush(QBrush(getv('%s/brush' % name, QBrush())))
+    curve.setPen(QPen(getv('%s/pen' % name, QPen())))
+    curve.setStyle(curve.CurveStyle(
+        getv('%s/style' % name, QVariant(curve.Lines)).toInt()[0]))
+    curve.setBaseline(
+        getv('%s/baseline' % name, QVariant(0.0)).toDouble()[0])
+    curve.setCurveAttribute(
+        curve.Inverted, getv('%s/inverted' % name).toBool())
+    curve.setCurveAttribute(
+        curve.Fitted, getv('%s/fitted' % name).toBool())
+    curve.setPaintAttribute(
+        curve.PaintFiltered, getv('%s/filtered' % name).toBool())
+    curve.setPaintAttribute(
+        curve.ClipPolygons, getv('%s/clippoly' % name).toBool())
+    curve.setXAxis(
+        QwtPlot.Axis(getv('%s/xaxis' % name, xBottom).toInt()[0]))
+    curve.setYAxis(
+        QwtPlot.Axis(getv('%s/yaxis' % name, yRight).toInt()[0]))
+
+    def applySymbol(symname, symobj):
+        symobj.setBrush(QBrush(getv('%s/brush' % symname, QBrush())))
+        symobj.setPen(QPen(getv('%s/pen' % symname, QPen())))
+        style = getv('%s/style' % symname, QVariant(symobj.NoSymbol))
+        symobj.setStyle(symobj.Style(style.toInt()[0]))
+        symobj.setSize(getv('%s/size' % symname).toSize())
+
+    applySymbol('%s/symbol' % name, curve.symbol())
+    curve.dataMarker = marker = PlotDataMarker()
+    marksym = QwtSymbol()
+    applySymbol('%s/dataselect/symbol' % name, marksym)
+    marker.setSymbol(marksym)
+    markstyle = getv('%s/dataselect/style' % name, PlotDataMarker.VLine)
+    marker.setLineStyle(marker.LineStyle(markstyle.toInt()[0]))
+    marker.setLinePen(QPen(getv('%s/dataselect/pen' % name, Qt.red)))
+    curve.settingsLoaded = True
+
+
 class PlotPanner(QwtPlotPanner):
     """ Stub for future implementation.
 
@@ -198,13 +259,20 @@ class PlotPanner(QwtPlotPanner):
 
 
 class PlotPicker(QwtPlotPicker):
-    """ Stub for future implementation.
+    """ Plot picker showing the values of curves under the cursor.
 
     """
-    def __init__(self, canvas):
+    def __init__(self, canvas, items=None):
+        """ Initializer.
+
+        @param canvas plot canvas widget
+        @param items=None callable returning the ControlTreeItem
+        instances of the visible curves
+        """
         QwtPlotPicker.__init__(
             self, xBottom, yRight, self.NoSelection, self.CrossRubberBand,
             self.AlwaysOn, canvas)
+        self.items = items
 
     def trackerText(self, pos):
         pos = self.invTransform(pos)
@@ -215,6 +283,10 @@ class PlotPicker(QwtPlotPicker):
             label = '%.3f' % pos.x()
         else:
             label = '%i, %.3f' % (pos.x(), pos.y(), )
+            for item in (self.items() if self.items else []):
+                point = item.summary.nearest(pos.x())
+                if point is not None:
+                    label += '\n%s: %.3f' % (item.text(0), point[1])
         return QwtText(label)
 
 
@@ -233,12 +305,98 @@ class Legend(QwtLegend):
     """
 
 
+class RenderClock(QObject):
+    """ Coalesces plot redraws into frames at a maximum rate.
+
+    """
+    defaultFrameRate = 20
+
+    def __init__(self, frameRate=None):
+        """ Initializer.
+
+        @param frameRate=None maximum frames per second; if None, read
+        from the 'maxFrameRate' plot setting
+        """
+        QObject.__init__(self)
+        if frameRate is None:
+            settings = Settings()
+            settings.beginGroup(settings.keys.plots)
+            frameRate = settings.value(
+                'maxFrameRate', QVariant(self.defaultFrameRate)).toInt()[0]
+            settings.endGroup()
+        self.setFrameRate(frameRate)
+        self.pending = []
+        self.last = 0.0
+        self.timer = timer = QTimer(self)
+        timer.setSingleShot(True)
+        self.connect(timer, Signals.timeout, self.render)
+
+    def setFrameRate(self, frameRate):
+        """ Sets the maximum number of frames per second.
+
+        @param frameRate frames per second
+        @return None
+        """
+        self.interval = 1.0 / max(frameRate, 1)
+
+    def request(self, plot):
+        """ Schedules a plot to be redrawn in the next frame.
+
+        @param plot Plot instance with a 'render' method
+        @return None
+        """
+        if plot not in self.pending:
+            self.pending.append(plot)
+        if not self.timer.isActive():
+            wait = self.last + self.interval - time()
+            self.timer.start(max(int(wait * 1000), 0))
+
+    def render(self):
+        """ Redraws the plots requested since the last frame.
+
+        @return None
+        """
+        pending, self.pending = self.pending, []
+        self.last = time()
+        for plot in pending:
+            try:
+                plot.render()
+            except (RuntimeError, ):
+                ## underlying widget deleted
+                pass
+
+
+def renderClock(clocks=[]):
+    """ Returns the render clock shared by all plots.
+
+    """
+    if not clocks:
+        clocks.append(RenderClock())
+    return clocks[0]
+
+
 class ControlTreeValueItem(QStandardItem, ValueColorItem):
+    value = None
+
     def __init__(self, text):
         QStandardItem.__init__(self, text)
         self.setEditable(False)
         self.setTextAlignment(Qt.AlignVCenter|Qt.AlignRight)
 
+    def setValue(self, value):
+        """ Displays a value, colored by its change from the last one.
+
+        @param value number
+        @return None
+        """
+        previous = self.value
+        if value == previous:
+            return
+        if previous is not None:
+            self.setForeground(self.compMap[cmp(value, previous)])
+        self.value = value
+        QStandardItem.setText(self, '%.2f' % value)
+
     def setText(self, text):
         try:
             v = float(self.text())
@@ -271,6 +429,10 @@ class ControlTreeItem(QStandardItem):
         self.curve.setVisible(False)
         self.data = data
         self.key = key
+        self.valueItem = None
+        self.wasChecked = self.isChecked()
+        self.summary = CurveSummary(data)
+        self.feed = CurveFeed(self.summary)
 
     def isChecked(self):
         """ True if this item is checked.
@@ -309,6 +471,7 @@ class Plot(QFrame, Ui_Plot):
         """
         QFrame.__init__(self, parent)
         self.setupUi(self)
+        self.dirty = self.settingValues = False
         self.settings = Settings()
         self.settings.beginGroup(self.settings.keys.plots)
         self.setupOptionsMenu()
@@ -335,6 +498,14 @@ class Plot(QFrame, Ui_Plot):
         pop.addAction(self.actionShowDataDialog)
         pop.addAction(self.actionDrawLegend)
         pop.addAction(self.actionChangeCanvasColor)
+        pop.addSeparator()
+        self.actionSmoothCurves = action = \
+            QAction('Smooth Large Curves', self)
+        action.setCheckable(True)
+        action.setToolTip('Draw large curves with about one point per pixel')
+        self.connect(action, Signals.triggeredBool,
+                     self.on_actionSmoothCurves_triggered)
+        pop.addAction(action)
 
     def setupPlotsMenu(self):
         """ Configure the plots button menu.
@@ -368,9 +539,10 @@ class Plot(QFrame, Ui_Plot):
         self.panner = PlotPanner(canvas)
         self.zoomer = PlotZoomer(canvas)
         self.zoomer.setRubberBandPen(pen)
-        self.picker = PlotPicker(canvas)
+        self.picker = PlotPicker(canvas, self.visibleItems)
         self.picker.setTrackerPen(pen)
         self.connect(self.zoomer, Signals.zoomed, self.on_zoomer_zoomed)
+        self.connect(self.panner, Signals.panned, self.on_panner_panned)
         self.enableAutoScale()
 
     def setSessionPlot(self, session, collection, key, *indexes):
@@ -396,6 +568,8 @@ class Plot(QFrame, Ui_Plot):
         self.loadSelections()
         self.loadCanvasColor()
         self.loadLegend()
+        self.actionSmoothCurves.setChecked(
+            settings.value('%s/smoothcurves' % name).toBool())
         self.updateAxis()
         scaler = self.plot.axisScaleEngine(xBottom)
         scaler.setMargins(0.0, 0.05)
@@ -462,6 +636,7 @@ class Plot(QFrame, Ui_Plot):
         self.controlsTreeItems.append(item)
         if not items:
             items = [ControlTreeValueItem(''), ]
+        item.valueItem = items[0]
         parent.appendRow([item, ] + items)
         if checkable:
             item.setColor(self.loadItemPen(item).color())
@@ -499,11 +674,71 @@ class Plot(QFrame, Ui_Plot):
     def on_zoomer_zoomed(self, rect):
         """ Sets autoscaling mode when plot is zoomed to its base.
 
-        @param rect ignored
+        When called for a zoom, the visible curves are given the
+        points needed for the new range.
+
+        @param rect new zoom rectangle, or None if not zoomed
         @return None
         """
         if not self.zoomer.zoomRectIndex():
             self.enableAutoScale()
+        if rect is not None:
+            self.setVisibleCurvesData()
+            self.plot.replot()
+
+    def on_panner_panned(self, dx, dy):
+        """ Gives the visible curves the points needed after panning.
+
+        @param dx ignored
+        @param dy ignored
+        @return None
+        """
+        self.setVisibleCurvesData()
+        self.plot.replot()
+
+    def setCurveData(self, item):
+        """ Sets the points of a curve from its series.
+
+        The points are reduced to those needed to draw the curve over
+        the zoomed range, widened by its width on each side so that
+        panning does not show gaps, and the width of the canvas.  When
+        not zoomed, only the points for new values are computed (see
+        CurveFeed), and the curve is given views of its point buffers.
+
+        @param item ControlTreeItem instance
+        @return None
+        """
+        width = self.plot.canvas().width()
+        smooth = self.actionSmoothCurves.isChecked()
+        if self.zoomer.zoomRectIndex():
+            rect = self.zoomer.zoomRect()
+            lower = rect.left() - rect.width()
+            upper = rect.right() + rect.width()
+            xs, ys = item.feed.load(
+                *item.summary.points(lower, upper, width, smooth))
+        elif smooth:
+            xs, ys = item.feed.load(
+                *item.summary.points(width=width, lttb=True))
+        else:
+            xs, ys = item.feed.follow(width)
+        item.curve.setData(xs, ys)
+
+    def visibleItems(self):
+        """ Sequence of controls with visible curves.
+
+        """
+        return [i for i in getattr(self, 'controlsTreeItems', [])
+                if i.curve.isVisible()]
+
+    def setVisibleCurvesData(self):
+        """ Sets the points of every visible curve.
+
+        @return list of visible ControlTreeItem instances
+        """
+        items = self.visibleItems()
+        for item in items:
+            self.setCurveData(item)
+        return items
 
     def enableAutoScale(self):
         """ Sets autoscaling mode on all four axes.
@@ -528,7 +763,7 @@ class Plot(QFrame, Ui_Plot):
         if enable:
             if not curve.settingsLoaded:
                 self.loadCurve(self.itemName(item), curve)
-            curve.setData(item.data.x, item.data.y)
+            self.setCurveData(item)
             curve.attach(plot)
             if self.actionDrawLegend.isChecked():
                 curve.updateLegend(legend, True)
@@ -578,42 +813,7 @@ class Plot(QFrame, Ui_Plot):
         @param curve QwtPlotCurve instance
         @return None
         """
-        getv = self.settings.value
-        curve.setBrush(QBrush(getv('%s/brush' % name, QBrush())))
-        curve.setPen(QPen(getv('%s/pen' % name, QPen())))
-        curve.setStyle(curve.CurveStyle(
-            getv('%s/style' % name, QVariant(curve.Lines)).toInt()[0]))
-        curve.setBaseline(
-            getv('%s/baseline' % name, QVariant(0.0)).toDouble()[0])
-        curve.setCurveAttribute(
-            curve.Inverted, getv('%s/inverted' % name).toBool())
-        curve.setCurveAttribute(
-            curve.Fitted, getv('%s/fitted' % name).toBool())
-        curve.setPaintAttribute(
-            curve.PaintFiltered, getv('%s/filtered' % name).toBool())
-        curve.setPaintAttribute(
-            curve.ClipPolygons, getv('%s/clippoly' % name).toBool())
-        curve.setXAxis(
-            QwtPlot.Axis(getv('%s/xaxis' % name, xBottom).toInt()[0]))
-        curve.setYAxis(
-            QwtPlot.Axis(getv('%s/yaxis' % name, yRight).toInt()[0]))
-
-        def applySymbol(symname, symobj):
-            symobj.setBrush(QBrush(getv('%s/brush' % symname, QBrush())))
-            symobj.setPen(QPen(getv('%s/pen' % symname, QPen())))
-            style = getv('%s/style' % symname, QVariant(symobj.NoSymbol))
-            symobj.setStyle(symobj.Style(style.toInt()[0]))
-            symobj.setSize(getv('%s/size' % symname).toSize())
-
-        applySymbol('%s/symbol' % name, curve.symbol())
-        curve.dataMarker = marker = PlotDataMarker()
-        marksym = QwtSymbol()
-        applySymbol('%s/dataselect/symbol' % name, marksym)
-        marker.setSymbol(marksym)
-        markstyle = getv('%s/dataselect/style' % name, PlotDataMarker.VLine)
-        marker.setLineStyle(marker.LineStyle(markstyle.toInt()[0]))
-        marker.setLinePen(QPen(getv('%s/dataselect/pen' % name, Qt.red)))
-        curve.settingsLoaded = True
+        loadCurveSettings(self.settings, name, curve)
 
     def loadGrids(self):
         """ Reads and sets the major and minor grid pens and visibility.
@@ -855,21 +1055,25 @@ class Plot(QFrame, Ui_Plot):
         self.addSeries(TickType.getField(field), series)
         self.controlsTree.sortByColumn(0, Qt.AscendingOrder)
 
-    def setItemValue(self, item):
-        idx = self.controlsTreeModel.indexFromItem(item)
-        parent = item.parent()
-        if parent:
-            getc = parent.child
-        else:
-            getc = self.controlsTreeModel.item
-        next = getc(item.row(), item.column()+1)
+    def setItemValues(self):
+        """ Displays the last value of each series that has changed.
+
+        Values are set with item change handling suspended, so that
+        only check state changes reach on_controlsTree_itemChanged.
+
+        @return None
+        """
+        self.settingValues = True
         try:
-            next.setText('%.2f' % item.data[-1])
-        except (AttributeError, IndexError, TypeError, ):
-            pass
-        else:
-            for c in [item.child(r, 0) for r in range(item.rowCount())]:
-                self.setItemValue(c)
+            for item in self.controlsTreeItems:
+                valueItem = item.valueItem
+                try:
+                    value = item.data[-1]
+                    valueItem.setValue(value)
+                except (AttributeError, IndexError, TypeError, ):
+                    pass
+        finally:
+            self.settingValues = False
 
     def on_session_TickPrice_TickSize(self, message):
         """ Signal handler for TickPrice and TickSize session messages.
@@ -877,27 +1081,48 @@ class Plot(QFrame, Ui_Plot):
         @param message Message instance
         @return None
         """
-        if message.tickerId != self.key:
-            return
-        for item in self.controlsTreeItems:
-            self.setItemValue(item)
-        items = [i for i in self.controlsTreeItems if i.curve.isVisible()]
-        for item in items:
-            item.curve.setData(item.data.x, item.data.y)
-        if items:
-            self.plot.replot()
-        self.on_zoomer_zoomed(None)
+        if message.tickerId == self.key:
+            self.requestRender()
 
     def on_session_UpdateAccountValue(self, message):
-        if self.key != 'account':
+        if self.key == 'account':
+            self.requestRender()
+
+    def requestRender(self):
+        """ Marks this plot dirty and schedules a redraw.
+
+        @return None
+        """
+        self.dirty = True
+        if self.isVisible():
+            renderClock().request(self)
+
+    def render(self):
+        """ Redraws control values and visible curves if this plot is dirty.
+
+        Called by the render clock.
+
+        @return None
+        """
+        if not (self.dirty and self.isVisible()):
             return
-        items = [i for i in self.controlsTreeItems if i.curve.isVisible()]
-        for item in items:
-            item.curve.setData(item.data.x, item.data.y)
-        if items:
+        self.dirty = False
+        if self.key != 'account':
+            self.setItemValues()
+        if self.setVisibleCurvesData():
             self.plot.replot()
         self.on_zoomer_zoomed(None)
 
+    def showEvent(self, event):
+        """ Schedules a redraw of changes made while this plot was hidden.
+
+        @param event QShowEvent instance
+        @return None
+        """
+        QFrame.showEvent(self, event)
+        if self.dirty:
+            renderClock().request(self)
+
 
     ## action signal handlers
 
@@ -1125,6 +1350,17 @@ class Plot(QFrame, Ui_Plot):
         if color:
             self.settings.setValue('%s/axiscolor' % self.plotName(), color)
 
+    def on_actionSmoothCurves_triggered(self, enable):
+        """ Signal handler called to toggle LTTB reduction of curves.
+
+        @param enable if True, large curves are reduced to about one
+        point per pixel
+        @return None
+        """
+        self.setVisibleCurvesData()
+        self.plot.replot()
+        self.settings.setValue('%s/smoothcurves' % self.plotName(), enable)
+
     @pyqtSignature('bool')
     def on_actionShowDataDialog_triggered(self, enable):
         """ Signal handler called to show or hide the data dialog.
@@ -1170,15 +1406,17 @@ class Plot(QFrame, Ui_Plot):
     def on_controlsTree_itemChanged(self, item):
         """ Signal handler for all changes to control tree items.
 
+        Only changes to the check state of curve items are handled.
+
         @param item changed tree widget item
         @return None
         """
-        try:
-            curve = item.curve
-        except (AttributeError, ):
-            pass
-        else:
-            self.enableCurve(item, enable=item.checkState()==Qt.Checked)
+        if self.settingValues or not hasattr(item, 'curve'):
+            return
+        checked = item.isChecked()
+        if checked != item.wasChecked:
+            item.wasChecked = checked
+            self.enableCurve(item, enable=checked)
             self.updateAxis()
             self.saveSelections()
 
@@ -1223,23 +1461,36 @@ class Plot(QFrame, Ui_Plot):
     def on_dataDialog_selected(self, items):
         """ Signal handler for data dialog selection changes.
 
+        Rows of the data dialog are positions in the series, which
+        differ from 'x' values once a series has discarded values.
+        When the plot is zoomed and the last selected value is outside
+        of the zoomed range, the range is moved to center on it.
+
         @params items list of (index, item) two-tuples
         @return None
         """
         for marker in self.highlightMarkers:
             marker.detach()
         self.highlightMarkers = markers = []
+        x = None
         for index, item in items:
             try:
-                x, y = index.row(), item.data[index.row()]
+                y = item.data[index.row()]
             except (IndexError, ):
                 continue
-            if x is None or y is None:
+            if y is None:
                 continue
+            x = item.data.evicted + index.row()
             curve = item.curve
             marker = curve.dataMarker.cloneFromValue(curve, x, y)
             markers.append(marker)
             marker.attach(self.plot)
+        zoomer = self.zoomer
+        if x is not None and zoomer.zoomRectIndex():
+            rect = zoomer.zoomRect()
+            if not (rect.left() <= x <= rect.right()):
+                ## moving the zoom rectangle emits 'zoomed'
+                zoomer.move(x - rect.width() / 2, rect.top())
         self.plot.replot()
 
     def on_plotSplitter_splitterMoved(self, pos, index):
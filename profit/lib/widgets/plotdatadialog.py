@@ -5,9 +5,11 @@
 # Distributed under the terms of the GNU General Public License v2
 # Author: Troy Melhase <troy@gci.net>
 
-from PyQt4.QtCore import QAbstractTableModel, QVariant, Qt, pyqtSignature
+from PyQt4.QtCore import QAbstractTableModel, QModelIndex, QVariant, Qt
+from PyQt4.QtCore import pyqtSignature
 from PyQt4.QtGui import QApplication, QBrush, QColorDialog, QDialog
-from PyQt4.QtGui import QFileDialog, QFont, QFontDialog, QListWidgetItem
+from PyQt4.QtGui import QFileDialog, QFont, QFontDialog, QHeaderView
+from PyQt4.QtGui import QListWidgetItem
 
 from profit.lib import Settings, Signals, defaults
 from profit.lib.gui import colorIcon
@@ -15,10 +17,23 @@ from profit.lib.widgets.ui_plotdatadialog import Ui_PlotDataDialog
 
 
 class CurveDataTableModel(QAbstractTableModel):
+    """ Table of the values of the checked curves of a plot.
+
+    The row count is kept here rather than computed from the series
+    for each call.  Messages for the ticker only schedule an update on
+    the shared render clock; each frame then announces the new rows
+    with a single rowsInserted signal, and the cells of existing rows
+    that received values with dataChanged, so the view keeps its
+    position and layout.  The model is reset only when the curves
+    change or a series has discarded values.
+    """
     def __init__(self, parent):
         QAbstractTableModel.__init__(self, parent)
         self.key = parent.key
         self.items = []
+        self.rows = 0
+        self.lengths = []
+        self.evicted = []
         self.itemAlign = QVariant(Qt.AlignRight|Qt.AlignVCenter)
         for item in parent.checkedItems():
             self.on_enableCurve(item, True)
@@ -56,17 +71,24 @@ class CurveDataTableModel(QAbstractTableModel):
         return QVariant()
 
     def rowCount(self, parent=None):
-        try:
-            count = max(len(item.data) for item in self.items)
-        except (ValueError, ):
-            count = 0
-        return count
+        return self.rows
+
+    def measure(self):
+        """ Reads the length and discarded value count of each series.
+
+        @return two-tuple of lists
+        """
+        lengths = [len(item.data) for item in self.items]
+        evicted = [getattr(item.data, 'evicted', 0) for item in self.items]
+        return lengths, evicted
 
     def on_enableCurve(self, item, enable):
         if enable and item not in self.items:
             self.items.append(item)
         elif not enable and item in self.items:
             self.items.remove(item)
+        self.lengths, self.evicted = self.measure()
+        self.rows = max(self.lengths or [0])
         self.reset()
 
     def on_session_TickPrice_TickSize(self, message):
@@ -76,7 +98,35 @@ class CurveDataTableModel(QAbstractTableModel):
         @return None
         """
         if message.tickerId == self.key:
-            self.emit(Signals.layoutChanged)
+            ## imported here because the plot module imports this one
+            from profit.lib.widgets.plot import renderClock
+            renderClock().request(self)
+
+    def render(self):
+        """ Announces the values added since the last frame.
+
+        Called by the render clock.
+
+        @return None
+        """
+        lengths, evicted = self.measure()
+        if evicted != self.evicted:
+            ## rows no longer hold the same values
+            self.lengths, self.evicted = lengths, evicted
+            self.rows = max(lengths or [0])
+            self.reset()
+            return
+        rows = self.rows
+        for col, (before, after) in enumerate(zip(self.lengths, lengths)):
+            if before < rows and after > before:
+                self.emit(Signals.dataChanged, self.index(before, col),
+                          self.index(min(after, rows) - 1, col))
+        self.lengths = lengths
+        count = max(lengths or [0])
+        if count > rows:
+            self.beginInsertRows(QModelIndex(), rows, count - 1)
+            self.rows = count
+            self.endInsertRows()
 
 
 class PlotDataDialog(QDialog, Ui_PlotDataDialog):
@@ -85,6 +135,8 @@ class PlotDataDialog(QDialog, Ui_PlotDataDialog):
         self.setupUi(self)
         self.model = CurveDataTableModel(parent)
         self.plotDataView.setModel(self.model)
+        ## fixed row heights, so that the view never measures rows
+        self.plotDataView.verticalHeader().setResizeMode(QHeaderView.Fixed)
         self.addAction(self.actionClose)
         self.connect(
             self.plotDataView.selectionModel(),
@@ -4,17 +4,73 @@
 # Copyright 2007 Troy Melhase <troy@gci.net>
 # Distributed under the terms of the GNU General Public License v2
 
+from collections import OrderedDict
 from time import ctime
 from PyQt4.QtCore import Qt, QAbstractTableModel, QModelIndex, QVariant
 from profit.lib import Signals
 
 
+class RowCache(object):
+    """ Least recently used cache of formatted message rows.
+
+    """
+    def __init__(self, size=4096):
+        """ Initializer.
+
+        @param size=4096 maximum number of rows kept
+        """
+        self.size = size
+        self.rows = OrderedDict()
+        self.hits = self.misses = 0
+
+    def __contains__(self, row):
+        return row in self.rows
+
+    def get(self, row):
+        """ Returns the formatted values of a row, or None if not cached.
+
+        """
+        rows = self.rows
+        try:
+            values = rows.pop(row)
+        except (KeyError, ):
+            self.misses += 1
+            return None
+        rows[row] = values
+        self.hits += 1
+        return values
+
+    def put(self, row, values):
+        """ Stores the formatted values of a row, discarding the oldest.
+
+        """
+        rows = self.rows
+        rows[row] = values
+        if len(rows) > self.size:
+            rows.popitem(last=False)
+
+    def clear(self):
+        """ Discards all rows and counts.
+
+        """
+        self.rows.clear()
+        self.hits = self.misses = 0
+
+    def hitRate(self):
+        """ Fraction of lookups found in the cache.
+
+        """
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+
 class MessagesTableModel(QAbstractTableModel):
     """ Data model for session messages.
 
     """
     columnTitles = ['Index', 'Time', 'Type', 'Fields']
     sync = True
+    cacheSize = 4096
 
     def __init__(self, session, brushes, parent=None):
         """ Constructor.
@@ -34,12 +90,14 @@ class MessagesTableModel(QAbstractTableModel):
             2 : messageName,
             3 : messageText
         }
+        self.rowCache = RowCache(self.cacheSize)
         session.registerAll(self.on_sessionMessage)
 
     def index(self, row, column, parent=QModelIndex()):
-        msg = self.messages[row]
-        idx = self.createIndex(row, column, msg)
-        return idx
+        """ Framework hook to create an index; the row is the message index.
+
+        """
+        return self.createIndex(row, column)
 
     def parent(self, index=QModelIndex()):
         return None
@@ -65,18 +123,69 @@ class MessagesTableModel(QAbstractTableModel):
         """
         if not index.isValid():
             return QVariant()
-        message = index.internalPointer()
+        row = index.row()
+        message = self.messages[row]
         if role == Qt.ForegroundRole:
             return QVariant(self.brushes[message[1].typeName])
         if role != Qt.DisplayRole:
             return QVariant()
         try:
-            val = self.dataExtractors[index.column()](index, message, self)
-            val = QVariant(val)
-        except (KeyError, ):
+            val = QVariant(self.formattedRow(row, message)[index.column()])
+        except (IndexError, ):
             val = QVariant()
         return val
 
+    def formattedRow(self, row, message=None):
+        """ Returns the display values of every column of a row.
+
+        Rows are formatted once and kept in a cache of the most
+        recently displayed rows.
+
+        @param row model row number
+        @param message=None message tuple of the row, if known
+        @return tuple of values, one per column
+        """
+        values = self.rowCache.get(row)
+        if values is None:
+            values = self.formatRow(row, message)
+        return values
+
+    def formatRow(self, row, message=None):
+        """ Formats a row and stores it in the cache.
+
+        @param row model row number
+        @param message=None message tuple of the row, if known
+        @return tuple of values, one per column
+        """
+        if message is None:
+            message = self.messages[row]
+        extractors = self.dataExtractors
+        values = tuple([extractors[col](row, message, self)
+                        for col in range(len(self.columnTitles))])
+        self.rowCache.put(row, values)
+        return values
+
+    def prefetch(self, rows):
+        """ Formats rows that are not cached, without counting misses.
+
+        @param rows sequence of model row numbers
+        @return None
+        """
+        cache, count = self.rowCache, self.messageCount
+        for row in rows:
+            if 0 <= row < count and row not in cache:
+                self.formatRow(row)
+
+    def cacheStats(self):
+        """ Row cache statistics.
+
+        @return mapping with 'size', 'rows', 'hits', 'misses' and
+        'hitRate' keys
+        """
+        cache = self.rowCache
+        return dict(size=cache.size, rows=len(cache.rows), hits=cache.hits,
+                    misses=cache.misses, hitRate=cache.hitRate())
+
     def headerData(self, section, orientation, role):
         """ Framework hook to determine header data.
 
@@ -125,20 +234,20 @@ class MessagesTableModel(QAbstractTableModel):
         return self.messages[idx]
 
 
-def messageRow(index, mtuple, model):
-    """ Extracts the row number from an index and its message.
+def messageRow(row, mtuple, model):
+    """ Extracts the row number of a message.
 
-    @param index QModelIndex instance
+    @param row model row number, the index of the message in the session
     @param mtuple two-tuple of (message time, message object)
     @return row number as integer
     """
-    return model.messages.index(mtuple)
+    return row
 
 
-def messageTime(index, (mtime, message), model):
-    """ Extracts the message time from an index and its message.
+def messageTime(row, (mtime, message), model):
+    """ Extracts the message time from a row and its message.
 
-    @param index QModelIndex instance
+    @param row model row number
     @param mtime message time as float
     @param message message instance
     @return mtime formatted with ctime call
@@ -146,10 +255,10 @@ def messageTime(index, (mtime, message), model):
     return ctime(mtime)
 
 
-def messageName(index, (mtime, message), model):
-    """ Extracts the type name from an index and its message.
+def messageName(row, (mtime, message), model):
+    """ Extracts the type name from a row and its message.
 
-    @param index QModelIndex instance
+    @param row model row number
     @param mtime message time as float
     @param message message instance
     @return type name of message as string
@@ -157,10 +266,10 @@ def messageName(index, (mtime, message), model):
     return message.typeName
 
 
-def messageText(index, (mtime, message), model):
-    """ Extracts the items from an index and its message.
+def messageText(row, (mtime, message), model):
+    """ Extracts the items from a row and its message.
 
-    @param index QModelIndex instance
+    @param row model row number
     @param mtime message time as float
     @param message message instance
     @return message string formatted with message key=value pairs
@@ -15,3 +15,15 @@ try:
     from profit.series.advanced import *
 except (ImportError, ):
     pass
+
+
+def indexTypes():
+    """ Creates mapping of index class names to index types.
+
+    @return index class name to index class mapping.
+    """
+    def isIndexType(obj):
+        return hasattr(obj, 'params')
+    namespace = globals()
+    items = [(k, namespace[k]) for k in namespace]
+    return dict([(k, v) for k, v in items if isIndexType(v)])
@@ -5,12 +5,52 @@
 # Distributed under the terms of the GNU General Public License v2
 # Author: Troy Melhase <troy@gci.net>
 
+from collections import deque
+
 from numpy import arctan, array, log, mean, std, median
+from numpy.lib.stride_tricks import as_strided
 from scipy.stats import linregress, mode
 
 from profit.series.basic import SeriesIndex, MovingAverageIndex
 
 
+def rollingWindows(series, start, periods):
+    """ Creates a view of each full window of series values from start.
+
+    @param series Series instance
+    @param start position of the first value to index
+    @param periods window length
+    @return two-tuple of (count of leading positions without a full
+    window, two-dimensional array view or None if the values are not
+    all numeric)
+    """
+    end = len(series)
+    leading = max(min(periods-1, end) - start, 0)
+    first = start + leading
+    if first >= end:
+        return leading, None
+    values = series[first-periods+1:end]
+    try:
+        if None in values:
+            raise TypeError
+        values = array(values, dtype=float)
+    except (TypeError, ValueError, ):
+        return leading, None
+    step = values.strides[0]
+    shape = (len(values)-periods+1, periods)
+    return leading, as_strided(values, shape=shape, strides=(step, step))
+
+
+class FisherTransformState(object):
+    """ Recursive state of a FisherTransform index.
+
+    """
+    __slots__ = ('inter', 'fish', )
+
+    def __init__(self):
+        self.inter = self.fish = None
+
+
 class FisherTransform(MovingAverageIndex):
     """ FisherTransform
 
@@ -22,32 +62,50 @@ class FisherTransform(MovingAverageIndex):
 
     def __init__(self, series, periods):
         MovingAverageIndex.__init__(self, series, periods)
-        self.inter = []
+        self.state = FisherTransformState()
 
     def reindex(self):
         periods = self.periods
         period = self.series[-periods:]
+        state = self.state
         current = period[-1]
         mx = max(period)
         mn = min(period)
         try:
-            inter = 0.33 * 2 * ((current - mn) / (mx - mn) - 0.5) + (0.67 * self.inter[-1])
+            inter = 0.33 * 2 * ((current - mn) / (mx - mn) - 0.5) + (0.67 * state.inter)
             if inter > 0.99:
                 inter = 0.99
             elif inter < -0.99:
                 inter = -0.99
-            fish = 0.5 * log((1 + inter) / (1 - inter)) + (0.5 * self[-1])
+            fish = 0.5 * log((1 + inter) / (1 - inter)) + (0.5 * state.fish)
         except (TypeError, IndexError, ZeroDivisionError, ):
             inter = 0
             fish = 0
-        self.inter.append(inter)
+        state.inter = inter
+        state.fish = fish
         self.append(fish)
 
 
+class MAMAState(object):
+    """ Recursive state of a MAMA index.
+
+    Each field holds only as many past values as the recurrence reads.
+    """
+    lags = dict(sms=7, dts=7, q1=7, i1=7, q2=2, i2=2, re=1, im=1,
+                prs=2, sps=1, phs=2)
+    __slots__ = tuple(sorted(lags)) + ('mama', )
+
+    def __init__(self):
+        for name, size in self.lags.items():
+            setattr(self, name, deque([], size))
+        self.mama = None
+
+
 class MAMA(MovingAverageIndex):
     """ Mother of Adaptave Moving Averages.
 
     """
+    version = 2
     fast_limit = 0.5
     slow_limit = 0.05
     params = [
@@ -57,15 +115,14 @@ class MAMA(MovingAverageIndex):
 
     def __init__(self, series, periods):
         MovingAverageIndex.__init__(self, series, periods)
-        self.hist = {'q1':[], 'i1':[], 'q2':[], 'i2':[], 're':[], 'im':[],
-                     'sms':[], 'dts':[], 'prs':[], 'sps':[], 'phs':[], }
+        self.state = MAMAState()
 
     def reindex(self):
-        hist = self.hist
+        state = self.state
         sms, dts, prs, sps, phs = \
-            hist['sms'], hist['dts'], hist['prs'], hist['sps'], hist['phs']
+            state.sms, state.dts, state.prs, state.sps, state.phs
         q1, i1, q2, i2, re, im = \
-            hist['q1'], hist['i1'], hist['q2'], hist['i2'], hist['re'], hist['im']
+            state.q1, state.i1, state.q2, state.i2, state.re, state.im
         series = self.series
         periods = self.periods
         if len(series) > periods:
@@ -96,7 +153,7 @@ class MAMA(MovingAverageIndex):
             else:
                 pra = 0
             if pra > 1.5*prs[-1]: pra = 1.5*prs[-1]
-            if pra < 0.67*prs[-1]: prs = 0.67*prs[-1]
+            if pra < 0.67*prs[-1]: pra = 0.67*prs[-1]
             if pra < 6: pra = 6
             if pra > 50: pra = 50
             pra = 0.2*pra + 0.8*prs[-1]
@@ -112,13 +169,14 @@ class MAMA(MovingAverageIndex):
             if dp < 1: dp = 1
             alpha = self.fast_limit / dp
             if alpha < self.slow_limit: alpha = self.slow_limit
-            mama = alpha*series[-1] + (1 - alpha)*self[-1]
+            state.mama = mama = alpha*series[-1] + (1 - alpha)*state.mama
             #FAMA = .5*alpha*MAMA + (1 - .5*alpha)*FAMA[1];
             self.append(mama)
         else:
             last = series[-1]
-            for vlst in hist.values():
-                vlst.append(last)
+            for name in state.lags:
+                getattr(state, name).append(last)
+            state.mama = last
             self.append(last)
 
 
@@ -142,6 +200,34 @@ class SMA(MovingAverageIndex):
                 pass
         self.append(sma)
 
+    def reindexBatch(self, start):
+        series = self.series
+        periods = self.periods
+        leading, windows = rollingWindows(series, start, periods)
+        values = [None] * leading
+        if windows is not None:
+            values.extend(windows.mean(axis=1))
+        else:
+            for i in xrange(start+leading, len(series)):
+                sma = None
+                try:
+                    sma = mean(series[i+1-periods:i+1])
+                except (TypeError, IndexError):
+                    pass
+                values.append(sma)
+        self.extend(values)
+
+
+class EMAState(object):
+    """ Recursive state of an EMA index.
+
+    """
+    __slots__ = ('ema', 'ready', )
+
+    def __init__(self):
+        self.ema = None
+        self.ready = False
+
 
 class EMA(MovingAverageIndex):
     """ Exponential Moving Average index.
@@ -156,13 +242,15 @@ class EMA(MovingAverageIndex):
     def __init__(self, series, periods, k=2.0):
         MovingAverageIndex.__init__(self, series, periods)
         self.k = k
+        self.state = EMAState()
 
     def reindex(self):
-        try:
-            last = self[-1]
-        except (IndexError, ):
+        state = self.state
+        if not state.ready:
+            state.ready = True
             self.append(None)
             return
+        last = state.ema
         periods = self.periods
         ema = None
         if last is None:
@@ -176,8 +264,36 @@ class EMA(MovingAverageIndex):
             pt = self.series[-1]
             k = self.k / (periods + 1)
             ema = last + (k * (pt - last))
+        state.ema = ema
         self.append(ema)
 
+    def reindexBatch(self, start):
+        series = self.series
+        periods = self.periods
+        state = self.state
+        k = self.k / (periods + 1)
+        last = state.ema
+        values = []
+        for i in xrange(start, len(series)):
+            if not state.ready:
+                state.ready = True
+                values.append(None)
+                continue
+            ema = None
+            if last is None:
+                try:
+                    period = series[max(i+1-periods, 0):i+1]
+                    if len(period) == periods:
+                        ema = mean(period)
+                except (TypeError, ):
+                    pass
+            else:
+                ema = last + (k * (series[i] - last))
+            values.append(ema)
+            last = ema
+        state.ema = last
+        self.extend(values)
+
 
 class WMA(MovingAverageIndex):
     """ Weighted Moving Average index.
@@ -205,6 +321,30 @@ class WMA(MovingAverageIndex):
                 pass
         self.append(wma)
 
+    def reindexBatch(self, start):
+        series = self.series
+        periods = self.periods
+        weights = self.weights
+        leading, windows = rollingWindows(series, start, periods)
+        values = [None] * leading
+        if windows is not None:
+            ## sum column by column to match the order of the builtin
+            ## sum used by reindex
+            products = windows * weights
+            total = products[:, 0].copy()
+            for column in xrange(1, periods):
+                total += products[:, column]
+            values.extend(total)
+        else:
+            for i in xrange(start+leading, len(series)):
+                wma = None
+                try:
+                    wma = sum(series[i+1-periods:i+1] * weights)
+                except (TypeError, ):
+                    pass
+                values.append(wma)
+        self.extend(values)
+
 
 class Volatility(MovingAverageIndex):
     """ Volatility index.
@@ -229,6 +369,25 @@ class Volatility(MovingAverageIndex):
                 pass
         self.append(vol)
 
+    def reindexBatch(self, start):
+        series = self.series
+        periods = self.periods
+        leading, windows = rollingWindows(series, start, periods)
+        values = [None] * leading
+        if windows is not None:
+            values.extend(windows.std(axis=1) / windows.mean(axis=1) * 100)
+        else:
+            for i in xrange(start+leading, len(series)):
+                vol = None
+                period = series[i+1-periods:i+1]
+                try:
+                    vol = std(period) / mean(period)
+                    vol *= 100
+                except TypeError:
+                    pass
+                values.append(vol)
+        self.extend(values)
+
 
 class VerticalHorizontalFilter(MovingAverageIndex):
     """ VerticalHorizontalFilter
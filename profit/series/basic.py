@@ -5,35 +5,163 @@
 # Distributed under the terms of the GNU General Public License v2
 # Author: Troy Melhase <troy@gci.net>
 
+from array import array as valueArray
+from bisect import bisect_left
+from collections import deque
 from time import time
 
+try:
+    from numpy import array
+    from numpy.lib.stride_tricks import as_strided
+except (ImportError, ):
+    array = as_strided = None
+
 
 class Series(list):
     """ Series objects are lists that maintain indexes.
 
+    A series may be attached to a scheduler (see
+    profit.series.graph.IndexGraph); when it is, the scheduler
+    updates the indexes instead of the series itself.
+
+    A series created with a capacity keeps at least that many of its
+    most recent values and discards older ones.  Values are discarded
+    in blocks of 'capacity' once twice that many are held, so appends
+    stay constant time on average and recent values remain a plain
+    list for negative indexing and slicing.  The 'evicted' attribute
+    counts the discarded values; 'x' holds absolute positions.
+
+    A series created with a typecode ('d' for double precision, 'f'
+    for single) keeps its 'x' and 'y' values in typed arrays instead
+    of lists, which takes less than half the memory.  Indexes read the
+    series values themselves, so they compute at full precision either
+    way; only the stored 'y' values are rounded.
+
+    Indexes take the capacity and typecode of the series they are
+    created with.
     """
-    def __init__(self):
+    scheduler = None
+    capacity = None
+    typecode = None
+    evicted = 0
+
+    def __init__(self, capacity=None, typecode=None):
         list.__init__(self)
         self.indexes = []
-        self.x = []
-        self.y = []
+        if typecode:
+            self.typecode = typecode
+            self.x = valueArray('l')
+            self.y = valueArray(typecode)
+        else:
+            self.x = []
+            self.y = []
+        if capacity:
+            self.capacity = capacity
 
     def append(self, value):
         """ append value to this series and update its indexes
 
         """
+        if self.capacity and len(self) >= 2*self.capacity:
+            self.evict()
         list.append(self, value)
         if value is not None:
-            self.x.append(len(self)-1)
+            self.x.append(self.evicted + len(self) - 1)
             self.y.append(value)
-        for index in self.indexes:
-            index.reindex()
+        scheduler = self.scheduler
+        if scheduler is None:
+            for index in self.indexes:
+                index.reindex()
+        else:
+            scheduler.update(self)
+
+    def extend(self, values):
+        """ append each value to this series and update its indexes
+
+        When every index provides a 'reindexBatch' method, the values
+        are stored in one step and each index is updated once for the
+        entire block.  Otherwise the values are appended one at a
+        time, exactly as with repeated calls to append.  Either way, a
+        series with a capacity is held to the same bound as by append,
+        once its indexes have been updated.
+        """
+        values = list(values)
+        if not values:
+            return
+        scheduler = self.scheduler
+        if scheduler is not None:
+            scheduler.extend(self, values)
+            return
+        indexes = self.indexes
+        if not all(hasattr(index, 'reindexBatch') for index in indexes):
+            for value in values:
+                self.append(value)
+            return
+        start = self.store(values)
+        for index in indexes:
+            index.reindexBatch(start)
+        if self.capacity and len(self) >= 2*self.capacity:
+            self.evict()
+
+    def store(self, values):
+        """ append values to this series without updating its indexes
+
+        @param values sequence of values
+        @return position of the first stored value
+        """
+        if self.capacity and len(self) >= 2*self.capacity:
+            self.evict()
+        start = len(self)
+        list.extend(self, values)
+        x, y = self.x, self.y
+        first = self.evicted + start
+        for offset, value in enumerate(values):
+            if value is not None:
+                x.append(first + offset)
+                y.append(value)
+        return start
+
+    def evict(self):
+        """ discard values beyond the capacity of this series
+
+        A scheduler may postpone the call to 'trim' until it has
+        finished updating indexes.
+
+        @return None
+        """
+        if self.scheduler is None:
+            self.trim()
+        else:
+            self.scheduler.evict(self)
+
+    def trim(self):
+        """ discard values beyond the capacity of this series now
+
+        Lazy indexes are brought up to date first, while the values
+        they still need are available.
+
+        @return count of discarded values
+        """
+        count = len(self) - self.capacity
+        if count <= 0:
+            return 0
+        if self.scheduler is not None:
+            self.scheduler.flush(self)
+        del self[:count]
+        self.evicted += count
+        x = self.x
+        pos = bisect_left(x, self.evicted)
+        del x[:pos]
+        del self.y[:pos]
+        return count
 
     def addIndex(self, key, func, *args, **kwds):
         indexes = self.indexes
         keys = [i.key for i in indexes]
         if key in keys:
             index = [i for i in indexes if i.key==key][0]
+        elif self.scheduler is not None:
+            index = self.scheduler.addIndex(self, key, func, *args, **kwds)
         else:
             index = func(*args, **kwds)
             index.key = key
@@ -44,15 +172,107 @@ class Series(list):
 class BaseIndex(Series):
     """ Base class for index types.
 
+    Indexes scheduled by an IndexGraph may be evaluated lazily.  The
+    graph counts the series values an index has not yet processed in
+    'pending', and the index catches up in one batch the next time
+    it is read.  Set 'eager' to True to have an index computed on
+    every update instead.
+
+    Only lazy indexes check for pending values when read: the graph
+    changes their class to one made by lazyIndexType.  Other indexes
+    are read as plain lists.
+
+    Increase 'version' in a subclass whenever a change alters the
+    values it computes; cached values of other versions are then
+    ignored (see profit.series.cache).
+    """
+    eager = False
+    pending = 0
+    version = 1
+
+    def refresh(self):
+        """ bring this index up to date with its series
+
+        """
+        if self.pending:
+            self.scheduler.refresh(self)
+
+
+class LazyReads(object):
+    """ Read methods of lazy indexes; each catches up first.
+
+    """
+    def __getitem__(self, key):
+        if self.pending:
+            self.scheduler.refresh(self)
+        return list.__getitem__(self, key)
+
+    def __getslice__(self, i, j):
+        if self.pending:
+            self.scheduler.refresh(self)
+        return list.__getslice__(self, i, j)
+
+    def __iter__(self):
+        if self.pending:
+            self.scheduler.refresh(self)
+        return list.__iter__(self)
+
+    def __len__(self):
+        if self.pending:
+            self.scheduler.refresh(self)
+        return list.__len__(self)
+
+    def xGetter(self):
+        if self.pending:
+            self.scheduler.refresh(self)
+        return self.__dict__['x']
+
+    def xSetter(self, value):
+        self.__dict__['x'] = value
+
+    x = property(xGetter, xSetter)
+
+    def yGetter(self):
+        if self.pending:
+            self.scheduler.refresh(self)
+        return self.__dict__['y']
+
+    def ySetter(self, value):
+        self.__dict__['y'] = value
+
+    y = property(yGetter, ySetter)
+
+
+def lazyIndexType(cls, types={}):
+    """ Returns the lazy variant of an index class.
+
+    @param cls index class
+    @param types={} mapping of index classes to their lazy variants
+    @return subclass of cls with the read methods of LazyReads
     """
+    if issubclass(cls, LazyReads):
+        return cls
+    try:
+        return types[cls]
+    except (KeyError, ):
+        lazy = types[cls] = type(cls.__name__, (LazyReads, cls),
+                                 {'__module__':cls.__module__})
+        return lazy
 
 
 class SeriesIndex(BaseIndex):
     """ Base class for series indexes.
 
+    Subclasses implement 'reindex' to append one value for the most
+    recent series value.  Subclasses may also implement
+    'reindexBatch(start)' to append values for every series value
+    from position start onward in one call; Series.extend uses it
+    when available, and its results must match repeated calls to
+    'reindex' (to rounding, for indexes that keep running sums).
     """
     def __init__(self, series):
-        BaseIndex.__init__(self)
+        BaseIndex.__init__(self, getattr(series, 'capacity', None),
+                           getattr(series, 'typecode', None))
         self.series = series
 
 
@@ -62,6 +282,9 @@ class MovingAverageIndex(SeriesIndex):
     """
     def __init__(self, series, periods):
         SeriesIndex.__init__(self, series)
+        if self.capacity and periods >= self.capacity:
+            raise ValueError('Series capacity %s too small for %s periods' %
+                             (self.capacity, periods))
         self.periods = periods
         self.periods_range = range(periods)
 
@@ -93,6 +316,16 @@ class CenterOfGravity(MovingAverageIndex):
         self.append(cg)
 
 
+class SmoothedRSIState(object):
+    """ Recursive state of a SmoothedRSI index.
+
+    """
+    __slots__ = ('smooth', )
+
+    def __init__(self, periods):
+        self.smooth = deque([], periods)
+
+
 class SmoothedRSI(MovingAverageIndex):
     """ Smoothed relative strength index.
 
@@ -104,12 +337,12 @@ class SmoothedRSI(MovingAverageIndex):
 
     def __init__(self, series, periods):
         MovingAverageIndex.__init__(self, series, periods)
-        self.smooth = []
+        self.state = SmoothedRSIState(periods)
 
     def reindex(self):
         periods = self.periods
         period = self.series[-periods:]
-        smooth = self.smooth
+        smooth = self.state.smooth
 
         try:
             s = (period[-1] + 2*period[-2] + 2*period[-3] + period[-4]) / 6.0
@@ -139,6 +372,17 @@ class SmoothedRSI(MovingAverageIndex):
         self.append(srsi)
 
 
+class KAMAState(object):
+    """ Recursive state of a KAMA index.
+
+    """
+    __slots__ = ('kama', 'diffs', )
+
+    def __init__(self, periods):
+        self.kama = None
+        self.diffs = deque([], periods)
+
+
 class KAMA(MovingAverageIndex):
     """ Kaufmann Adaptive Moving Average index.
 
@@ -155,37 +399,112 @@ class KAMA(MovingAverageIndex):
         self.fastest = 2.0 / (fast_look+1)
         self.slowest = 2.0 / (slow_look+1)
         self.efficiency_factor = (self.fastest - self.slowest) + self.slowest ## er?
+        self.state = KAMAState(periods)
+
+    def noise(self, i):
+        """ sum of absolute changes over the window ending at position i
+
+        The state holds the latest change already; it is rebuilt from
+        the series when the index was created after the series began.
+
+        @param i series position
+        @return noise value
+        """
+        series = self.series
+        periods = self.periods
+        if i < periods:
+            p1 = series[0:i+1]
+            return sum([abs(a-b) for a, b in zip(p1, p1[:-1])])
+        diffs = self.state.diffs
+        if len(diffs) < periods:
+            p1 = series[i+1-periods:i+1]
+            p2 = series[i-periods:i]
+            diffs.extend([abs(a-b) for a, b in zip(p1, p2)])
+        return sum(diffs)
 
     def reindex(self):
         " kama = S * price + (1 - S) * kama[-1] "
         series = self.series
-        periods = self.periods
+        state = self.state
         last = series[-1]
         try:
             prev = series[-2]
         except (IndexError, ):
+            state.kama = last
             self.append(last)
             return
-        noise = 0
+        state.diffs.append(abs(last - prev))
         eff = 1
-        try:
-            p1 = series[-periods:]
-            p2 = series[-periods-1:-1]
-            noise = sum([abs(a-b) for a, b in zip(p1, p2)])
-        except (IndexError, ):
-            pass
+        noise = self.noise(len(series)-1)
         if noise:
             eff = abs(last - prev) / noise
         s = eff * self.efficiency_factor
         s = s * s
-        kama = s*last + (1-s)*self[-1]
+        state.kama = kama = s*last + (1-s)*state.kama
         self.append(kama)
 
+    def reindexBatch(self, start):
+        series = self.series
+        state = self.state
+        diffs = state.diffs
+        factor = self.efficiency_factor
+        kama = state.kama
+        values = []
+        for i in xrange(start, len(series)):
+            last = series[i]
+            if i == 0:
+                values.append(last)
+                kama = last
+                continue
+            prev = series[i-1]
+            diffs.append(abs(last - prev))
+            eff = 1
+            noise = self.noise(i)
+            if noise:
+                eff = abs(last - prev) / noise
+            s = eff * factor
+            s = s * s
+            kama = s*last + (1-s)*kama
+            values.append(kama)
+        state.kama = kama
+        self.extend(values)
+
+
+class DistanceCoefficientState(object):
+    """ Sliding window state of a DistanceCoefficient index.
+
+    Sums are kept relative to 'center', a recent price, and are
+    recomputed from the windows every 'periods' values to bound
+    rounding error.
+    """
+    __slots__ = ('prices', 'dists', 'center', 'sum1', 'sum2', 'num', 'den',
+                 'count', )
+
+    def __init__(self, periods):
+        self.prices = deque([], periods)
+        self.dists = deque([], periods)
+        self.center = None
+        self.sum1 = self.sum2 = self.num = self.den = 0.0
+        self.count = 0
+
 
 class DistanceCoefficient(MovingAverageIndex):
     """ Distance Coefficient index.
 
+    Ehlers' distance coefficient filter:  each price is weighted by
+    the sum of its squared distances to the 'periods'-1 prices before
+    it, and the filter is the weighted average of the last 'periods'
+    prices.  The index is None until 2*'periods'-1 prices are seen,
+    and zero when every weight is zero.
+
+    Values differ from those of earlier releases, which returned the
+    price 'periods'-1 bars back once their window was full (see
+    PreviousDistanceCoefficient in profit.series.reference).  Sums are
+    kept relative to a recent price and recomputed from the window
+    every 'periods' values, so values match a direct computation to
+    rounding only.
     """
+    version = 2
     params = [
         ('series', dict(type='line')),
         ('periods', dict(type='int', min=1)),
@@ -193,30 +512,153 @@ class DistanceCoefficient(MovingAverageIndex):
 
     def __init__(self, series, periods):
         MovingAverageIndex.__init__(self, series, periods)
+        if self.capacity and 2*periods-1 > self.capacity:
+            raise ValueError('Series capacity %s too small for %s periods' %
+                             (self.capacity, periods))
+        self.state = DistanceCoefficientState(periods)
 
-    def reindex(self):
-        series = self.series
+    def distance(self, values):
+        """ sum of squared distances from the last value to the others
+
+        @param values sequence of prices
+        @return distance sum
+        """
+        last = values[-1]
+        return sum([(last-v)*(last-v) for v in values[:-1]], 0.0)
+
+    def resync(self):
+        """ recompute the sliding sums of the state from its windows
+
+        @return None
+        """
+        state = self.state
+        prices = list(state.prices)
+        center = state.center = float(prices[-1])
+        lags = [v-center for v in prices[len(prices)+1-self.periods:]]
+        state.sum1 = sum(lags, 0.0)
+        state.sum2 = sum([v*v for v in lags], 0.0)
+        pairs = [(d, p) for d, p in zip(state.dists, prices) if d is not None]
+        state.num = sum([d*p for d, p in pairs], 0.0)
+        state.den = sum([d for d, p in pairs], 0.0)
+        state.count = 0
+
+    def update(self, value):
+        """ slide the window of the state over one new price
+
+        @param value new price
+        @return filter value or None
+        """
         periods = self.periods
-        period = self.series[-periods:]
-        dists = [0, ] * periods
-        coeff = [0, ] * periods
+        state = self.state
+        prices, dists = state.prices, state.dists
+        if not prices:
+            state.center = float(value)
+        lag = value - state.center
+        seen = len(prices)
+        if seen >= periods-1:
+            dist = (periods-1)*lag*lag - 2*lag*state.sum1 + state.sum2
+            dist = max(dist, 0.0)
+        else:
+            dist = None
+        if periods > 1:
+            state.sum1 += lag
+            state.sum2 += lag*lag
+            if seen >= periods-1:
+                old = prices[seen+1-periods] - state.center
+                state.sum1 -= old
+                state.sum2 -= old*old
+        if seen == periods and dists[0] is not None:
+            state.num -= dists[0]*prices[0]
+            state.den -= dists[0]
+        prices.append(value)
+        dists.append(dist)
+        if dist is not None:
+            state.num += dist*value
+            state.den += dist
+        state.count += 1
+        if state.count >= periods:
+            self.resync()
+        if len(dists) < periods or dists[0] is None:
+            return None
+        if state.den:
+            return state.num / state.den
+        return 0
+
+    def reindex(self):
         try:
-            for i in range(-1, -periods, -1):
-                for k in range(-2, -periods, -1):
-                    dists[i] = dists[i] + (series[i] - series[i+k]) * (series[i] - series[i+k])
-                coeff[i] = dists[i]
-            num = sumcoeff = 0
-            for k in range(periods):
-                num += coeff[i]*period[i]
-                sumcoeff += coeff[i]
-            if sumcoeff:
-                filt = num / sumcoeff
-            else:
-                filt = 0
-        except (IndexError, ):
+            filt = self.update(self.series[-1])
+        except (TypeError, ):
+            self.state = DistanceCoefficientState(self.periods)
             filt = None
         self.append(filt)
 
+    def reindexBatch(self, start):
+        series = self.series
+        periods = self.periods
+        end = len(series)
+        first = max(start+2-2*periods, 0)
+        values = series[first:end]
+        try:
+            if None in values:
+                raise TypeError
+            values = array(values, dtype=float)
+        except (TypeError, ValueError, ):
+            values = None
+        if values is None or len(values) < 2*periods-1:
+            for i in xrange(start, end):
+                try:
+                    filt = self.update(series[i])
+                except (TypeError, ):
+                    self.state = DistanceCoefficientState(periods)
+                    filt = None
+                self.append(filt)
+            return
+        step = values.strides[0]
+        count = len(values)+1-periods
+        windows = as_strided(values, shape=(count, periods),
+                             strides=(step, step))
+        dists = ((windows[:, :-1] - windows[:, -1:]) ** 2).sum(axis=1)
+        prices = values[periods-1:]
+        count = len(dists)+1-periods
+        shape, strides = (count, periods), (step, step)
+        wdists = as_strided(dists, shape=shape, strides=strides)
+        wprices = as_strided(prices, shape=shape, strides=strides)
+        nums = (wdists * wprices).sum(axis=1)
+        dens = wdists.sum(axis=1)
+        filts = [float(n/d) if d else 0 for n, d in zip(nums, dens)]
+        leading = max(2*periods-2 - (start-first), 0)
+        filts = [None] * leading + filts[len(filts)-(end-start-leading):]
+        state = self.state = DistanceCoefficientState(periods)
+        tail = series[end+1-2*periods:end]
+        state.prices.extend(tail[-periods:])
+        state.dists.extend([self.distance(tail[i+1-periods:i+1])
+                            for i in range(periods-1, len(tail))])
+        self.resync()
+        self.extend(filts)
+
+
+def signalValues(index, start):
+    """ Signal values to pair with the series values of an index.
+
+    A signal computed from the series of the index (directly or through
+    other indexes) has one value for each series value.  Any other
+    signal does not change while the series is extended, so each new
+    series value pairs with its last value, as with repeated calls to
+    'reindex'.
+
+    @param index index instance with 'series' and 'signal' attributes
+    @param start position of the first series value to pair
+    @return list of signal values, one for each series value from start
+    """
+    series, signal = index.series, index.signal
+    count = len(series) - start
+    line = signal
+    while line is not None and line is not series:
+        line = getattr(line, 'series', None)
+    if line is series:
+        return signal[-count:]
+    return [signal[-1]] * count
+
 
 class Convergence(SeriesIndex):
     """ Convergence Line index.
@@ -237,6 +679,15 @@ class Convergence(SeriesIndex):
         except (TypeError, ):
             self.append(None)
 
+    def reindexBatch(self, start):
+        values = []
+        for a, b in zip(signalValues(self, start), self.series[start:]):
+            try:
+                values.append(a - b)
+            except (TypeError, ):
+                values.append(None)
+        self.extend(values)
+
 
 class PercentConvergence(SeriesIndex):
     """ Index of convergence as a percentage.
@@ -257,6 +708,15 @@ class PercentConvergence(SeriesIndex):
         except (TypeError, ZeroDivisionError, ):
             self.append(None)
 
+    def reindexBatch(self, start):
+        values = []
+        for a, b in zip(signalValues(self, start), self.series[start:]):
+            try:
+                values.append((1 - a / b) * 100)
+            except (TypeError, ZeroDivisionError, ):
+                values.append(None)
+        self.extend(values)
+
 
 class MACDHistogram(SeriesIndex):
     """ Tracks difference between line and its signal.
@@ -277,6 +737,15 @@ class MACDHistogram(SeriesIndex):
         except (TypeError, ):
             self.append(None)
 
+    def reindexBatch(self, start):
+        values = []
+        for a, b in zip(self.series[start:], signalValues(self, start)):
+            try:
+                values.append(a - b)
+            except (TypeError, ):
+                values.append(None)
+        self.extend(values)
+
 
 class DetrendedPriceOscillator(SeriesIndex):
     """ Detrended price oscillator index.
@@ -289,7 +758,8 @@ class DetrendedPriceOscillator(SeriesIndex):
     ]
 
     def __init__(self, series, moving_average):
-        self.series, self.moving_average = series, moving_average
+        SeriesIndex.__init__(self, series)
+        self.moving_average = moving_average
 
     def reindex(self):
         last = self.series[-1]
@@ -315,6 +785,21 @@ class Trix(SeriesIndex):
             trix = None
         self.append(trix)
 
+    def reindexBatch(self, start):
+        series = self.series
+        values = []
+        for i in xrange(start, len(series)):
+            try:
+                if i < 1:
+                    raise IndexError(i)
+                current, previous = series[i], series[i-1]
+                trix = (current - previous) / previous
+                trix *= 100
+            except (TypeError, IndexError):
+                trix = None
+            values.append(trix)
+        self.extend(values)
+
 
 class Momentum(SeriesIndex):
     """ Momentum index.
@@ -337,6 +822,21 @@ class Momentum(SeriesIndex):
             momentum = None
         self.append(momentum)
 
+    def reindexBatch(self, start):
+        series = self.series
+        lookback = self.lookback
+        values = []
+        for i in xrange(start, len(series)):
+            try:
+                if i+1 < lookback:
+                    raise IndexError(i)
+                last, prev = series[i], series[i+1-lookback]
+                momentum = last - prev
+            except (IndexError, TypeError):
+                momentum = None
+            values.append(momentum)
+        self.extend(values)
+
 
 class RateOfChange(SeriesIndex):
     """ Rate of change index.
@@ -361,6 +861,23 @@ class RateOfChange(SeriesIndex):
             rate = None
         self.append(rate)
 
+    def reindexBatch(self, start):
+        series = self.series
+        lookback = self.lookback
+        values = []
+        for i in xrange(start, len(series)):
+            try:
+                if i+1 < lookback:
+                    raise IndexError(i)
+                last, prev = series[i], series[i+1-lookback]
+                momentum = last - prev
+                rate = momentum / (prev*100)
+                rate *= 100
+            except (IndexError, TypeError, ZeroDivisionError):
+                rate = None
+            values.append(rate)
+        self.extend(values)
+
 
 class Stochastic(MovingAverageIndex):
     """ Stochastic
@@ -449,7 +966,7 @@ class DelayFilter(SeriesIndex):
     ]
 
     def __init__(self, series, lookback):
-        self.series = series
+        SeriesIndex.__init__(self, series)
         self.lookback = lookback
 
     def reindex(self):
@@ -491,6 +1008,19 @@ class ChangeIndex(SeriesIndex):
             change = None
         self.append(change)
 
+    def reindexBatch(self, start):
+        series = self.series
+        values = []
+        for i in xrange(start, len(series)):
+            try:
+                if i < 1:
+                    raise IndexError(i)
+                change = series[i] - series[i-1]
+            except (TypeError, IndexError):
+                change = None
+            values.append(change)
+        self.extend(values)
+
 
 class IndexIndex(SeriesIndex):
     """ Index that maintains the current series length.
@@ -508,6 +1038,12 @@ class IndexIndex(SeriesIndex):
         self.append(self.idx)
         self.idx += 1
 
+    def reindexBatch(self, start):
+        idx = self.idx
+        count = len(self.series) - start
+        self.idx += count
+        self.extend(xrange(idx, idx+count))
+
 
 class LevelIndex(SeriesIndex):
     """ Constant level indexing.
@@ -525,6 +1061,9 @@ class LevelIndex(SeriesIndex):
     def reindex(self):
         self.append(self.level)
 
+    def reindexBatch(self, start):
+        self.extend([self.level] * (len(self.series) - start))
+
 
 class OffsetIndex(SeriesIndex):
     params = [
@@ -544,6 +1083,17 @@ class OffsetIndex(SeriesIndex):
             offset = None
         self.append(offset)
 
+    def reindexBatch(self, start):
+        factor = self.offset
+        values = []
+        for last in self.series[start:]:
+            try:
+                offset = last + (factor * last)
+            except TypeError:
+                offset = None
+            values.append(offset)
+        self.extend(values)
+
 
 class Slope(SeriesIndex):
     """ Slope values as an index.
@@ -561,6 +1111,19 @@ class Slope(SeriesIndex):
             slope = None
         self.append(slope)
 
+    def reindexBatch(self, start):
+        series = self.series
+        values = []
+        for i in xrange(start, len(series)):
+            try:
+                if i < 1:
+                    raise IndexError(i)
+                slope = series[i] - series[i-1]
+            except (IndexError, TypeError):
+                slope = None
+            values.append(slope)
+        self.extend(values)
+
 
 class DifferenceIndex(SeriesIndex):
     """
@@ -582,6 +1145,17 @@ class DifferenceIndex(SeriesIndex):
             diff = None
         self.append(diff)
 
+    def reindexBatch(self, start):
+        count = len(self.series) - start
+        values = []
+        for a, b in zip(self.series[start:], self.other[-count:]):
+            try:
+                diff = a - b
+            except:
+                diff = None
+            values.append(diff)
+        self.extend(values)
+
 
 # Unfinished Indexes
 
@@ -631,7 +1205,7 @@ class LoPassFilter(SeriesIndex):
     ]
 
     def __init__(self, series, cutoff):
-        self.series = series
+        SeriesIndex.__init__(self, series)
         self.cutoff = cutoff
 
     def reindex(self):
@@ -648,7 +1222,7 @@ class HiPassFilter(SeriesIndex):
     ]
 
     def __init__(self, series, cutoff):
-        self.series = series
+        SeriesIndex.__init__(self, series)
         self.cutoff = cutoff
 
     def reindex(self):
@@ -666,7 +1240,7 @@ class BandPassFilter(SeriesIndex):
     ]
 
     def __init__(self, series, hi, low):
-        self.series = series
+        SeriesIndex.__init__(self, series)
         self.hi = hi
         self.low = low
 
@@ -0,0 +1,563 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2007 Troy Melhase
+# Distributed under the terms of the GNU General Public License v2
+# Author: Troy Melhase <troy@gci.net>
+
+##
+#
+# This module measures the throughput and memory use of the index
+# types in profit.series.
+#
+# Each index type is attached alone to a fresh series and driven with
+# ticks from a random walk or from the price messages of a saved
+# session file.  The cost of reading each index ('readNanos') is
+# measured alone and scheduled by an IndexGraph, where lazy indexes
+# check for pending values on every read.  Results are written as JSON
+# so that runs can be compared between releases:
+#
+#     python -m profit.series.benchmark -n 100000 -o before.json
+#
+# With -p, the previous implementations kept in profit.series.reference
+# are timed next to the current ones.  With -a, the objects and state
+# bytes each index retains per tick are measured instead, for the
+# current implementation and for the previous one where it is kept.
+#
+# With -w, many tickers (-k) are computed in this process and then by
+# SeriesPool worker processes, to measure how the pool scales:
+#
+#     python -m profit.series.benchmark -n 2000 -k 200 -w 4
+#
+##
+
+import gc
+import json
+import sys
+from cPickle import load
+from optparse import OptionParser
+from platform import platform, python_version
+from random import Random
+from time import sleep, time
+
+from profit.series import Series, indexTypes
+from profit.series.graph import IndexGraph
+from profit.series.reference import referenceTypes
+
+
+##
+# Values for index parameters without a default.  Prices are generated
+# near 100.0, so the price levels used by the filters are too.
+
+parameterDefaults = {
+    'cutoff' : 100.0,
+    'dev_factor' : 2.0,
+    'hi' : 105.0,
+    'level' : 100.0,
+    'low' : 95.0,
+    'offset' : 0.01,
+}
+
+typeDefaults = {
+    'int' : 20,
+    'float' : 1.0,
+}
+
+
+def randomWalk(count, seed=0, start=100.0, scale=0.1):
+    """ Creates a sequence of random walk prices.
+
+    @param count number of prices
+    @param seed=0 random number generator seed
+    @param start=100.0 initial price
+    @param scale=0.1 standard deviation of each step
+    @return list of floats
+    """
+    generator = Random(seed)
+    gauss = generator.gauss
+    prices = []
+    price = start
+    for i in xrange(count):
+        price += gauss(0, scale)
+        prices.append(price)
+    return prices
+
+
+def sessionTicks(filename, tickerId=None, field=None):
+    """ Reads prices from the TickPrice messages of a session file.
+
+    @param filename name of file written by Session.save
+    @param tickerId=None ticker id; default is the most frequent
+    @param field=None tick field; default is the most frequent
+    @return list of floats
+    """
+    handle = open(filename, 'rb')
+    try:
+        messages = load(handle)
+    finally:
+        handle.close()
+    ticks = []
+    for item in messages:
+        try:
+            mtime, message = item
+        except (TypeError, ValueError, ):
+            continue
+        if getattr(message, 'typeName', None) == 'TickPrice':
+            ticks.append((message.tickerId, message.field, message.price))
+    def mostFrequent(values):
+        counts = {}
+        for value in values:
+            counts[value] = counts.get(value, 0) + 1
+        return max([(c, v) for v, c in counts.items()])[1]
+    if ticks and tickerId is None:
+        tickerId = mostFrequent([t[0] for t in ticks])
+    ticks = [t for t in ticks if t[0] == tickerId]
+    if ticks and field is None:
+        field = mostFrequent([t[1] for t in ticks])
+    return [t[2] for t in ticks if t[1] == field]
+
+
+def indexArguments(cls, series):
+    """ Creates constructor arguments for an index type.
+
+    Every line parameter receives the input series.  Other parameters
+    take their default from the index 'params' spec, then from
+    parameterDefaults, then from typeDefaults.
+
+    @param cls index class
+    @param series input Series instance
+    @return list of (name, value) pairs
+    """
+    args = []
+    for name, spec in cls.params:
+        kind = spec.get('type')
+        if kind == 'line':
+            value = series
+        elif 'default' in spec:
+            value = spec['default']
+        elif name in parameterDefaults:
+            value = parameterDefaults[name]
+        else:
+            value = typeDefaults.get(kind)
+        args.append((name, value))
+    return args
+
+
+def percentile(values, fraction):
+    """ Nearest-rank percentile of sorted values.
+
+    @param values sorted sequence of numbers
+    @param fraction percentile as a fraction, 0.0 to 1.0
+    @return value at percentile
+    """
+    if not values:
+        return None
+    pos = int(round(fraction * (len(values) - 1)))
+    return values[pos]
+
+
+def retainedSize(obj, exclude=()):
+    """ Approximate bytes referenced by an object.
+
+    Containers, instance dictionaries and slots are followed; classes,
+    functions and modules are not.  Each object is counted once.
+
+    @param obj object to measure
+    @param exclude=() objects to neither count nor follow
+    @return size in bytes
+    """
+    seen = set([id(o) for o in exclude])
+    pending = [obj]
+    total = 0
+    skip = (type, type(retainedSize), type(sys))
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, skip):
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            pending.extend(obj.keys())
+            pending.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)) or \
+                 type(obj).__name__ == 'deque':
+            pending.extend(obj)
+        if hasattr(obj, '__dict__'):
+            pending.append(obj.__dict__)
+        for name in getattr(type(obj), '__slots__', ()):
+            if hasattr(obj, name):
+                pending.append(getattr(obj, name))
+    return total
+
+
+def benchmarkIndex(cls, prices, extend=True, name=None, spec=None):
+    """ Measures one index type driven by a sequence of prices.
+
+    @param cls index class, or None to measure a bare series
+    @param prices sequence of prices
+    @param extend=True if True, also measure Series.extend
+    @param name=None name for the result; default is the class name
+    @param spec=None index type whose parameters give the arguments;
+    default is cls
+    @return result mapping
+    """
+    name = name or (cls.__name__ if cls else 'Series')
+    result = dict(name=name, ticks=len(prices), error=None,
+                  append=None, extend=None, bytesPerMillion=None)
+    timer = time
+    try:
+        series = Series()
+        if cls:
+            args = indexArguments(spec or cls, series)
+            index = series.addIndex(name, cls, *[v for k, v in args])
+            result['args'] = dict(
+                [(k, v) for k, v in args if v is not series])
+        else:
+            index = series
+        append = series.append
+        latencies = []
+        record = latencies.append
+        begin = timer()
+        for price in prices:
+            start = timer()
+            append(price)
+            record(timer() - start)
+        elapsed = timer() - begin
+    except (Exception, ), exc:
+        result['error'] = '%s: %s' % (exc.__class__.__name__, exc)
+        return result
+    latencies.sort()
+    micro = 1000000.0
+    result['append'] = dict(
+        seconds=elapsed,
+        ticksPerSecond=len(prices) / elapsed if elapsed else None,
+        latency=dict(p50=percentile(latencies, 0.50) * micro,
+                     p90=percentile(latencies, 0.90) * micro,
+                     p99=percentile(latencies, 0.99) * micro,
+                     max=latencies[-1] * micro))
+    exclude = [] if index is series else [series]
+    size = retainedSize(index, exclude)
+    result['bytesPerMillion'] = size * micro / len(prices)
+    if extend and cls and hasattr(cls, 'reindexBatch'):
+        series = Series()
+        series.addIndex(name, cls, *[v for k, v in
+                                     indexArguments(cls, series)])
+        begin = timer()
+        try:
+            series.extend(prices)
+        except (Exception, ), exc:
+            result['error'] = '%s: %s' % (exc.__class__.__name__, exc)
+            return result
+        elapsed = timer() - begin
+        result['extend'] = dict(
+            seconds=elapsed,
+            ticksPerSecond=len(prices) / elapsed if elapsed else None)
+    return result
+
+
+def benchmarkReads(cls, prices, reads=100000):
+    """ Measures the cost of reading an index, alone and in a graph.
+
+    Indexes scheduled lazily by an IndexGraph check for pending values
+    on every read; other indexes are read as plain lists.
+
+    @param cls index class, or None to measure a bare series
+    @param prices sequence of prices
+    @param reads=100000 number of reads of the last value and length
+    @return mapping of 'plain' and 'graph' to nanoseconds per read, and
+    'lazy' to True if the graph scheduled the index lazily
+    """
+    name = cls.__name__ if cls else 'Series'
+    result = {}
+    for mode in ('plain', 'graph'):
+        series = Series()
+        if mode == 'graph':
+            graph = IndexGraph()
+            graph.attach(series)
+        if cls:
+            index = series.addIndex(name, cls, *[v for k, v in
+                                                 indexArguments(cls, series)])
+        else:
+            index = series
+        series.extend(prices)
+        len(index)
+        begin = time()
+        for i in xrange(reads):
+            index[-1]
+            len(index)
+        result[mode] = (time() - begin) * 1e9 / reads
+        if mode == 'graph':
+            result['lazy'] = id(index) in graph.lazy
+    return result
+
+
+def benchmarkAllocations(cls, prices, name=None, spec=None):
+    """ Measures the objects and memory an index retains per tick.
+
+    Objects are those tracked by the garbage collector (containers and
+    instances, not floats); state bytes are those held by the index in
+    addition to its values, its series and its 'x' and 'y' values (see
+    retainedSize).
+
+    @param cls index class
+    @param prices sequence of prices
+    @param name=None name for the result; default is the class name
+    @param spec=None index type whose parameters give the arguments;
+    default is cls
+    @return result mapping
+    """
+    name = name or cls.__name__
+    result = dict(name=name, ticks=len(prices), error=None)
+    gc.collect()
+    objects = len(gc.get_objects())
+    try:
+        series = Series()
+        args = indexArguments(spec or cls, series)
+        index = series.addIndex(name, cls, *[v for k, v in args])
+        append = series.append
+        for price in prices:
+            append(price)
+    except (Exception, ), exc:
+        result['error'] = '%s: %s' % (exc.__class__.__name__, exc)
+        return result
+    gc.collect()
+    count = float(len(prices))
+    result['objectsPerTick'] = (len(gc.get_objects()) - objects) / count
+    skip = set(['indexes', 'scheduler', 'series', 'x', 'y'])
+    state = [v for k, v in vars(index).items() if k not in skip]
+    size = retainedSize(state, [series, index, index.x, index.y])
+    result['stateBytes'] = size
+    result['stateBytesPerTick'] = size / count
+    return result
+
+
+def runAllocations(prices, names=None, source='random'):
+    """ Measures retained objects and state of indexes and of their
+    previous implementations.
+
+    @param prices sequence of prices
+    @param names=None sequence of index type names; default is those
+    with a previous implementation in profit.series.reference
+    @param source='random' description of the prices for the report
+    @return report mapping
+    """
+    types, previous = indexTypes(), referenceTypes()
+    results = []
+    for name in sorted(names or previous):
+        if name in previous:
+            result = benchmarkAllocations(previous[name], prices, name,
+                                          types[name])
+            result['implementation'] = 'previous'
+            results.append(result)
+        result = benchmarkAllocations(types[name], prices, name)
+        result['implementation'] = 'current'
+        results.append(result)
+    return dict(version=1, time=time(), python=python_version(),
+                platform=platform(), source=source, ticks=len(prices),
+                allocations=results)
+
+
+def seriesFactory(names):
+    """ Creates a series factory for SeriesPool measurements.
+
+    @param names sequence of index type names
+    @return callable taking (tickerId, field), returning a Series with
+    one index of each named type
+    """
+    types = indexTypes()
+    def factory(tickerId, field):
+        series = Series()
+        for name in names:
+            cls = types[name]
+            series.addIndex(name, cls, *[v for k, v in
+                                         indexArguments(cls, series)])
+        return series
+    return factory
+
+
+def benchmarkPool(prices, tickers, workers, names, timeout=60):
+    """ Measures many tickers computed in this process or by a SeriesPool.
+
+    Every ticker receives every price, one tick of each ticker in turn.
+    With workers, the time is measured until every value has been
+    written to the shared buffers of every ticker series.
+
+    @param prices sequence of prices
+    @param tickers number of tickers
+    @param workers number of worker processes, or 0 for this process
+    @param names sequence of index type names for each ticker series
+    @param timeout=60 seconds to wait for the workers without progress
+    @return result mapping
+    """
+    from profit.series.shared import SeriesPool
+    factory = seriesFactory(names)
+    result = dict(tickers=tickers, workers=workers, indexes=list(names),
+                  ticks=len(prices) * tickers, error=None, seconds=None,
+                  ticksPerSecond=None)
+    tickerIds = range(tickers)
+    begin = time()
+    if not workers:
+        series = [factory(tickerId, 0) for tickerId in tickerIds]
+        for price in prices:
+            for target in series:
+                target.append(price)
+    else:
+        pool = SeriesPool(factory, workers)
+        try:
+            append = pool.append
+            for price in prices:
+                for tickerId in tickerIds:
+                    append(tickerId, 0, price)
+            shared = {}
+            done, last = 0, time()
+            while done < tickers:
+                for tickerId, field, target in pool.poll():
+                    shared[tickerId] = target
+                count = len([t for t in shared.values()
+                             if t.buffer.count() >= len(prices)])
+                if count > done:
+                    done, last = count, time()
+                elif time() - last > timeout:
+                    result['error'] = 'timed out with %s of %s tickers' % \
+                                      (done, tickers)
+                    return result
+                else:
+                    sleep(0.001)
+        finally:
+            pool.close()
+    elapsed = time() - begin
+    result['seconds'] = elapsed
+    result['ticksPerSecond'] = result['ticks'] / elapsed if elapsed else None
+    return result
+
+
+def runPool(prices, tickers, workers, names=None, source='random'):
+    """ Measures the scaling of ticker series with the number of workers.
+
+    Tickers are measured in this process, then with 1, 2, 4, ... worker
+    processes up to the number given.
+
+    @param prices sequence of prices
+    @param tickers number of tickers
+    @param workers largest number of worker processes
+    @param names=None sequence of index type names; default is EMA
+    and KAMA
+    @param source='random' description of the prices for the report
+    @return report mapping
+    """
+    names = names or ['EMA', 'KAMA']
+    counts = [0]
+    while counts[-1] < workers:
+        counts.append(min(max(counts[-1] * 2, 1), workers))
+    results = [benchmarkPool(prices, tickers, count, names)
+               for count in counts]
+    return dict(version=1, time=time(), python=python_version(),
+                platform=platform(), source=source, ticks=len(prices),
+                pool=results)
+
+
+def run(prices, names=None, source='random', extend=True, previous=False):
+    """ Measures a bare series and each index type.
+
+    @param prices sequence of prices
+    @param names=None sequence of index type names; default is all
+    @param source='random' description of the prices for the report
+    @param extend=True if True, also measure Series.extend
+    @param previous=False if True, also measure the append path of
+    previous implementations kept in profit.series.reference
+    @return report mapping
+    """
+    types = indexTypes()
+    if names:
+        types = dict([(k, types[k]) for k in names])
+    results = [benchmarkIndex(None, prices, extend)]
+    references = referenceTypes() if previous else {}
+    for name in sorted(types):
+        if name in references:
+            result = benchmarkIndex(references[name], prices, False, name,
+                                    types[name])
+            result['implementation'] = 'previous'
+            results.append(result)
+        result = benchmarkIndex(types[name], prices, extend)
+        if name in references:
+            result['implementation'] = 'current'
+        results.append(result)
+    for result in results:
+        if result.get('implementation') == 'previous':
+            continue
+        if result['error'] is None:
+            cls = types.get(result['name'])
+            try:
+                result['readNanos'] = benchmarkReads(cls, prices)
+            except (Exception, ), exc:
+                result['error'] = '%s: %s' % (exc.__class__.__name__, exc)
+    return dict(version=1, time=time(), python=python_version(),
+                platform=platform(), source=source, ticks=len(prices),
+                results=results)
+
+
+def options(args=None):
+    parser = OptionParser(usage='%prog [options]')
+    add_option = parser.add_option
+    add_option('-n', '--ticks', dest='ticks', type='int', default=100000,
+               help='number of random walk ticks [default:%default]')
+    add_option('-r', '--seed', dest='seed', type='int', default=0,
+               help='random walk seed [default:%default]')
+    add_option('-s', '--session', dest='session', metavar='FILE',
+               help='read prices from session file instead')
+    add_option('-t', '--tickerid', dest='tickerId', type='int',
+               help='session ticker id [default: most frequent]')
+    add_option('-f', '--field', dest='field', type='int',
+               help='session tick field [default: most frequent]')
+    add_option('-i', '--index', dest='names', action='append',
+               metavar='NAME', help='index type to measure; repeatable')
+    add_option('-x', '--no-extend', dest='extend', action='store_false',
+               default=True, help='skip Series.extend measurements')
+    add_option('-a', '--allocations', dest='allocations',
+               action='store_true', default=False,
+               help='measure retained objects and state per tick instead, '
+               'with previous implementations where kept')
+    add_option('-p', '--previous', dest='previous', action='store_true',
+               default=False, help='also time previous implementations '
+               'where kept')
+    add_option('-w', '--workers', dest='workers', type='int', default=0,
+               help='measure ticker series computed by up to this many '
+               'worker processes instead')
+    add_option('-k', '--tickers', dest='tickers', type='int', default=100,
+               help='number of tickers for -w [default:%default]')
+    add_option('-o', '--output', dest='output', metavar='FILE',
+               help='write JSON report to file [default: stdout]')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    opts, args = options(args)
+    if opts.session:
+        prices = sessionTicks(opts.session, opts.tickerId, opts.field)
+        source = 'session:%s' % (opts.session, )
+    else:
+        prices = randomWalk(opts.ticks, opts.seed)
+        source = 'random:%s' % (opts.seed, )
+    if not prices:
+        sys.stderr.write('No ticks to measure.\n')
+        return 1
+    if opts.workers:
+        report = runPool(prices, opts.tickers, opts.workers, opts.names,
+                         source)
+    elif opts.allocations:
+        report = runAllocations(prices, opts.names, source)
+    else:
+        report = run(prices, opts.names, source, opts.extend,
+                     opts.previous)
+    output = open(opts.output, 'w') if opts.output else sys.stdout
+    try:
+        json.dump(report, output, indent=1, sort_keys=True)
+        output.write('\n')
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,240 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2007 Troy Melhase
+# Distributed under the terms of the GNU General Public License v2
+# Author: Troy Melhase <troy@gci.net>
+
+##
+#
+# This module defines the IndexCache class, an on-disk cache of index
+# values.
+#
+# An IndexGraph given a cache consults it before computing a lazy
+# index from the start of its series, which is what happens the first
+# time an index is read after a session is loaded or a backtest is
+# run.  Entries are keyed by the index type and parameters, the
+# version of the index type (see BaseIndex) and of the cache format
+# (IndexCache.version), and by a hash of the input series values;
+# entries written by other versions are never matched.  The hash is
+# computed over the series prefix, so an entry made for a shorter
+# series is reused when the session has grown since: its values and
+# state are restored, and only the new values are computed.  Entries
+# are files named for their key, prefix length and prefix hash; the
+# least recently used are removed when the files exceed the size
+# limit.
+#
+# Series with a capacity that have discarded values are not cached.
+#
+##
+
+import os
+from array import array
+from cPickle import HIGHEST_PROTOCOL, UnpicklingError, dump, load
+from hashlib import sha1
+from os.path import expanduser, getmtime, getsize, join
+
+from profit.series.basic import Series
+
+
+def seriesDigests(series, lengths, chunk=2**16):
+    """ Hashes prefixes of a series.
+
+    @param series Series instance
+    @param lengths sequence of prefix lengths
+    @param chunk=2**16 values hashed per step
+    @return mapping of prefix length to hex digest
+    """
+    nan = float('nan')
+    digest = sha1()
+    digests = {}
+    pos = 0
+    for length in sorted(set(lengths)):
+        while pos < length:
+            end = min(pos + chunk, length)
+            values = [nan if v is None else v for v in series[pos:end]]
+            digest.update(array('d', values).tostring())
+            pos = end
+        digests[length] = digest.copy().hexdigest()
+    return digests
+
+
+def plainValues(values):
+    """ Converts numpy scalars to floats, which pickle much faster.
+
+    @param values sequence of index values
+    @return list of values
+    """
+    plain = (float, int, long, type(None))
+    return [v if type(v) in plain else float(v) for v in values]
+
+
+class IndexCache(object):
+    """ Cache of index values and state in a directory of files.
+
+    """
+    suffix = '.index'
+    version = 1
+    skip = set(['indexes', 'key', 'pending', 'scheduler', 'x', 'y'])
+
+    def __init__(self, directory='~/.profitdevice/indexcache',
+                 limit=256*2**20, minimum=1000):
+        """ Initializer.
+
+        @param directory='~/.profitdevice/indexcache' cache directory
+        @param limit=256*2**20 total size of cache files in bytes
+        @param minimum=1000 least number of values an index must compute
+        in one batch before its values are written to the cache
+        """
+        self.directory = directory = expanduser(directory)
+        self.limit = limit
+        self.minimum = minimum
+        self.entries = None
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def scan(self):
+        """ Reads the names of the entries in the cache directory.
+
+        @return mapping of key to list of (length, digest, filename)
+        """
+        if self.entries is None:
+            self.entries = entries = {}
+            suffix = self.suffix
+            for name in os.listdir(self.directory):
+                if not name.endswith(suffix):
+                    continue
+                try:
+                    key, length, digest = name[:-len(suffix)].split('-')
+                    length = int(length)
+                except (ValueError, ):
+                    continue
+                entries.setdefault(key, []).append((length, digest, name))
+        return self.entries
+
+    def reindexBatch(self, index, start, signature):
+        """ Computes index values from position start, using the cache.
+
+        Called by IndexGraph in place of index.reindexBatch.
+
+        @param index index instance with a single input series
+        @param start position of the first series value to process
+        @param signature string identifying the index type and parameters
+        @return None
+        """
+        series = index.series
+        if series.evicted:
+            index.reindexBatch(start)
+            return
+        key = sha1('%s %s %s' % (self.version, index.version,
+                                 signature)).hexdigest()
+        entry = None
+        if start == 0 and not list.__len__(index):
+            entry = self.restore(index, key)
+            if entry:
+                start = entry[0]
+        if start < len(series):
+            index.reindexBatch(start)
+        if len(series) - start >= self.minimum and not index.evicted:
+            self.store(index, key, entry)
+
+    def restore(self, index, key):
+        """ Copies the longest entry matching the index series to the index.
+
+        @param index empty index instance
+        @param key index key
+        @return restored (length, digest, filename) entry, or None
+        """
+        series = index.series
+        entries = [e for e in self.scan().get(key, [])
+                   if e[0] <= len(series)]
+        if not entries:
+            return None
+        digests = seriesDigests(series, [e[0] for e in entries])
+        for entry in sorted(entries, reverse=True):
+            length, digest, name = entry
+            if digests[length] != digest:
+                continue
+            filename = join(self.directory, name)
+            try:
+                handle = open(filename, 'rb')
+                try:
+                    values, x, y, state = load(handle)
+                finally:
+                    handle.close()
+            except (IOError, EOFError, UnpicklingError, ValueError, ):
+                self.remove(key, entry)
+                continue
+            list.extend(index, values)
+            index.x.extend(x)
+            index.y.extend(y)
+            for name, value in state.items():
+                setattr(index, name, value)
+            os.utime(filename, None)
+            return entry
+        return None
+
+    def store(self, index, key, replaces=None):
+        """ Writes the values and state of an index to the cache.
+
+        @param index index instance
+        @param key index key
+        @param replaces=None entry made obsolete by the new one
+        @return None
+        """
+        length = len(index.series)
+        digest = seriesDigests(index.series, [length])[length]
+        name = '%s-%s-%s%s' % (key, length, digest, self.suffix)
+        state = dict([(k, v) for k, v in vars(index).items()
+                      if k not in self.skip and not isinstance(v, Series)])
+        filename = join(self.directory, name)
+        try:
+            handle = open(filename, 'wb')
+            try:
+                values = (plainValues(index), list(index.x),
+                          plainValues(index.y))
+                dump(values + (state, ), handle, HIGHEST_PROTOCOL)
+            finally:
+                handle.close()
+        except (IOError, ):
+            return
+        self.scan().setdefault(key, []).append((length, digest, name))
+        if replaces and replaces[2] != name:
+            self.remove(key, replaces)
+        self.evict()
+
+    def remove(self, key, entry):
+        """ Deletes an entry.
+
+        @param key index key
+        @param entry (length, digest, filename) tuple
+        @return None
+        """
+        try:
+            os.remove(join(self.directory, entry[2]))
+        except (OSError, ):
+            pass
+        entries = self.scan().get(key, [])
+        if entry in entries:
+            entries.remove(entry)
+
+    def evict(self):
+        """ Deletes the least recently used entries beyond the size limit.
+
+        @return None
+        """
+        files = []
+        for key, entries in self.scan().items():
+            for entry in entries:
+                filename = join(self.directory, entry[2])
+                try:
+                    files.append((getmtime(filename), getsize(filename),
+                                  key, entry))
+                except (OSError, ):
+                    pass
+        total = sum([f[1] for f in files])
+        for mtime, size, key, entry in sorted(files):
+            if total <= self.limit:
+                break
+            self.remove(key, entry)
+            total -= size
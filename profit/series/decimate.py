@@ -0,0 +1,413 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2007 Troy Melhase
+# Distributed under the terms of the GNU General Public License v2
+# Author: Troy Melhase <troy@gci.net>
+
+##
+#
+# This module reduces series to the points needed to draw them.
+#
+# A plot canvas is at most a few thousand pixels wide, so a curve of a
+# full session (hundreds of thousands of values) can be drawn from a
+# small fraction of its points without visible change, as long as the
+# extremes of every pixel column are kept.  A CurveSummary keeps the
+# minimum and maximum of the 'y' values of a series in buckets of 8,
+# 32, 128, ... points (each level combining four buckets of the level
+# below), and updates them as values are added.  Given a range of 'x'
+# values and a width in pixels, 'points' returns the minimum and
+# maximum of each bucket in the range from the coarsest level that
+# still gives at least one bucket for every two pixels, which is at
+# most about four points per pixel.  The first and last points of the
+# range are always included.  Both the range and the 'nearest' point to
+# an 'x' value are found by binary search of the 'x' values, so zooming
+# or panning a long series costs time in proportion to the points
+# drawn, not the length of the series.
+#
+# With the 'lttb' option, these points are further reduced with the
+# Largest-Triangle-Three-Buckets algorithm to about one per pixel,
+# which draws a smoother line but may drop isolated spikes.
+#
+# Series that discard values (see Series.trim) have their summaries
+# rebuilt after each discard.
+#
+# A CurveFeed keeps the points of the whole series for one curve in a
+# PointBuffer, and adds only what has changed as the series grows:
+# the points of newly completed buckets are appended, and the few
+# points after the last complete bucket are replaced.  The buffer is a
+# pair of preallocated arrays (numpy arrays when numpy is available),
+# and curves are given views of them, so a plot that follows a live
+# series does work in proportion to the new values, not the history.
+#
+##
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+try:
+    from numpy import empty
+except (ImportError, ):
+    empty = None
+
+
+def seriesPoints(series):
+    """ 'x' and 'y' values of a series, read together.
+
+    Series with an 'xy' method (see profit.series.shared.SharedSeries)
+    copy both from one snapshot of their values.
+
+    @param series Series instance or equivalent
+    @return two-tuple of 'x' and 'y' sequences
+    """
+    try:
+        xy = series.xy
+    except (AttributeError, ):
+        return series.x, series.y
+    return xy()
+
+
+class SummaryLevel(object):
+    """ Minimum and maximum of each bucket of one size.
+
+    Positions are offsets in the 'y' values of the series.
+    """
+    __slots__ = ('size', 'low', 'lowAt', 'high', 'highAt')
+
+    def __init__(self, size):
+        self.size = size
+        self.low = []
+        self.lowAt = []
+        self.high = []
+        self.highAt = []
+
+    def __len__(self):
+        return len(self.low)
+
+
+class CurveSummary(object):
+    """ Multi-resolution minimum and maximum summary of a series.
+
+    """
+    bucketSize = 8
+    fanout = 4
+
+    def __init__(self, series):
+        """ Initializer.
+
+        @param series Series instance; its 'x' values must be ascending
+        """
+        self.series = series
+        self.reset()
+
+    def reset(self):
+        """ Discards all summary levels.
+
+        """
+        self.levels = []
+        self.first = None
+
+    def update(self):
+        """ Summarizes the values added to the series since the last call.
+
+        @return None
+        """
+        x, y = seriesPoints(self.series)
+        count = len(y)
+        first = x[0] if count else None
+        if first != self.first:
+            self.reset()
+            self.first = first
+        size = self.bucketSize
+        levels = self.levels
+        if not levels:
+            levels.append(SummaryLevel(size))
+        level = levels[0]
+        low, lowAt, high, highAt = \
+            level.low, level.lowAt, level.high, level.highAt
+        for start in xrange(len(level) * size, count - size + 1, size):
+            values = list(y[start:start + size])
+            minimum, maximum = min(values), max(values)
+            low.append(minimum)
+            lowAt.append(start + values.index(minimum))
+            high.append(maximum)
+            highAt.append(start + values.index(maximum))
+        fanout = self.fanout
+        depth = 0
+        while len(levels[depth]) >= fanout * 2:
+            below = levels[depth]
+            if len(levels) == depth + 1:
+                levels.append(SummaryLevel(below.size * fanout))
+            level = levels[depth + 1]
+            for start in xrange(len(level) * fanout,
+                                len(below) - fanout + 1, fanout):
+                end = start + fanout
+                values = below.low[start:end]
+                offset = values.index(min(values))
+                level.low.append(values[offset])
+                level.lowAt.append(below.lowAt[start + offset])
+                values = below.high[start:end]
+                offset = values.index(max(values))
+                level.high.append(values[offset])
+                level.highAt.append(below.highAt[start + offset])
+            depth += 1
+
+    def nearest(self, value):
+        """ Point of the series with the 'x' value closest to a value.
+
+        @param value 'x' value
+        @return two-tuple of 'x' and 'y' values, or None if the series
+        has no points
+        """
+        x, y = seriesPoints(self.series)
+        count = len(x)
+        if not count:
+            return None
+        pos = bisect_left(x, value)
+        if pos == count or (pos and value - x[pos - 1] <= x[pos] - value):
+            pos -= 1
+        return x[pos], y[pos]
+
+    def points(self, lower=None, upper=None, width=1000, lttb=False):
+        """ Points of the series to draw for a range of 'x' values.
+
+        @param lower=None smallest 'x' value, or None for the first
+        @param upper=None largest 'x' value, or None for the last
+        @param width=1000 width of the plot canvas in pixels
+        @param lttb=False if True, reduce the points to about one per
+        pixel with the Largest-Triangle-Three-Buckets algorithm
+        @return two-tuple of 'x' and 'y' value lists
+        """
+        self.update()
+        x, y = seriesPoints(self.series)
+        start = 0 if lower is None else max(bisect_left(x, lower) - 1, 0)
+        end = len(y) if upper is None else \
+              min(bisect_right(x, upper) + 1, len(y))
+        width = max(int(width), 1)
+        count = end - start
+        if count <= width * 2:
+            return list(x[start:end]), list(y[start:end])
+        level = None
+        for candidate in self.levels:
+            if 2 * (count // candidate.size) >= width:
+                level = candidate
+        if level is None:
+            xs, ys = list(x[start:end]), list(y[start:end])
+        else:
+            xs, ys = [], []
+            size = level.size
+            first, last = -(-start // size), min(end // size, len(level))
+            ## values before the first and after the last whole bucket
+            ## of the level are taken from the series directly
+            head = range(start, min(first * size, end))
+            tail = range(max(last * size, first * size, start), end)
+            for pos in head:
+                xs.append(x[pos])
+                ys.append(y[pos])
+            lowAt, highAt = level.lowAt, level.highAt
+            for bucket in xrange(first, last):
+                for pos in sorted((lowAt[bucket], highAt[bucket])):
+                    xs.append(x[pos])
+                    ys.append(y[pos])
+            for pos in tail:
+                xs.append(x[pos])
+                ys.append(y[pos])
+            if xs[0] != x[start]:
+                xs.insert(0, x[start])
+                ys.insert(0, y[start])
+            if xs[-1] != x[end - 1]:
+                xs.append(x[end - 1])
+                ys.append(y[end - 1])
+        if lttb:
+            xs, ys = largestTriangleThreeBuckets(xs, ys, width)
+        return xs, ys
+
+
+def largestTriangleThreeBuckets(xs, ys, threshold):
+    """ Reduces points with the Largest-Triangle-Three-Buckets algorithm.
+
+    The first and last points are kept; from each of 'threshold' - 2
+    buckets in between, the point forming the largest triangle with
+    the point kept from the previous bucket and the average of the
+    next bucket is kept.
+
+    @param xs sequence of 'x' values
+    @param ys sequence of 'y' values
+    @param threshold number of points to keep
+    @return two-tuple of 'x' and 'y' value lists
+    """
+    count = len(xs)
+    if threshold >= count or threshold < 3:
+        return list(xs), list(ys)
+    every = float(count - 2) / (threshold - 2)
+    outX, outY = [xs[0]], [ys[0]]
+    previous = 0
+    for bucket in xrange(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        following = min(int((bucket + 2) * every) + 1, count)
+        if following > end:
+            span = following - end
+            averageX = sum(xs[end:following]) / float(span)
+            averageY = sum(ys[end:following]) / float(span)
+        else:
+            averageX, averageY = xs[-1], ys[-1]
+        ax, ay = xs[previous], ys[previous]
+        best, chosen = -1.0, start
+        for pos in xrange(start, end):
+            area = abs((ax - averageX) * (ys[pos] - ay) -
+                       (ax - xs[pos]) * (averageY - ay))
+            if area > best:
+                best, chosen = area, pos
+        outX.append(xs[chosen])
+        outY.append(ys[chosen])
+        previous = chosen
+    outX.append(xs[-1])
+    outY.append(ys[-1])
+    return outX, outY
+
+
+class PointBuffer(object):
+    """ Growable pair of 'x' and 'y' double arrays.
+
+    """
+    def __init__(self, capacity=1024):
+        """ Initializer.
+
+        @param capacity=1024 initial number of points allocated
+        """
+        self.count = 0
+        self.allocate(capacity)
+
+    def allocate(self, capacity):
+        """ Reallocates the arrays, keeping the current points.
+
+        @param capacity number of points to allocate
+        @return None
+        """
+        count = self.count
+        if empty is None:
+            xs, ys = array('d', [0.0]) * capacity, array('d', [0.0]) * capacity
+        else:
+            xs, ys = empty(capacity), empty(capacity)
+        if count:
+            xs[:count], ys[:count] = self.xs[:count], self.ys[:count]
+        self.xs, self.ys = xs, ys
+        self.capacity = capacity
+
+    def extend(self, xs, ys):
+        """ Appends points.
+
+        @param xs sequence of 'x' values
+        @param ys sequence of 'y' values of the same length
+        @return None
+        """
+        count, added = self.count, len(xs)
+        if count + added > self.capacity:
+            self.allocate(max(self.capacity * 2, count + added))
+        self.xs[count:count + added] = array('d', xs)
+        self.ys[count:count + added] = array('d', ys)
+        self.count = count + added
+
+    def truncate(self, count):
+        """ Discards the points after the first 'count'.
+
+        """
+        self.count = min(count, self.count)
+
+    def load(self, xs, ys):
+        """ Replaces all points.
+
+        """
+        self.count = 0
+        self.extend(xs, ys)
+
+    def views(self):
+        """ The current points, without copying where possible.
+
+        @return two-tuple of 'x' and 'y' sequences
+        """
+        count = self.count
+        return self.xs[:count], self.ys[:count]
+
+
+class CurveFeed(object):
+    """ Append-only points of a summarized series for a single curve.
+
+    """
+    def __init__(self, summary):
+        """ Initializer.
+
+        @param summary CurveSummary instance
+        """
+        self.summary = summary
+        self.buffer = PointBuffer()
+        self.reset()
+
+    def reset(self):
+        """ Discards the points.
+
+        """
+        self.key = None
+        self.buckets = self.fixed = 0
+        self.buffer.truncate(0)
+
+    def load(self, xs, ys):
+        """ Replaces the points with points computed elsewhere.
+
+        @param xs sequence of 'x' values
+        @param ys sequence of 'y' values
+        @return two-tuple of 'x' and 'y' sequences
+        """
+        self.reset()
+        self.buffer.load(xs, ys)
+        return self.buffer.views()
+
+    def follow(self, width):
+        """ Brings the points of the whole series up to date.
+
+        The points are the same as those of summary.points(width=width)
+        except after the last complete bucket, where only the minimum,
+        maximum and last values are kept.
+
+        @param width width of the plot canvas in pixels
+        @return two-tuple of 'x' and 'y' sequences
+        """
+        summary, buffer = self.summary, self.buffer
+        summary.update()
+        x, y = seriesPoints(summary.series)
+        count = len(y)
+        width = max(int(width), 1)
+        level = None
+        if count > width * 2:
+            for candidate in summary.levels:
+                if 2 * (count // candidate.size) >= width:
+                    level = candidate
+        key = (summary.first, level and level.size)
+        if key != self.key:
+            self.reset()
+            self.key = key
+        buffer.truncate(self.fixed)
+        if level is None:
+            buffer.extend(x[self.fixed:count], y[self.fixed:count])
+            self.fixed = buffer.count
+            return buffer.views()
+        if not self.fixed and count:
+            buffer.extend([x[0]], [y[0]])
+        lowAt, highAt = level.lowAt, level.highAt
+        xs, ys = [], []
+        for bucket in xrange(self.buckets, len(level)):
+            for pos in sorted((lowAt[bucket], highAt[bucket])):
+                xs.append(x[pos])
+                ys.append(y[pos])
+        buffer.extend(xs, ys)
+        self.buckets = len(level)
+        self.fixed = buffer.count
+        start = self.buckets * level.size
+        if start < count:
+            values = list(y[start:count])
+            positions = set([start + values.index(min(values)),
+                             start + values.index(max(values)), count - 1])
+            positions = sorted(positions)
+            buffer.extend([x[p] for p in positions], [y[p] for p in positions])
+        return buffer.views()
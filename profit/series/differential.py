@@ -0,0 +1,725 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2007 Troy Melhase
+# Distributed under the terms of the GNU General Public License v2
+# Author: Troy Melhase <troy@gci.net>
+
+##
+#
+# This module cross-checks the index types in profit.series.
+#
+# Every index type is computed over a set of edge case series (gaps of
+# None, short histories, constant series and flat ranges, integer
+# prices and a random walk) in several ways:
+#
+#     - incrementally, one Series.append per value;
+#     - with Series.extend, in one block and in small blocks;
+#     - with other indexes attached before and after it, and through
+#       an IndexGraph with lazy evaluation;
+#     - from a NumPy reference implementation, where one is defined.
+#
+# Any difference beyond the tolerance is reported, along with
+# exceptions, and state other than the index values that grows with
+# the length of the series.  Checks of the series themselves (see
+# seriesChecks) run when no index type is named.  Run it before and
+# after changing an index:
+#
+#     python -m profit.series.differential [-i KAMA] [-v]
+#
+##
+
+import os
+import shutil
+import sys
+from optparse import OptionParser
+from random import Random
+
+from numpy import array, errstate, isnan, nan, polyfit, where
+from numpy.lib.stride_tricks import as_strided
+
+from profit.series import (ChangeIndex, Convergence, EMA, MACDHistogram,
+                           PercentConvergence, SMA, Series, indexTypes)
+from profit.series.benchmark import parameterDefaults, retainedSize
+from profit.series.graph import IndexGraph
+
+
+##
+# Input lines for index parameters other than the first series, and
+# values for the remaining parameters.  Small periods make the short
+# history cases meaningful.
+
+inputLines = {
+    'change_line' : (ChangeIndex, ),
+    'moving_average' : (SMA, 10),
+    'other' : (SMA, 5),
+    'signal' : (EMA, 5),
+}
+
+typeDefaults = {
+    'int' : 5,
+    'float' : 1.0,
+}
+
+##
+# Index types with output that does not depend on the series values
+# alone, and which are therefore only checked for exceptions and state.
+
+nondeterministic = set(['TimeIndex', ])
+
+
+def edgeCases(seed=0, count=400):
+    """ Creates the series values used to check each index type.
+
+    @param seed=0 random number generator seed
+    @param count=400 length of the longer cases
+    @return list of (name, values) pairs
+    """
+    generator = Random(seed)
+    walk, price = [], 100.0
+    for i in xrange(count):
+        price += generator.gauss(0, 1)
+        walk.append(price)
+    gaps = walk[:]
+    for i in range(7, count, 23) + range(200, 206):
+        gaps[i] = None
+    steps = []
+    for value in walk[:count/10]:
+        steps.extend([round(value)] * 10)
+    ints = [int(value) for value in walk]
+    return [
+        ('walk', walk),
+        ('gaps', gaps),
+        ('short', walk[:3]),
+        ('single', walk[:1]),
+        ('constant', [100.0] * 60),
+        ('steps', steps),
+        ('ints', ints),
+    ]
+
+
+def isMissing(value):
+    """ True if value is None or nan.
+
+    """
+    return value is None or value != value
+
+
+def mismatch(values, expected, rtol=1e-9, atol=1e-9):
+    """ Finds the first position where two sequences of values differ.
+
+    None and nan are equivalent; numbers are compared within a relative
+    and absolute tolerance.
+
+    @param values sequence of index values
+    @param expected sequence of expected values
+    @return None, or tuple of (position, value, expected value)
+    """
+    if len(values) != len(expected):
+        return (min(len(values), len(expected)), len(values), len(expected))
+    for pos, (a, b) in enumerate(zip(values, expected)):
+        if isMissing(a) or isMissing(b):
+            if isMissing(a) and isMissing(b):
+                continue
+            return (pos, a, b)
+        try:
+            if abs(a - b) > atol + rtol * abs(b):
+                return (pos, a, b)
+        except (TypeError, ):
+            if a != b:
+                return (pos, a, b)
+    return None
+
+
+def indexArguments(cls, series):
+    """ Creates constructor arguments for an index type.
+
+    Line parameters after the first receive an index of the series
+    from inputLines, added to the series before the index under test.
+
+    @param cls index class
+    @param series input Series instance
+    @return list of (name, value) pairs
+    """
+    args = []
+    for pos, (name, spec) in enumerate(cls.params):
+        kind = spec.get('type')
+        if kind == 'line':
+            if pos == 0 or name not in inputLines:
+                value = series
+            else:
+                line = inputLines[name]
+                value = series.addIndex(name, line[0], series, *line[1:])
+        elif 'default' in spec:
+            value = spec['default']
+        elif name in parameterDefaults:
+            value = parameterDefaults[name]
+        else:
+            value = typeDefaults.get(kind)
+        args.append((name, value))
+    return args
+
+
+def build(cls, values, chunk=None, graph=False, others=False):
+    """ Computes an index over a sequence of values.
+
+    @param cls index class
+    @param values sequence of series values
+    @param chunk=None if given, values are added with Series.extend in
+    blocks of this size; otherwise with Series.append
+    @param graph=False if True, the series is scheduled by a lazy
+    IndexGraph
+    @param others=False if True, other indexes are attached to the
+    series before and after the index under test
+    @return two-tuple of (index, mapping of arguments)
+    """
+    series = Series()
+    if graph:
+        IndexGraph().attach(series)
+    if others:
+        series.addIndex('other-before', SMA, series, 3)
+    args = indexArguments(cls, series)
+    index = series.addIndex('index', cls, *[v for k, v in args])
+    if others:
+        series.addIndex('other-after', ChangeIndex, series)
+    if chunk:
+        for pos in xrange(0, len(values), chunk):
+            series.extend(values[pos:pos+chunk])
+    else:
+        for value in values:
+            series.append(value)
+    return index, dict(args)
+
+
+def stateSize(index):
+    """ Approximate bytes held by an index in addition to its values.
+
+    @param index index instance
+    @return size in bytes
+    """
+    exclude = [index, index.x, index.y] + list(index)
+    exclude.extend([v for v in vars(index).values()
+                    if isinstance(v, Series)])
+    skip = set(['indexes', 'scheduler', 'x', 'y'])
+    state = [v for k, v in vars(index).items() if k not in skip]
+    return retainedSize(state, exclude)
+
+
+##
+# NumPy reference implementations.  Each takes an array of the series
+# values (nan for None) and the index constructor arguments, and
+# returns the expected index values (nan or None where undefined).
+
+def numeric(values):
+    return array([nan if v is None else v for v in values], dtype=float)
+
+
+def windows(values, periods):
+    """ Two-dimensional view of each full window of values.
+
+    """
+    count = max(len(values) - periods + 1, 0)
+    step = values.strides[0]
+    return as_strided(values, shape=(count, periods), strides=(step, step))
+
+
+def leading(values, periods, result):
+    """ Pads windowed results with nan to the length of values.
+
+    """
+    return [nan] * (len(values) - len(result)) + list(result)
+
+
+def lagged(values, lag):
+    """ values shifted by lag positions, padded with nan.
+
+    """
+    if lag <= 0:
+        return values.copy()
+    return array([nan] * min(lag, len(values)) + list(values[:-lag]))
+
+
+def refSMA(values, args):
+    periods = args['periods']
+    return leading(values, periods, windows(values, periods).mean(axis=1))
+
+
+def refWMA(values, args):
+    periods = args['periods']
+    weights = array(range(1, periods+1), dtype=float) / sum(range(1, periods+1))
+    return leading(values, periods, (windows(values, periods) * weights).sum(axis=1))
+
+
+def refVolatility(values, args):
+    periods = args['periods']
+    view = windows(values, periods)
+    return leading(values, periods, view.std(axis=1) / view.mean(axis=1) * 100)
+
+
+def refEMA(values, args):
+    periods = args['periods']
+    k = args['k'] / (periods + 1)
+    out = [None]
+    for pos in range(1, len(values)):
+        last = out[-1]
+        if isMissing(last):
+            window = values[max(pos+1-periods, 0):pos+1]
+            out.append(window.mean() if len(window) == periods else None)
+        else:
+            out.append(last + k * (values[pos] - last))
+    return out[:len(values)]
+
+
+def refKAMA(values, args):
+    periods = args['periods']
+    fastest = 2.0 / (args['fast_look'] + 1)
+    slowest = 2.0 / (args['slow_look'] + 1)
+    factor = (fastest - slowest) + slowest
+    diffs = abs(values[1:] - values[:-1])
+    out = []
+    for pos in range(len(values)):
+        if pos == 0:
+            out.append(values[0])
+            continue
+        noise = diffs[pos-periods:pos].sum() if pos >= periods else 0
+        eff = abs(values[pos] - values[pos-1]) / noise if noise else 1
+        s = (eff * factor) ** 2
+        out.append(s * values[pos] + (1 - s) * out[-1])
+    return out
+
+
+def refDistanceCoefficient(values, args):
+    periods = args['periods']
+    if len(values) < 2*periods - 1:
+        return [nan] * len(values)
+    view = windows(values, periods)
+    dists = ((view[:, :-1] - view[:, -1:]) ** 2).sum(axis=1)
+    prices = values[periods-1:]
+    num = (windows(dists, periods) * windows(prices, periods)).sum(axis=1)
+    den = windows(dists, periods).sum(axis=1)
+    with errstate(divide='ignore', invalid='ignore'):
+        filt = where(den != 0, num / den, 0.0)
+    return leading(values, periods, filt)
+
+
+def refMomentum(values, args):
+    return values - lagged(values, args['lookback'] - 1)
+
+
+def refRateOfChange(values, args):
+    prev = lagged(values, args['lookback'] - 1)
+    with errstate(divide='ignore', invalid='ignore'):
+        rate = (values - prev) / prev
+    return where(prev == 0, nan, rate)
+
+
+def refChangeIndex(values, args):
+    return values - lagged(values, 1)
+
+
+def refTrix(values, args):
+    prev = lagged(values, 1)
+    with errstate(divide='ignore', invalid='ignore'):
+        return (values - prev) / prev * 100
+
+
+def refDelayFilter(values, args):
+    return lagged(values, args['lookback'] - 1)
+
+
+def refMovement(values, sign):
+    change = (values - lagged(values, 1)) * sign
+    return [0 if isnan(c) else int(c > 0) for c in change]
+
+
+def refStochastic(values, args):
+    periods, out = args['periods'], []
+    for pos in range(len(values)):
+        window = values[max(pos+1-periods, 0):pos+1]
+        low, high = window.min(), window.max()
+        cl = values[pos] - low
+        out.append(0.0 if cl == 0 else cl / (high - low))
+    return out
+
+
+def refWilliamsR(values, args):
+    periods, out = args['periods'], []
+    for pos in range(len(values)):
+        window = values[max(pos+1-periods, 0):pos+1]
+        low, high = window.min(), window.max()
+        out.append((high - values[pos]) / (high - low) * -100
+                   if high != low else 0)
+    return out
+
+
+def refTrueRange(values, args):
+    periods = args['periods']
+    if periods < 2:
+        return [nan] * len(values)
+    view = windows(values, periods)
+    high, low = view.max(axis=1), view.min(axis=1)
+    prev = view[:, -2]
+    result = array([high - low, high - prev, prev - low]).max(axis=0)
+    return leading(values, periods, result)
+
+
+def refVerticalHorizontalFilter(values, args):
+    periods = args['periods']
+    view = windows(values, periods)
+    moves = abs(view[:, 1:] - view[:, :-1]).sum(axis=1)
+    with errstate(divide='ignore', invalid='ignore'):
+        result = (view.max(axis=1) - view.min(axis=1)) / moves
+    return leading(values, periods, where(moves == 0, nan, result))
+
+
+def refBollingerBand(values, args):
+    period, out = args['period'], []
+    for pos in range(len(values)):
+        window = values[max(pos+1-period, 0):pos+1]
+        out.append(window.std() * args['dev_factor'] + values[pos])
+    return out
+
+
+def refLinearRegressionSlope(values, args):
+    periods, out = args['period'], []
+    for pos in range(len(values)):
+        window = values[max(pos+1-periods, 0):pos+1]
+        if len(window) < periods:
+            out.append(0.0)
+        else:
+            out.append(polyfit(range(periods), window, 1)[0] * args['scale'])
+    return out
+
+
+def refMedianValue(values, args):
+    periods, out = args['periods'], []
+    for pos in range(len(values)):
+        window = sorted(values[max(pos+1-periods, 0):pos+1])
+        mid = len(window) / 2
+        out.append(window[mid] if len(window) % 2 else
+                   (window[mid-1] + window[mid]) / 2.0)
+    return out
+
+
+def refLoPassFilter(values, args):
+    return where(values > args['cutoff'], args['cutoff'], values)
+
+
+def refHiPassFilter(values, args):
+    return where(values < args['cutoff'], args['cutoff'], values)
+
+
+def refBandPassFilter(values, args):
+    clipped = where(values > args['hi'], args['hi'], values)
+    return where(clipped < args['low'], args['low'], clipped)
+
+
+references = {
+    'BandPassFilter' : refBandPassFilter,
+    'BollingerBand' : refBollingerBand,
+    'ChangeIndex' : refChangeIndex,
+    'Convergence' :
+        lambda values, args: numeric(args['signal']) - values,
+    'DelayFilter' : refDelayFilter,
+    'DifferenceIndex' :
+        lambda values, args: values - numeric(args['other']),
+    'DistanceCoefficient' : refDistanceCoefficient,
+    'DownMovement' : lambda values, args: refMovement(values, -1),
+    'EMA' : refEMA,
+    'HiPassFilter' : refHiPassFilter,
+    'IndexIndex' : lambda values, args: range(len(values)),
+    'KAMA' : refKAMA,
+    'LevelIndex' : lambda values, args: [args['level']] * len(values),
+    'LinearRegressionSlope' : refLinearRegressionSlope,
+    'LoPassFilter' : refLoPassFilter,
+    'MACDHistogram' :
+        lambda values, args: values - numeric(args['signal']),
+    'MedianValue' : refMedianValue,
+    'Momentum' : refMomentum,
+    'OffsetIndex' :
+        lambda values, args: values + args['offset'] * values,
+    'PercentConvergence' :
+        lambda values, args: (1 - numeric(args['signal']) / values) * 100,
+    'RateOfChange' : refRateOfChange,
+    'SMA' : refSMA,
+    'Slope' : refChangeIndex,
+    'Stochastic' : refStochastic,
+    'TrueRange' : refTrueRange,
+    'UpMovement' : lambda values, args: refMovement(values, 1),
+    'VerticalHorizontalFilter' : refVerticalHorizontalFilter,
+    'Volatility' : refVolatility,
+    'WMA' : refWMA,
+    'WilliamsR' : refWilliamsR,
+}
+
+
+def checkIndex(cls, cases, chunk=7, rtol=1e-9, atol=1e-9):
+    """ Cross-checks one index type over a set of cases.
+
+    @param cls index class
+    @param cases sequence of (name, values) pairs
+    @param chunk=7 block size for the Series.extend comparison
+    @return list of finding mappings
+    """
+    name = cls.__name__
+    findings = []
+    def report(kind, case, detail):
+        findings.append(dict(index=name, kind=kind, case=case,
+                             detail=str(detail)))
+    def attempt(case, *args, **kwds):
+        try:
+            return build(cls, *args, **kwds)
+        except (Exception, ), exc:
+            report('error', case, '%s: %s' % (exc.__class__.__name__, exc))
+    for case, values in cases:
+        result = attempt(case, values)
+        if result is None:
+            continue
+        index, args = result
+        expected = list(index)
+        if name in nondeterministic:
+            continue
+        variants = [('extend', dict(chunk=len(values) or 1)),
+                    ('extend-%s' % chunk, dict(chunk=chunk)),
+                    ('attached', dict(others=True)),
+                    ('lazy', dict(graph=True, chunk=chunk))]
+        for label, kwds in variants:
+            if label.startswith('extend') and \
+                   not hasattr(cls, 'reindexBatch'):
+                continue
+            other = attempt(case, values, **kwds)
+            if other is not None:
+                diff = mismatch(list(other[0]), expected, rtol, atol)
+                if diff:
+                    report('order', case, '%s at %s: %r != %r' %
+                           ((label, ) + diff))
+        reference = references.get(name)
+        if reference:
+            try:
+                with errstate(invalid='ignore'):
+                    wanted = reference(numeric(values), args)
+            except (Exception, ), exc:
+                report('reference', case, 'reference failed: %s' % exc)
+            else:
+                diff = mismatch(expected, list(wanted), rtol, atol)
+                if diff:
+                    report('reference', case, 'at %s: %r != %r' % diff)
+    walk = dict(cases).get('walk', [])
+    if walk:
+        try:
+            index, args = build(cls, walk)
+            before = stateSize(index)
+            for value in walk:
+                index.series.append(value)
+            after = stateSize(index)
+        except (Exception, ), exc:
+            pass
+        else:
+            if after - before > len(walk) / 2:
+                report('leak', 'walk', 'state grew %s bytes over %s values'
+                       % (after - before, len(walk)))
+    return findings
+
+
+##
+# Checks of series behavior shared by all index types.  Each takes the
+# random walk case and returns a list of finding mappings.
+
+def checkShared(values, capacity=100, blocks=(5, 1024, 3, 300)):
+    """ Checks that shared buffers follow a series that discards values
+    faster than they are published.
+
+    @param values sequence of series values
+    @param capacity=100 series capacity
+    @param blocks=(5, 1024, 3, 300) counts of values added between
+    publishes
+    @return list of finding mappings
+    """
+    from profit.series.shared import (SeriesPublisher, SharedBuffer,
+                                      SharedSeries, sharedDirectory)
+    findings = []
+    directory = sharedDirectory()
+    try:
+        series = Series(capacity=capacity)
+        publisher = SeriesPublisher(series, os.path.join(directory, 's'),
+                                    capacity)
+        view = SharedSeries(SharedBuffer(publisher.layout[1]))
+        pos = 0
+        for block in blocks:
+            for i in xrange(block):
+                series.append(values[(pos + i) % len(values)])
+            pos += block
+            publisher.publish()
+            held = min(len(view), len(series))
+            detail = None
+            if view.evicted + len(view) != series.evicted + len(series):
+                detail = 'count %s != %s' % (view.evicted + len(view),
+                                             series.evicted + len(series))
+            elif view[-held:] != series[-held:]:
+                detail = 'values differ after %s' % (pos, )
+            elif list(view.x) != sorted(set(view.x)) or \
+                     view.x[-1] != series.x[-1]:
+                detail = 'x values %s... != %s...' % (view.x[-1:],
+                                                      series.x[-1:])
+            if detail:
+                findings.append(dict(index='SharedSeries', kind='shared',
+                                     case='walk', detail=detail))
+                break
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+    return findings
+
+
+def checkGraphInputs(values):
+    """ Checks that an index with two input series adds values only for
+    the series it follows when scheduled by an IndexGraph.
+
+    @param values sequence of series values
+    @return list of finding mappings
+    """
+    results = []
+    for graph in (None, IndexGraph()):
+        series, signal = Series(), Series()
+        if graph is not None:
+            graph.attach(series)
+            graph.attach(signal)
+        index = series.addIndex('index', Convergence, series, signal)
+        try:
+            for pos, value in enumerate(values):
+                signal.append(value + 1)
+                if pos % 3:
+                    series.append(value)
+        except (Exception, ), exc:
+            return [dict(index='IndexGraph', kind='graph', case='walk',
+                         detail='%s: %s' % (exc.__class__.__name__, exc))]
+        results.append(list(index))
+    diff = mismatch(results[1], results[0])
+    if diff:
+        return [dict(index='IndexGraph', kind='graph', case='walk',
+                     detail='two inputs at %s: %r != %r' % diff)]
+    return []
+
+
+def checkIndependentSignal(values, chunk=7):
+    """ Checks Series.extend against Series.append for indexes with a
+    signal line that is not computed from their series.
+
+    @param values sequence of series values
+    @param chunk=7 block size for Series.extend
+    @return list of finding mappings
+    """
+    findings = []
+    for cls in (Convergence, MACDHistogram, PercentConvergence):
+        results = []
+        for extend in (False, True):
+            series, signal = Series(), Series()
+            index = series.addIndex('index', cls, series, signal)
+            for pos in xrange(0, len(values), chunk):
+                signal.append(values[pos] + 1)
+                block = values[pos:pos+chunk]
+                if extend:
+                    series.extend(block)
+                else:
+                    for value in block:
+                        series.append(value)
+            results.append(list(index))
+        diff = mismatch(results[1], results[0])
+        if diff:
+            findings.append(dict(index=cls.__name__, kind='order',
+                                 case='walk', detail='independent signal '
+                                 'extend at %s: %r != %r' % diff))
+    return findings
+
+
+def checkCapacity(values, capacity=50):
+    """ Checks that Series.extend keeps a series with a capacity and its
+    indexes within that capacity, with and without an IndexGraph.
+
+    @param values sequence of series values
+    @param capacity=50 series capacity, less than the count of values
+    @return list of finding mappings
+    """
+    findings = []
+    for graph in (None, IndexGraph()):
+        series = Series(capacity=capacity)
+        if graph is not None:
+            graph.attach(series)
+        index = series.addIndex('index', SMA, series, 5)
+        series.extend(values)
+        expected = Series()
+        expected.addIndex('index', SMA, expected, 5)
+        for value in values:
+            expected.append(value)
+        detail = None
+        if len(series) > capacity or len(index) > capacity:
+            detail = 'extend kept %s values and %s index values' % \
+                     (len(series), len(index))
+        elif mismatch(list(index), expected.indexes[0][-len(index):]):
+            detail = 'index values differ after extend'
+        if detail:
+            label = 'graph' if graph else 'series'
+            findings.append(dict(index='Series', kind='capacity',
+                                 case='walk', detail='%s %s' %
+                                 (label, detail)))
+    return findings
+
+
+seriesChecks = [checkShared, checkGraphInputs, checkIndependentSignal,
+                checkCapacity, ]
+
+
+def run(names=None, seed=0, rtol=1e-9, atol=1e-9):
+    """ Cross-checks index types.
+
+    @param names=None sequence of index type names; default is all,
+    and the checks in seriesChecks
+    @param seed=0 random number generator seed for the cases
+    @return list of finding mappings
+    """
+    types = indexTypes()
+    if names:
+        types = dict([(k, types[k]) for k in names])
+    cases = edgeCases(seed)
+    findings = []
+    for name in sorted(types):
+        findings.extend(checkIndex(types[name], cases, rtol=rtol, atol=atol))
+    if not names:
+        walk = dict(cases)['walk']
+        for check in seriesChecks:
+            findings.extend(check(walk))
+    return findings
+
+
+def options(args=None):
+    parser = OptionParser(usage='%prog [options]')
+    add_option = parser.add_option
+    add_option('-i', '--index', dest='names', action='append',
+               metavar='NAME', help='index type to check; repeatable')
+    add_option('-r', '--seed', dest='seed', type='int', default=0,
+               help='random walk seed [default:%default]')
+    add_option('-t', '--tolerance', dest='tolerance', type='float',
+               default=1e-9, help='relative and absolute tolerance '
+               '[default:%default]')
+    add_option('-v', '--verbose', dest='verbose', action='store_true',
+               default=False, help='list every finding')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    opts, args = options(args)
+    findings = run(opts.names, opts.seed, opts.tolerance, opts.tolerance)
+    summary = {}
+    for finding in findings:
+        key = (finding['index'], finding['kind'])
+        summary.setdefault(key, []).append(finding)
+        if opts.verbose:
+            print '%(kind)-10s %(index)-26s %(case)-9s %(detail)s' % finding
+    if not opts.verbose:
+        for (index, kind), items in sorted(summary.items()):
+            cases = ', '.join(sorted(set([i['case'] for i in items])))
+            print '%-10s %-26s %s' % (kind, index, cases)
+    return 1 if findings else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,346 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2007 Troy Melhase
+# Distributed under the terms of the GNU General Public License v2
+# Author: Troy Melhase <troy@gci.net>
+
+##
+#
+# This module defines the IndexGraph class, a scheduler for the series
+# and indexes of a single ticker.
+#
+# Without a scheduler, each series updates the indexes in its own
+# 'indexes' list as values arrive, so indexes that read other indexes
+# are only correct when they happen to be listed after their inputs.
+# An IndexGraph instead tracks the inputs of every index and updates
+# all indexes downstream of a changed series in a single pass, in
+# dependency order.  An index adds a value only when the series it
+# follows (its 'series' attribute) does; other inputs are read then.
+#
+# Indexes with a single input and a 'reindexBatch' method are lazy
+# unless marked eager: the graph only counts their pending values, and
+# they catch up in one batch when next read (see BaseIndex), or before
+# a series with a capacity discards values they have not yet seen.
+# Such series are trimmed only between updates, when every pending
+# count refers to values already produced by its input.
+#
+# A graph may be given an IndexCache (see profit.series.cache); lazy
+# indexes computed from the start of their series are then restored
+# from the cache where possible.
+#
+##
+
+from profit.series.basic import Series, lazyIndexType
+
+
+def indexInputs(args, kwds):
+    """ Returns the series (and indexes) found in constructor arguments.
+
+    @param args sequence of positional constructor arguments
+    @param kwds mapping of keyword constructor arguments
+    @return list of Series instances
+    """
+    values = list(args) + [kwds[k] for k in sorted(kwds)]
+    return [v for v in values if isinstance(v, Series)]
+
+
+def indexNodeKey(func, args, kwds):
+    """ Creates a key identifying an index by type, parameters and inputs.
+
+    @param func index class
+    @param args sequence of positional constructor arguments
+    @param kwds mapping of keyword constructor arguments
+    @return hashable key
+    """
+    def ident(value):
+        if isinstance(value, Series):
+            return ('series', id(value))
+        try:
+            hash(value)
+        except (TypeError, ):
+            return ('value', repr(value))
+        return value
+    return (func,
+            tuple([ident(a) for a in args]),
+            tuple([(k, ident(kwds[k])) for k in sorted(kwds)]))
+
+
+def indexSignature(func, args, kwds):
+    """ Creates a string identifying an index by type and parameters.
+
+    Unlike indexNodeKey, the result does not depend on the identity of
+    the input series, so it is the same in every session.
+
+    @param func index class
+    @param args sequence of positional constructor arguments
+    @param kwds mapping of keyword constructor arguments
+    @return string
+    """
+    def ident(value):
+        return 'series' if isinstance(value, Series) else value
+    return repr(('%s.%s' % (func.__module__, func.__name__),
+                 [ident(a) for a in args],
+                 [(k, ident(kwds[k])) for k in sorted(kwds)]))
+
+
+class IndexGraph(object):
+    """ Dependency graph and scheduler for the indexes of one ticker.
+
+    Indexes are kept in dependency order.  Because an index can only
+    be constructed from inputs that already exist, the order in which
+    nodes are added is a topological order of the graph.  Indexes
+    requested more than once with the same type, parameters and
+    inputs are created only once and shared.
+    """
+    def __init__(self, cache=None):
+        self.cache = cache
+        self.signatures = {}
+        self.nodes = {}
+        self.inputs = {}
+        self.order = []
+        self.plans = {}
+        self.lazy = set()
+        self.overflow = []
+        self.running = False
+
+    def __len__(self):
+        return len(self.order)
+
+    def attach(self, series):
+        """ Makes this graph the scheduler for a series.
+
+        @param series Series instance
+        @return series
+        """
+        series.scheduler = self
+        return series
+
+    def addIndex(self, owner, key, func, *args, **kwds):
+        """ Creates or reuses an index and lists it with its owner.
+
+        @param owner Series instance that lists the index
+        @param key index key, used when the index is created
+        @param func index class
+        @return index instance
+        """
+        nodeKey = indexNodeKey(func, args, kwds)
+        try:
+            index = self.nodes[nodeKey]
+        except (KeyError, ):
+            index = func(*args, **kwds)
+            index.key = key
+            index.scheduler = self
+            self.nodes[nodeKey] = index
+            self.inputs[id(index)] = inputs = indexInputs(args, kwds)
+            series = getattr(index, 'series', None)
+            if hasattr(index, 'reindexBatch') and \
+                   [id(i) for i in inputs] == [id(series)]:
+                self.lazy.add(id(index))
+                index.__class__ = lazyIndexType(type(index))
+                self.signatures[id(index)] = indexSignature(func, args, kwds)
+            self.order.append(index)
+            self.plans.clear()
+        if not [i for i in owner.indexes if i is index]:
+            owner.indexes.append(index)
+        return index
+
+    def plan(self, series):
+        """ Sequence of indexes downstream of a series, in update order.
+
+        An index is downstream of the series it follows (see 'primary')
+        and of everything downstream of that.  Its other inputs, such
+        as the signal line of a Convergence index, are only read when
+        it is updated; their new values do not add index values.
+
+        @param series Series instance
+        @return list of index instances
+        """
+        key = id(series)
+        try:
+            return self.plans[key]
+        except (KeyError, ):
+            marked = set([key])
+            plan = []
+            for index in self.order:
+                if id(self.primary(index)) in marked:
+                    marked.add(id(index))
+                    plan.append(index)
+            self.plans[key] = plan
+            return plan
+
+    def primary(self, index):
+        """ The input an index produces one value for each value of.
+
+        This is the 'series' attribute of the index, or its first input
+        if it has none.
+
+        @param index index instance
+        @return Series instance or None
+        """
+        series = getattr(index, 'series', None)
+        if series is None:
+            inputs = self.inputs[id(index)]
+            series = inputs[0] if inputs else None
+        return series
+
+    def deferred(self, index):
+        """ True if updates to an index are counted instead of computed.
+
+        @param index index instance
+        @return True if index is lazy or still has pending values
+        """
+        return bool(index.pending) or \
+               (id(index) in self.lazy and not index.eager)
+
+    def refresh(self, index):
+        """ Brings a lazy index up to date with its series.
+
+        Called by the index when it is read with pending values.
+
+        @param index index instance
+        @return None
+        """
+        pending = index.pending
+        if not pending:
+            return
+        index.pending = 0
+        running, self.running = self.running, True
+        try:
+            self.reindexBatch(index, len(index.series) - pending)
+            self.bound(index)
+        finally:
+            self.running = running
+        if not running:
+            self.settle()
+
+    def reindexBatch(self, index, start):
+        """ Updates an index from a series position, using the cache.
+
+        @param index index instance
+        @param start position of the first series value to process
+        @return None
+        """
+        cache = self.cache
+        if cache is None or id(index) not in self.signatures:
+            index.reindexBatch(start)
+        else:
+            cache.reindexBatch(index, start, self.signatures[id(index)])
+
+    def update(self, series):
+        """ Updates every index downstream of a series.
+
+        Called by Series.append.  Values appended by the indexes
+        themselves during the update are ignored here; their
+        dependents are already part of the plan.
+
+        @param series Series instance with a new value
+        @return None
+        """
+        if self.running:
+            return
+        self.running = True
+        try:
+            for index in self.plan(series):
+                if self.deferred(index):
+                    index.pending += 1
+                    if index.eager:
+                        self.refresh(index)
+                else:
+                    index.reindex()
+        finally:
+            self.running = False
+        self.settle()
+
+    def extend(self, series, values):
+        """ Appends values to a series and updates its downstream indexes.
+
+        Called by Series.extend.  If every downstream index is lazy,
+        or supports 'reindexBatch' and follows its primary series
+        through the plan, each is updated once for the block (lazy
+        indexes only count the new values); otherwise values are
+        appended individually.
+
+        @param series Series instance
+        @param values list of values
+        @return None
+        """
+        if self.running:
+            series.store(values)
+            return
+        plan = self.plan(series)
+        nodes = set([id(index) for index in plan] + [id(series)])
+        batch = [index for index in plan if self.deferred(index)
+                 or (hasattr(index, 'reindexBatch')
+                     and id(getattr(index, 'series', None)) in nodes)]
+        if len(batch) != len(plan):
+            for value in values:
+                series.append(value)
+            return
+        series.store(values)
+        count = len(values)
+        self.running = True
+        try:
+            for index in plan:
+                if self.deferred(index):
+                    index.pending += count
+                else:
+                    self.reindexBatch(index, len(index.series) - count)
+            self.bound(series)
+            for index in plan:
+                self.bound(index)
+        finally:
+            self.running = False
+        self.settle()
+
+    def evict(self, series):
+        """ Discards values beyond the capacity of a series.
+
+        Called by Series.evict.  While indexes are being updated the
+        lazy indexes downstream of the series may be counting values
+        their inputs have not yet produced, so the series is trimmed
+        once the update is complete.
+
+        @param series Series instance
+        @return None
+        """
+        if not self.running:
+            series.trim()
+        elif not [s for s in self.overflow if s is series]:
+            self.overflow.append(series)
+
+    def bound(self, series):
+        """ Discards values of a series a batch took past its capacity.
+
+        Series.append keeps a series with a capacity below twice that
+        many values; a batch may add any number, so the series is held
+        to the same bound afterwards.  Pending values of a lazy index
+        are not counted; they are bounded when it catches up.
+
+        @param series Series instance
+        @return None
+        """
+        capacity = series.capacity
+        if capacity and list.__len__(series) >= 2*capacity:
+            self.evict(series)
+
+    def settle(self):
+        """ Trims the series that exceeded their capacity during an update.
+
+        @return None
+        """
+        overflow = self.overflow
+        while overflow:
+            overflow.pop(0).trim()
+
+    def flush(self, series):
+        """ Brings every lazy index downstream of a series up to date.
+
+        Called by Series.trim before values are discarded.
+
+        @param series Series instance
+        @return None
+        """
+        for index in self.plan(series):
+            if index.pending:
+                self.refresh(index)
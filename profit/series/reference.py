@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2007 Troy Melhase
+# Distributed under the terms of the GNU General Public License v2
+# Author: Troy Melhase <troy@gci.net>
+
+##
+#
+# This module keeps previous implementations of index types that have
+# been rewritten for speed or memory use, so that the benchmark (see
+# profit.series.benchmark) can measure the current implementations
+# against them:
+#
+#     python -m profit.series.benchmark -a -i KAMA -i MAMA
+#     python -m profit.series.benchmark -p -i DistanceCoefficient
+#
+# These classes are not index types; they are not listed by
+# profit.series.indexTypes and should not be used by strategies.  Each
+# computes its values one tick at a time with 'reindex' only, as the
+# previous implementation did, and keeps its history in unbounded
+# lists.
+#
+##
+
+from numpy import arctan, log, mean
+
+from profit.series.basic import MovingAverageIndex
+
+
+class PreviousDistanceCoefficient(MovingAverageIndex):
+    """ DistanceCoefficient before it became a sliding-window filter.
+
+    Every pairwise distance in the window is recomputed on each tick,
+    O(periods**2) work; the averaging loop reuses the stale 'i' of the
+    distance loop, so values differ from the current filter.
+    """
+    def __init__(self, series, periods):
+        MovingAverageIndex.__init__(self, series, periods)
+
+    def reindex(self):
+        series = self.series
+        periods = self.periods
+        period = self.series[-periods:]
+        dists = [0, ] * periods
+        coeff = [0, ] * periods
+        try:
+            for i in range(-1, -periods, -1):
+                for k in range(-2, -periods, -1):
+                    dists[i] = dists[i] + (series[i] - series[i+k]) * (series[i] - series[i+k])
+                coeff[i] = dists[i]
+            num = sumcoeff = 0
+            for k in range(periods):
+                num += coeff[i]*period[i]
+                sumcoeff += coeff[i]
+            if sumcoeff:
+                filt = num / sumcoeff
+            else:
+                filt = 0
+        except (IndexError, ):
+            filt = None
+        self.append(filt)
+
+
+class PreviousEMA(MovingAverageIndex):
+    """ EMA before its state was kept in an EMAState.
+
+    """
+    def __init__(self, series, periods, k=2.0):
+        MovingAverageIndex.__init__(self, series, periods)
+        self.k = k
+
+    def reindex(self):
+        try:
+            last = self[-1]
+        except (IndexError, ):
+            self.append(None)
+            return
+        periods = self.periods
+        ema = None
+        if last is None:
+            try:
+                period = self.series[-periods:]
+                if len(period) == periods:
+                    ema = mean(period)
+            except (TypeError, ):
+                pass
+        else:
+            pt = self.series[-1]
+            k = self.k / (periods + 1)
+            ema = last + (k * (pt - last))
+        self.append(ema)
+
+
+class PreviousKAMA(MovingAverageIndex):
+    """ KAMA before its changes were kept in a rolling buffer.
+
+    """
+    def __init__(self, series, periods, fast_look=2, slow_look=30):
+        MovingAverageIndex.__init__(self, series, periods)
+        self.fastest = 2.0 / (fast_look+1)
+        self.slowest = 2.0 / (slow_look+1)
+        self.efficiency_factor = (self.fastest - self.slowest) + self.slowest
+
+    def reindex(self):
+        series = self.series
+        periods = self.periods
+        last = series[-1]
+        try:
+            prev = series[-2]
+        except (IndexError, ):
+            self.append(last)
+            return
+        noise = 0
+        eff = 1
+        try:
+            p1 = series[-periods:]
+            p2 = series[-periods-1:-1]
+            noise = sum([abs(a-b) for a, b in zip(p1, p2)])
+        except (IndexError, ):
+            pass
+        if noise:
+            eff = abs(last - prev) / noise
+        s = eff * self.efficiency_factor
+        s = s * s
+        kama = s*last + (1-s)*self[-1]
+        self.append(kama)
+
+
+class PreviousSmoothedRSI(MovingAverageIndex):
+    """ SmoothedRSI before its smoothing history was bounded.
+
+    """
+    def __init__(self, series, periods):
+        MovingAverageIndex.__init__(self, series, periods)
+        self.smooth = []
+
+    def reindex(self):
+        periods = self.periods
+        period = self.series[-periods:]
+        smooth = self.smooth
+        try:
+            s = (period[-1] + 2*period[-2] + 2*period[-3] + period[-4]) / 6.0
+            smooth.append(s)
+        except (IndexError, ):
+            self.append(0)
+            return
+        smooth.append(s)
+        cu = cd = 0
+        try:
+            for count in range(1, periods):
+                s = smooth[-count]
+                ps = smooth[-count-1]
+                if s > ps:
+                    cu += s - ps
+                if s < ps:
+                    cd += ps - s
+        except (IndexError, ):
+            self.append(0)
+            return
+        try:
+            srsi = cu/(cu+cd)
+        except (ZeroDivisionError, ):
+            srsi = 0
+        self.append(srsi)
+
+
+class PreviousFisherTransform(MovingAverageIndex):
+    """ FisherTransform before it kept only its previous values.
+
+    """
+    def __init__(self, series, periods):
+        MovingAverageIndex.__init__(self, series, periods)
+        self.inter = []
+
+    def reindex(self):
+        periods = self.periods
+        period = self.series[-periods:]
+        current = period[-1]
+        mx = max(period)
+        mn = min(period)
+        try:
+            inter = 0.33 * 2 * ((current - mn) / (mx - mn) - 0.5) + \
+                    (0.67 * self.inter[-1])
+            if inter > 0.99:
+                inter = 0.99
+            elif inter < -0.99:
+                inter = -0.99
+            fish = 0.5 * log((1 + inter) / (1 - inter)) + (0.5 * self[-1])
+        except (TypeError, IndexError, ZeroDivisionError, ):
+            inter = 0
+            fish = 0
+        self.inter.append(inter)
+        self.append(fish)
+
+
+class PreviousMAMA(MovingAverageIndex):
+    """ MAMA before its histories became bounded lag buffers.
+
+    The previous code assigned the clamped period to 'prs' instead of
+    'pra', which raised TypeError; that line is corrected here so the
+    class can be measured.
+    """
+    fast_limit = 0.5
+    slow_limit = 0.05
+
+    def __init__(self, series, periods):
+        MovingAverageIndex.__init__(self, series, periods)
+        self.hist = {'q1':[], 'i1':[], 'q2':[], 'i2':[], 're':[], 'im':[],
+                     'sms':[], 'dts':[], 'prs':[], 'sps':[], 'phs':[], }
+
+    def reindex(self):
+        hist = self.hist
+        sms, dts, prs, sps, phs = \
+            hist['sms'], hist['dts'], hist['prs'], hist['sps'], hist['phs']
+        q1, i1, q2, i2, re, im = \
+            hist['q1'], hist['i1'], hist['q2'], hist['i2'], hist['re'], hist['im']
+        series = self.series
+        periods = self.periods
+        if len(series) > periods:
+            sm = sum((4*series[-1], 3*series[-2], 2*series[-3], series[-4])) / 10
+            sms.append(sm)
+            dt = (0.0962*sms[-1] + 0.5769*sms[-3] - 0.5769*sms[-5] - 0.0962*sms[-7]) * (0.075*prs[-2] + 0.54)
+            dts.append(dt)
+            qa = (.0962*dts[-1] + 0.5769*dts[-3] - 0.5769*dts[-5] - 0.0962*dts[-7]) * (0.075*prs[-2] + 0.54)
+            q1.append(qa)
+            ia = dts[-4]
+            i1.append(ia)
+            jI = (0.0962*i1[-1] + 0.5769*i1[-3] - 0.5769*i1[-5] - 0.0962*i1[-7]) * (0.075*prs[-2] + 0.54)
+            jQ = (0.0962*q1[-1] + 0.5769*q1[-3] - 0.5769*q1[-5] - 0.0962*q1[-7]) * (0.075*prs[-2] + 0.54)
+            ib = i1[-1] - jQ
+            qb = q1[-1] - jI
+            ib = 0.2*ib + 0.8*i2[-1]
+            qb = 0.2*qb + 0.8*q2[-1]
+            i2.append(ib)
+            q2.append(qb)
+            ra = i2[-1]*i2[-2] + q2[-1]*q2[-2]
+            ima = i2[-1]*q2[-2] - q2[-1]*i2[-2]
+            ra = 0.2*ra + 0.8*re[-1]
+            ima = 0.2*ra + 0.8*im[-1]
+            re.append(ra)
+            im.append(ima)
+            if im[-1] != 0 and re[-1] != 0:
+                pra = 360 / arctan(im[-1]/re[-1])
+            else:
+                pra = 0
+            if pra > 1.5*prs[-1]: pra = 1.5*prs[-1]
+            if pra < 0.67*prs[-1]: pra = 0.67*prs[-1]
+            if pra < 6: pra = 6
+            if pra > 50: pra = 50
+            pra = 0.2*pra + 0.8*prs[-1]
+            prs.append(pra)
+            spa = 0.33*prs[-1] + 0.67*sps[-1]
+            sps.append(spa)
+            if i1[-1] != 0:
+                ph = arctan(q1[-1] / i1[-1])
+            else:
+                ph = 0
+            phs.append(ph)
+            dp = phs[-2] - phs[-1]
+            if dp < 1: dp = 1
+            alpha = self.fast_limit / dp
+            if alpha < self.slow_limit: alpha = self.slow_limit
+            mama = alpha*series[-1] + (1 - alpha)*self[-1]
+            self.append(mama)
+        else:
+            last = series[-1]
+            for vlst in hist.values():
+                vlst.append(last)
+            self.append(last)
+
+
+def referenceTypes():
+    """ Creates mapping of index class names to previous implementations.
+
+    @return index class name to reference class mapping
+    """
+    return {
+        'DistanceCoefficient' : PreviousDistanceCoefficient,
+        'EMA' : PreviousEMA,
+        'FisherTransform' : PreviousFisherTransform,
+        'KAMA' : PreviousKAMA,
+        'MAMA' : PreviousMAMA,
+        'SmoothedRSI' : PreviousSmoothedRSI,
+    }
@@ -0,0 +1,488 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2007 Troy Melhase
+# Distributed under the terms of the GNU General Public License v2
+# Author: Troy Melhase <troy@gci.net>
+
+##
+#
+# This module computes series and their indexes in worker processes.
+#
+# A SeriesPool starts a number of worker processes and assigns each
+# ticker to one of them.  Tick values are sent to the worker that owns
+# the ticker, which builds its series with the strategy's series
+# factory and computes their indexes as usual.
+#
+# Values flow back through shared memory: every series and index in a
+# worker is published to a SharedBuffer, a fixed-size ring of doubles
+# in a memory-mapped file.  The pool gives the consumer process a
+# SharedSeries for each series, a read-only view of the buffers with
+# the parts of the Series interface that plots and strategies use
+# (len, indexing, slicing, 'x', 'y', 'indexes' and 'key'), plus 'xy'
+# to read 'x' and 'y' from one copy of the values.  Nothing is pickled
+# on the way back except the layout of each new series.
+#
+# The ring of a series or index with a capacity holds twice that many
+# values.  Other rings hold the pool's ring size (SeriesPool.defaultSize
+# values unless given), and older values are discarded from them; a
+# warning is logged the first time this happens for a ticker series.
+#
+# Workers are forked, so the factory and the strategy it belongs to
+# are copied into each worker when the pool starts; later changes to
+# the strategy are not seen by the workers.
+#
+##
+
+import atexit
+import logging
+import os
+import shutil
+from array import array
+from itertools import count as counter
+from mmap import mmap, ACCESS_READ
+from multiprocessing import Process, Queue
+from Queue import Empty
+from struct import calcsize, pack_into, unpack_from
+from tempfile import mkdtemp
+
+
+##
+# Buffer file header: count of values ever written, and ring size.
+headerFormat = '<qq'
+headerSize = calcsize(headerFormat)
+valueSize = calcsize('<d')
+missing = float('nan')
+
+
+def sharedDirectory():
+    """ Creates a directory for buffer files, in memory if possible.
+
+    @return directory name
+    """
+    shm = '/dev/shm'
+    return mkdtemp(prefix='profit-', dir=shm if os.path.isdir(shm) else None)
+
+
+class SharedBuffer(object):
+    """ Ring of the most recent values of a series in a shared file.
+
+    The buffer has a single writer.  Values are written before the
+    count in the header, so a reader never sees a count that includes
+    values not yet written; see 'snapshot' for values overwritten
+    while they are read.  Missing values (None) are stored as nan.
+    """
+    def __init__(self, filename, size=None):
+        """ Initializer.
+
+        @param filename name of buffer file
+        @param size=None ring size; if given, the file is created for
+        writing, otherwise an existing file is opened for reading
+        """
+        self.filename = filename
+        if size:
+            handle = open(filename, 'w+b')
+            handle.truncate(headerSize + size*valueSize)
+            self.map = mmap(handle.fileno(), 0)
+            pack_into(headerFormat, self.map, 0, 0, size)
+        else:
+            handle = open(filename, 'rb')
+            self.map = mmap(handle.fileno(), 0, access=ACCESS_READ)
+        handle.close()
+        self.size = unpack_from(headerFormat, self.map, 0)[1]
+        self.written = 0
+
+    def count(self):
+        """ Count of values ever written to this buffer.
+
+        """
+        return unpack_from('<q', self.map, 0)[0]
+
+    def write(self, values, position=None):
+        """ Appends values to this buffer.
+
+        @param values sequence of floats or None
+        @param position=None absolute position of the first value; the
+        values between the count written and this position were lost
+        before they could be written, and are stored as missing
+        @return None
+        """
+        shared, size = self.map, self.size
+        skipped = 0 if position is None else max(position - self.written, 0)
+        if skipped:
+            values = [None] * min(skipped, size) + list(values)
+        start = self.written + skipped - min(skipped, size)
+        written = start + max(len(values) - size, 0)
+        for value in values[-size:]:
+            offset = headerSize + (written % size)*valueSize
+            pack_into('<d', shared, offset,
+                      missing if value is None else value)
+            written += 1
+        written = start + len(values)
+        pack_into('<q', shared, 0, written)
+        self.written = written
+
+    def value(self, position):
+        """ Value at an absolute position.
+
+        @param position count of values written before the value
+        @return float or None
+        @raise IndexError if the value is not in the buffer
+        """
+        total = self.count()
+        if not (total - self.size <= position < total) or position < 0:
+            raise IndexError('shared series index out of range')
+        offset = headerSize + (position % self.size)*valueSize
+        value = unpack_from('<d', self.map, offset)[0]
+        if self.count() - self.size > position:
+            raise IndexError('shared series value overwritten')
+        return None if value != value else value
+
+    def read(self, start=0, stop=None):
+        """ Copies the values at a range of absolute positions.
+
+        Only the part of the ring holding the range is copied.  Values
+        overwritten while they are read are dropped from the front.
+
+        @param start=0 absolute position of the first value
+        @param stop=None absolute position after the last value, or
+        None for the count of values written
+        @return two-tuple of (absolute position of first value, list
+        of values)
+        """
+        size = self.size
+        before = self.count()
+        if stop is None or stop > before:
+            stop = before
+        start = max(start, before - size, 0)
+        if start >= stop:
+            return start, []
+        values = array('d')
+        offset = start % size
+        head = min(stop - start, size - offset)
+        begin = headerSize + offset*valueSize
+        values.fromstring(self.map[begin:begin + head*valueSize])
+        if stop - start > head:
+            tail = stop - start - head
+            values.fromstring(self.map[headerSize:headerSize + tail*valueSize])
+        after = self.count()
+        first = max(after - size + (after != before), 0)
+        if first > start:
+            values = values[first - start:]
+            start = first
+        return start, [None if v != v else v for v in values]
+
+    def snapshot(self):
+        """ Copies the values currently in this buffer.
+
+        @return two-tuple of (absolute position of first value, list
+        of values)
+        """
+        return self.read()
+
+
+class SharedSeries(object):
+    """ Read-only view of a series computed in a worker process.
+
+    """
+    def __init__(self, buffer, key=None, indexes=()):
+        """ Initializer.
+
+        @param buffer SharedBuffer instance
+        @param key=None index key, or None for a ticker series
+        @param indexes=() sequence of SharedSeries for the indexes
+        """
+        self.buffer = buffer
+        self.key = key
+        self.indexes = list(indexes)
+        self.capacity = buffer.size
+        self.points = (None, [], [])
+
+    def __len__(self):
+        return min(self.buffer.count(), self.buffer.size)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            if key.step in (None, 1):
+                start, stop, step = key.indices(len(self))
+                return self.__getslice__(start, stop)
+            return self.snapshot()[1][key]
+        total = self.buffer.count()
+        if key < 0:
+            key += min(total, self.buffer.size)
+        return self.buffer.value(total - min(total, self.buffer.size) + key)
+
+    def __getslice__(self, i, j):
+        total = self.buffer.count()
+        held = min(total, self.buffer.size)
+        evicted = total - held
+        i, j = min(max(i, 0), held), min(max(j, 0), held)
+        return self.buffer.read(evicted + i, evicted + j)[1]
+
+    def __iter__(self):
+        return iter(self.snapshot()[1])
+
+    def __repr__(self):
+        return '<SharedSeries %s %s>' % (self.key, self.buffer.filename)
+
+    def snapshot(self):
+        """ Copies the values currently held by this series.
+
+        @return two-tuple of (absolute position of first value, list
+        of values)
+        """
+        return self.buffer.snapshot()
+
+    def evictedGetter(self):
+        total = self.buffer.count()
+        return total - min(total, self.buffer.size)
+
+    evicted = property(evictedGetter)
+
+    def xy(self):
+        """ Positions and values of the points of this series.
+
+        Both lists come from one snapshot, which is kept until more
+        values are written; read 'x' and 'y' together through this
+        method, as separate reads may see different snapshots.
+
+        @return two-tuple of 'x' and 'y' value lists
+        """
+        total = self.buffer.count()
+        points = self.points
+        if points[0] != total:
+            first, values = self.snapshot()
+            x = [first+i for i, v in enumerate(values) if v is not None]
+            y = [v for v in values if v is not None]
+            points = self.points = (total, x, y)
+        return points[1], points[2]
+
+    x = property(lambda self:self.xy()[0])
+    y = property(lambda self:self.xy()[1])
+
+
+def seriesNodes(series):
+    """ Yields a series and each of its indexes, depth first.
+
+    @param series Series instance
+    @return generator of (depth, key, series or index) tuples
+    """
+    pending = [(0, None, series)]
+    while pending:
+        depth, key, node = pending.pop()
+        yield depth, key, node
+        children = getattr(node, 'indexes', [])
+        pending.extend([(depth+1, i.key, i) for i in reversed(children)])
+
+
+class SeriesPublisher(object):
+    """ Copies the values of a series and its indexes to shared buffers.
+
+    """
+    def __init__(self, series, prefix, size):
+        """ Initializer.
+
+        @param series Series instance
+        @param prefix file name prefix for the buffers
+        @param size ring size for series without a capacity
+        """
+        self.targets = targets = []
+        self.uncapped = uncapped = []
+        buffers = {}
+        names = counter()
+        stack = []
+        for depth, key, node in seriesNodes(series):
+            if id(node) in buffers:
+                buffer = buffers[id(node)]
+            else:
+                capacity = getattr(node, 'capacity', None)
+                filename = '%s-%s' % (prefix, names.next())
+                buffer = SharedBuffer(filename, 2*capacity if capacity else size)
+                buffers[id(node)] = buffer
+                targets.append((node, buffer))
+                if not capacity:
+                    uncapped.append(buffer)
+            item = (key, buffer.filename, [])
+            del stack[depth:]
+            if stack:
+                stack[-1][2].append(item)
+            stack.append(item)
+        self.layout = stack[0]
+
+    def publish(self):
+        """ Writes the values added since the last call.
+
+        Reading a lazy index here brings it up to date.  Values the
+        series discarded before they were written are stored as
+        missing, so that buffer positions match series positions.
+
+        @return None
+        """
+        for node, buffer in self.targets:
+            retained = len(node)
+            evicted = getattr(node, 'evicted', 0)
+            if evicted + retained > buffer.written:
+                first = max(buffer.written - evicted, 0)
+                buffer.write(node[first:], evicted + first)
+        for buffer in self.uncapped:
+            if buffer.written > buffer.size:
+                logging.warning('Shared series %s keeps only its last %s '
+                                'values; give the series a capacity or '
+                                'raise the ring size', buffer.filename,
+                                buffer.size)
+                self.uncapped = []
+                break
+
+
+def workerMain(factory, directory, size, requests, results):
+    """ Computes the series of the tickers assigned to a worker.
+
+    @param factory callable taking (tickerId, field), returning a Series
+    @param directory directory for buffer files
+    @param size ring size for series without a capacity
+    @param requests Queue of (tickerId, field, value) tuples; None stops
+    @param results Queue for ('series', tickerId, field, layout) and
+    ('error', tickerId, field, message) tuples
+    @return None
+    """
+    publishers = {}
+    series = {}
+    running = True
+    while running:
+        batch = [requests.get()]
+        try:
+            while len(batch) < 1024:
+                batch.append(requests.get_nowait())
+        except (Empty, ):
+            pass
+        touched = {}
+        for request in batch:
+            if request is None:
+                running = False
+                break
+            tickerId, field, value = request
+            key = (tickerId, field)
+            try:
+                target = series[key]
+            except (KeyError, ):
+                try:
+                    target = series[key] = factory(tickerId, field)
+                    prefix = os.path.join(directory, '%s-%s' % key)
+                    publishers[key] = publisher = \
+                        SeriesPublisher(target, prefix, size)
+                except (Exception, ), exc:
+                    results.put(('error', tickerId, field, str(exc)))
+                    series[key] = target = None
+                else:
+                    results.put(('series', tickerId, field, publisher.layout))
+            if target is not None:
+                target.append(value)
+                touched[key] = publishers[key]
+        for publisher in touched.values():
+            publisher.publish()
+
+
+class SeriesPool(object):
+    """ Pool of worker processes computing series for a set of tickers.
+
+    """
+    defaultSize = 2**15
+
+    def __init__(self, factory, workers, size=None):
+        """ Initializer.
+
+        @param factory callable taking (tickerId, field), returning a
+        Series with its indexes; usually a strategy 'makeTickerSeries'
+        @param workers number of worker processes
+        @param size=None ring size for series without a capacity
+        """
+        self.factory = factory
+        self.workers = workers
+        self.size = size or self.defaultSize
+        self.assignments = {}
+        self.processes = []
+        self.requests = []
+        self.results = None
+        self.directory = None
+
+    def start(self):
+        """ Starts the worker processes.
+
+        @return None
+        """
+        self.directory = sharedDirectory()
+        self.results = Queue()
+        for number in range(self.workers):
+            requests = Queue()
+            process = Process(target=workerMain,
+                              args=(self.factory, self.directory, self.size,
+                                    requests, self.results))
+            process.daemon = True
+            process.start()
+            self.requests.append(requests)
+            self.processes.append(process)
+        atexit.register(self.close)
+
+    def append(self, tickerId, field, value):
+        """ Sends a value to the worker computing a ticker series.
+
+        Tickers are assigned to workers in turn as they first appear.
+
+        @param tickerId ticker id
+        @param field ticker data field id
+        @param value new series value
+        @return None
+        """
+        if not self.processes:
+            self.start()
+        assignments = self.assignments
+        try:
+            worker = assignments[tickerId]
+        except (KeyError, ):
+            worker = assignments[tickerId] = len(assignments) % self.workers
+        self.requests[worker].put((tickerId, field, value))
+
+    def poll(self):
+        """ Collects the series created by the workers since the last call.
+
+        @return list of (tickerId, field, SharedSeries) tuples
+        """
+        created = []
+        if self.results is None:
+            return created
+        buffers = {}
+        def mirror((key, filename, children)):
+            try:
+                buffer = buffers[filename]
+            except (KeyError, ):
+                buffer = buffers[filename] = SharedBuffer(filename)
+            return SharedSeries(buffer, key, [mirror(c) for c in children])
+        while True:
+            try:
+                kind, tickerId, field, detail = self.results.get_nowait()
+            except (Empty, ):
+                break
+            if kind == 'series':
+                created.append((tickerId, field, mirror(detail)))
+            else:
+                logging.debug('Series worker error for %s %s: %s',
+                              tickerId, field, detail)
+        return created
+
+    def close(self):
+        """ Stops the worker processes and removes the buffer files.
+
+        Existing SharedSeries remain readable.
+
+        @return None
+        """
+        for requests in self.requests:
+            requests.put(None)
+        for process in self.processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+        self.requests, self.processes = [], []
+        if self.directory:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
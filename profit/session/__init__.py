@@ -25,13 +25,15 @@ from profit.models.tickers import TickersModel
 from profit.session import collection
 from profit.session.savethread import SaveThread
 from profit.session.requestthread import RequestThread
+from profit.session.tracing import LatencyTracer
 from profit.strategy.builder import SessionStrategyBuilder
 
 
 class DataMaps(object):
     def __init__(self, session):
         self.account = collection.AccountCollection(session)
-        self.ticker = collection.TickerCollection(session)
+        self.ticker = collection.TickerCollection(session, session.workers,
+                                                   session.ringSize)
 
 
 class DataModels(object):
@@ -48,8 +50,13 @@ class Session(QObject):
     """ This is the big-honkin Session class.
 
     """
-    def __init__(self, strategy=None):
+    tracer = None
+
+    def __init__(self, strategy=None, workers=0, tracing=False,
+                 ringSize=None):
         QObject.__init__(self)
+        self.workers = workers
+        self.ringSize = ringSize
         self.requestThread = requestThread = RequestThread(self)
         requestThread.start()
         self.strategy = strategy if strategy else SessionStrategyBuilder(self)
@@ -60,6 +67,7 @@ class Session(QObject):
         self.savedLength = 0
         self.maps = DataMaps(self)
         self.models = DataModels(self)
+        self.setTracing(tracing)
 
     def __str__(self):
         """ x.__str__() <==> str(x)
@@ -84,6 +92,19 @@ class Session(QObject):
         """
         return len(self.messages) != self.savedLength
 
+    def setTracing(self, enabled):
+        """ Starts or stops latency tracing of messages and orders.
+
+        @param enabled if True, creates a LatencyTracer as the 'tracer'
+        attribute of this object, otherwise removes it
+        @return None
+        """
+        if enabled and self.tracer is None:
+            self.tracer = LatencyTracer()
+        elif not enabled:
+            self.tracer = None
+        self.strategy.setTracer(self.tracer)
+
     def register(self, obj, name, other=None):
         """ Connects TWS message signal sent from this object to another.
 
@@ -206,6 +227,9 @@ class Session(QObject):
         @keyparam mtime=time message timestamp or function to generate timestamp
         @return None
         """
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.ingest(message)
         try:
             mtime = mtime()
         except (TypeError, ):
@@ -217,7 +241,12 @@ class Session(QObject):
         typeName = message.typeName
         typedMessages = self.messagesTyped.setdefault(typeName, [])
         typedMessages.append(current + (len(messages), ))
-        self.emit(SIGNAL(typeName), message)
+        if tracer is not None:
+            tracer.stamp('dispatch')
+            self.emit(SIGNAL(typeName), message)
+            tracer.finish()
+        else:
+            self.emit(SIGNAL(typeName), message)
 
     def requestTickers(self):
         """ Request market data and depth for each of the strategy contracts.
@@ -433,5 +462,21 @@ class Session(QObject):
                                    openClose='O',
                                    )
         order.m_lmtPrice = contract.m_auxPrice = price
-        self.connection.placeOrder(orderId, contract, order)
+        self.placeOrder(orderId, contract, order)
         return True
+
+    def placeOrder(self, orderId, contract, order):
+        """ Sends an order to TWS.
+
+        Strategies should place orders with this method rather than
+        with the connection, so that latency tracing sees them.
+
+        @param orderId order id
+        @param contract Contract instance
+        @param order Order instance
+        @return None
+        """
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.sent(orderId)
+        self.connection.placeOrder(orderId, contract, order)
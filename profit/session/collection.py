@@ -13,6 +13,7 @@ from cPickle import PicklingError, UnpicklingError, dump, load
 from PyQt4.QtCore import QObject, QThread
 from profit.lib import logging
 from profit.lib import Signals
+from profit.series.shared import SeriesPool
 
 
 class DataCollection(QObject):
@@ -84,10 +85,26 @@ class ContractDataCollection(DataCollection):
 
 
 class TickerCollection(DataCollection):
+    """ Ticker data for a session, keyed by ticker id.
+
+    With 'workers' greater than zero, ticker series and their indexes
+    are computed by a SeriesPool in that many worker processes.  The
+    series stored here are then SharedSeries views of the results,
+    created (and announced with createdSeries) when a worker reports
+    them; their values may lag the most recent tick slightly.  Series
+    without a capacity keep only the last 'ringSize' values in that
+    mode (SeriesPool.defaultSize unless given).
+    """
     sessionResendSignals = [Signals.createdSeries, Signals.createdTicker, ]
+    pollInterval = 50
 
-    def __init__(self, session):
+    def __init__(self, session, workers=0, ringSize=None):
         DataCollection.__init__(self, session)
+        self.pool = None
+        if workers:
+            self.pool = SeriesPool(session.strategy.makeTickerSeries, workers,
+                                   ringSize)
+            self.startTimer(self.pollInterval)
         ## have to make the strategy symbols lazy somehow
         for tid in session.strategy.symbols().values():
             self[tid] = session.strategy.makeTicker(tid)
@@ -105,14 +122,35 @@ class TickerCollection(DataCollection):
         except (AttributeError, ):
             value = message.size
         field = message.field
-        try:
-            seq = tickerdata.series[field]
-        except (KeyError, ):
-            seq = tickerdata.series[field] = \
-                  self.session.strategy.makeTickerSeries(tickerId, field)
+        if self.pool is not None:
+            self.pool.append(tickerId, field, value)
+        else:
+            try:
+                seq = tickerdata.series[field]
+            except (KeyError, ):
+                seq = tickerdata.series[field] = \
+                      self.session.strategy.makeTickerSeries(tickerId, field)
+                self.emit(Signals.createdSeries, tickerId, field)
+            seq.append(value)
+        tracer = self.session.tracer
+        if tracer is not None:
+            tracer.stamp('index')
+
+    def timerEvent(self, event):
+        """ Stores the series created by the worker processes.
+
+        @param event QTimerEvent instance
+        @return None
+        """
+        for tickerId, field, seq in self.pool.poll():
+            try:
+                tickerdata = self[tickerId]
+            except (KeyError, ):
+                tickerdata = self[tickerId] = \
+                             self.session.strategy.makeTicker(tickerId)
+                self.emit(Signals.createdTicker, tickerId, tickerdata)
+            tickerdata.series[field] = seq
             self.emit(Signals.createdSeries, tickerId, field)
-        seq.append(value)
-
 
 
 class HistoricalDataCollection(DataCollection):
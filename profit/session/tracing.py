@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2007 Troy Melhase
+# Distributed under the terms of the GNU General Public License v2
+# Author: Troy Melhase <troy@gci.net>
+
+##
+#
+# This module defines the LatencyTracer class, which measures the time
+# taken by each stage of the path from a TWS message to the orders a
+# strategy places in response.
+#
+# Tracing is optional; a session traces only while its 'tracer'
+# attribute is set (see Session.setTracing).  The session stamps each
+# message with a monotonic clock when it is received (ingestion), and
+# the stages reached while the message is being handled are measured
+# from that stamp:
+#
+#     dispatch  message is about to be sent to its handlers
+#     index     message value has been appended to a ticker series
+#     decision  message has reached a strategy message runner
+#     send      an order has been passed to the connection
+#     ack       the first OrderStatus message for the order has been
+#               received; measured from the ingestion of the message
+#               that led to the order, or from the send when the order
+#               was placed outside of message handling
+#
+# Each stage has a histogram with power-of-two microsecond buckets.
+# Runners in separate processes and on timer threads are not traced
+# (see the runner metrics in profit.strategy.runners instead).
+#
+##
+
+import ctypes
+import ctypes.util
+from math import frexp
+from threading import local
+from time import time
+
+
+def monotonicClock():
+    """ Finds the best available monotonic clock.
+
+    @return function returning seconds as a float; time.time if no
+    monotonic clock is available
+    """
+    class timespec(ctypes.Structure):
+        _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+    for name in ('rt', 'c'):
+        try:
+            library = ctypes.CDLL(ctypes.util.find_library(name))
+            clock_gettime = library.clock_gettime
+        except (AttributeError, OSError, TypeError, ):
+            continue
+        clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+        value = timespec()
+        pointer = ctypes.byref(value)
+        if clock_gettime(1, pointer) != 0:
+            continue
+        def clock():
+            clock_gettime(1, pointer)
+            return value.tv_sec + value.tv_nsec * 1e-9
+        return clock
+    return time
+
+
+class LatencyHistogram(object):
+    """ Counts of latencies in power-of-two microsecond buckets.
+
+    Bucket 0 counts latencies under 1 microsecond; bucket i counts
+    latencies from 2**(i-1) up to 2**i microseconds.  The last bucket
+    counts everything longer.
+    """
+    size = 28
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """ Discards all counts.
+
+        """
+        self.counts = [0] * self.size
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, latency):
+        """ Counts one latency.
+
+        @param latency seconds
+        @return None
+        """
+        micros = latency * 1e6
+        bucket = frexp(micros)[1] if micros >= 1 else 0
+        self.counts[min(bucket, self.size - 1)] += 1
+        self.count += 1
+        self.total += latency
+        if latency > self.maximum:
+            self.maximum = latency
+
+    def mean(self):
+        """ Mean latency in seconds.
+
+        """
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, fraction):
+        """ Upper bound of the bucket holding a percentile.
+
+        @param fraction percentile as a fraction, e.g. 0.99
+        @return seconds
+        """
+        target = fraction * self.count
+        seen = 0
+        for bucket, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(2 ** bucket * 1e-6, self.maximum)
+        return self.maximum
+
+    def buckets(self):
+        """ Non-empty buckets.
+
+        @return list of (upper bound in microseconds, count) tuples
+        """
+        return [(2 ** i, c) for i, c in enumerate(self.counts) if c]
+
+
+class LatencyTracer(object):
+    """ Collects per-stage latency histograms for a session.
+
+    """
+    stages = ('dispatch', 'index', 'decision', 'send', 'ack')
+    ackTypes = ('OrderStatus', )
+
+    def __init__(self, clock=None):
+        """ Initializer.
+
+        @param clock=None function returning seconds; defaults to the
+        monotonic clock
+        """
+        self.clock = clock or monotonicClock()
+        self.histograms = dict([(s, LatencyHistogram()) for s in self.stages])
+        self.current = local()
+        self.orders = {}
+        self.ingested = 0
+
+    def ingest(self, message):
+        """ Starts the trace of a message.
+
+        @param message IbPy message instance
+        @return None
+        """
+        now = self.clock()
+        self.current.origin = now
+        self.ingested += 1
+        if message.typeName in self.ackTypes:
+            try:
+                start = self.orders.pop(message.orderId)
+            except (AttributeError, KeyError, ):
+                return
+            self.histograms['ack'].add(now - start)
+
+    def finish(self):
+        """ Ends the trace of the current message.
+
+        """
+        self.current.origin = None
+
+    def stamp(self, stage):
+        """ Records that the current message has reached a stage.
+
+        @param stage stage name, one of 'stages'
+        @return None
+        """
+        origin = getattr(self.current, 'origin', None)
+        if origin is not None:
+            self.histograms[stage].add(self.clock() - origin)
+
+    def sent(self, orderId):
+        """ Records that an order has been sent.
+
+        @param orderId order id, matched to its OrderStatus messages
+        @return None
+        """
+        now = self.clock()
+        origin = getattr(self.current, 'origin', None)
+        if origin is not None:
+            self.histograms['send'].add(now - origin)
+        self.orders[orderId] = now if origin is None else origin
+
+    def reset(self):
+        """ Discards all counts and pending orders.
+
+        """
+        for histogram in self.histograms.values():
+            histogram.reset()
+        self.orders.clear()
+        self.ingested = 0
+
+    def summary(self):
+        """ Statistics of every stage.
+
+        @return list of (stage, count, mean, p50, p90, p99, maximum)
+        tuples; times in seconds
+        """
+        rows = []
+        for stage in self.stages:
+            h = self.histograms[stage]
+            rows.append((stage, h.count, h.mean(), h.percentile(0.5),
+                         h.percentile(0.9), h.percentile(0.99), h.maximum))
+        return rows
+
+    def dump(self, filename):
+        """ Writes the statistics and histograms to a text file.
+
+        @param filename name of file to write
+        @return None
+        """
+        handle = open(filename, 'w')
+        try:
+            handle.write('# messages ingested: %s\n' % self.ingested)
+            handle.write('# stage count mean_us p50_us p90_us p99_us max_us\n')
+            for row in self.summary():
+                handle.write('%s %s %s\n' % (row[0], row[1], str.join(' ',
+                    ['%.1f' % (v * 1e6) for v in row[2:]])))
+            handle.write('# stage bucket_us count\n')
+            for stage in self.stages:
+                for bound, count in self.histograms[stage].buckets():
+                    handle.write('%s %s %s\n' % (stage, bound, count))
+        finally:
+            handle.close()
@@ -13,6 +13,10 @@ from PyQt4.QtCore import QObject
 
 from profit.lib import BasicHandler, Signals, instance, logging
 from profit.series import Series, KAMA
+from profit.series.graph import IndexGraph
+from profit.strategy.plan import ExecutionPlan, compilePlan
+from profit.strategy.runners import (MessageRunner, callRunner,
+                                     runnerExecutor, stopRunner)
 
 from ib.ext.Contract import Contract
 from ib.ext.Order import Order
@@ -23,7 +27,74 @@ class StrategyBuilderTicker(object):
         self.series = {}
 
 
+def fieldAttributes(cls, cache={}):
+    """ Maps keyword names to the 'm_' attributes of an IbPy class.
+
+    @param cls Contract, Order or similar class
+    @param cache={} mapping of classes to computed maps
+    @return mapping of keyword name ('symbol') to attribute ('m_symbol')
+    """
+    try:
+        return cache[cls]
+    except (KeyError, ):
+        attrs = cache[cls] = dict([(k[2:], k) for k in vars(cls())
+                                   if k.startswith('m_')])
+        return attrs
+
+
+def listAttributes(cls, cache={}):
+    """ Names of the attributes of an IbPy class initialized to lists.
+
+    @param cls Contract, Order or similar class
+    @param cache={} mapping of classes to computed names
+    @return tuple of attribute names
+    """
+    try:
+        return cache[cls]
+    except (KeyError, ):
+        names = cache[cls] = tuple([k for k, v in vars(cls()).items()
+                                    if isinstance(v, list)])
+        return names
+
+
+def cloneTemplate(template):
+    """ Copies an IbPy object without calling its initializer.
+
+    List attributes (combo legs, algo parameters) are copied so that
+    clones do not share them.
+
+    @param template Contract or Order instance
+    @return new instance with the attribute values of the template
+    """
+    cls = type(template)
+    clone = cls.__new__(cls)
+    values = clone.__dict__
+    values.update(template.__dict__)
+    for name in listAttributes(cls):
+        values[name] = list(values[name])
+    return clone
+
+
+def messageDispatcher(handlers):
+    """ Creates a message slot calling each of a tuple of handlers.
+
+    @param handlers sequence of callables taking a message
+    @return function taking a message
+    """
+    handlers = tuple(handlers)
+    def dispatch(message):
+        for handler in handlers:
+            try:
+                handler(message)
+            except (Exception, ), exc:
+                logging.debug('Strategy handler %r failed: %s', handler, exc)
+    return dispatch
+
+
 class SessionStrategyBuilder(QObject, BasicHandler):
+    indexCache = None
+    orderTemplate = None
+    tracer = None
     default_paramsHistoricalData = {
         ## change to use datetime
         "endDateTime"       :   strftime("%Y%m%d %H:%M:%S PST", (2007,1,1,0,0,0,0,0,0)),
@@ -37,9 +108,17 @@ class SessionStrategyBuilder(QObject, BasicHandler):
     def __init__(self, parent=None):
         QObject.__init__(self, parent)
         self.tickerItems = []
+        self.plan = ExecutionPlan()
+        self.tickerSeries = {}
+        self.builtTickers = set()
+        self.dispatchers = []
+        self.executors = []
+        self.singles = []
+        self.contractTemplates = {}
         self.isActive = self.loadMessage = False
         self.threads = []
         self.tickers = []
+        self.indexGraphs = {}
         self.reflectSignals(Signals.contract.created)
         app = instance()
         if app:
@@ -59,17 +138,30 @@ class SessionStrategyBuilder(QObject, BasicHandler):
         return s
 
     def makeContract(self, symbol, **kwds):
-        contract = Contract()
-        kwds['symbol'] = symbol
-        attrs = [k for k in dir(contract) if k.startswith('m_')]
-        for attr in attrs:
-            kwd = attr[2:]
-            if kwd in kwds:
-                setattr(contract, attr, kwds[kwd])
-        ## set these even if they're already set
-        contract.m_secType = kwds.get('secType', 'STK')
-        contract.m_exchange = kwds.get('exchange', 'SMART')
-        contract.m_currency = kwds.get('currency', 'USD')
+        """ Creates a contract for a symbol.
+
+        Contracts are copied from templates kept for each (symbol,
+        secType, exchange, currency) key; other keywords are set on
+        the copy.
+
+        @param symbol contract symbol
+        @param **kwds contract attribute values, without the 'm_' prefix
+        @return Contract instance
+        """
+        key = (symbol, kwds.pop('secType', 'STK'),
+               kwds.pop('exchange', 'SMART'), kwds.pop('currency', 'USD'))
+        try:
+            template = self.contractTemplates[key]
+        except (KeyError, ):
+            template = self.contractTemplates[key] = Contract()
+            (template.m_symbol, template.m_secType,
+             template.m_exchange, template.m_currency) = key
+        contract = cloneTemplate(template)
+        if kwds:
+            attrs = fieldAttributes(Contract)
+            for kwd, value in kwds.items():
+                if kwd in attrs and kwd != 'symbol':
+                    setattr(contract, attrs[kwd], value)
         return contract
 
     def makeContracts(self):
@@ -78,12 +170,18 @@ class SessionStrategyBuilder(QObject, BasicHandler):
             yield tickerId, self.makeContract(symbol)
 
     def makeOrder(self, **kwds):
-        order = Order()
-        attrs = [k for k in dir(order) if k.startswith('m_')]
-        for attr in attrs:
-            kwd = attr[2:]
-            if kwd in kwds:
-                setattr(order, attr, kwds[kwd])
+        """ Creates an order.
+
+        @param **kwds order attribute values, without the 'm_' prefix
+        @return Order instance
+        """
+        if self.orderTemplate is None:
+            self.orderTemplate = Order()
+        order = cloneTemplate(self.orderTemplate)
+        attrs = fieldAttributes(Order)
+        for kwd, value in kwds.items():
+            if kwd in attrs:
+                setattr(order, attrs[kwd], value)
         return order
 
     def makeTicker(self, tickerId):
@@ -91,17 +189,72 @@ class SessionStrategyBuilder(QObject, BasicHandler):
         return ticker
 
     def makeTickerSeries(self, tickerId, field):
-        s = Series()
-        s.addIndex('ema-40', KAMA, s, 40)
-        return s
+        """ Returns the series for a ticker field, creating it if needed.
+
+        When the strategy plan describes the ticker, the series of all
+        of its fields are created together, so that indexes may read
+        the series of other fields.  Series for tickers not in the
+        plan get a default KAMA index.
+
+        @param tickerId ticker id
+        @param field ticker data field id
+        @return Series instance
+        """
+        key = (tickerId, field)
+        try:
+            return self.tickerSeries[key]
+        except (KeyError, ):
+            pass
+        graph = self.indexGraph(tickerId)
+        ticker = self.plan.tickerPlan(tickerId)
+        if ticker is not None and tickerId not in self.builtTickers:
+            try:
+                built = ticker.build(graph)
+            except (Exception, ), exc:
+                logging.debug('Could not build series of ticker %s: %s',
+                              tickerId, exc)
+            else:
+                self.builtTickers.add(tickerId)
+                for other, series in built.items():
+                    self.tickerSeries[(tickerId, other)] = series
+        if key not in self.tickerSeries:
+            s = graph.attach(Series())
+            if ticker is None:
+                s.addIndex('ema-40', KAMA, s, 40)
+            self.tickerSeries[key] = s
+        return self.tickerSeries[key]
+
+    def indexGraph(self, tickerId):
+        """ Returns the index scheduler shared by all series of a ticker.
+
+        @param tickerId ticker id
+        @return IndexGraph instance
+        """
+        try:
+            return self.indexGraphs[tickerId]
+        except (KeyError, ):
+            graph = self.indexGraphs[tickerId] = IndexGraph(self.indexCache)
+            return graph
 
     def symbols(self):
-        syms = [(i.get('symbol'), i.get('tickerId'))
-                for i in self.tickerItems]
-        syms = [(k, v) for k, v in syms if k is not None and v is not None]
-        return dict(syms)
+        """ Ticker ids of the strategy plan, keyed by symbol.
+
+        @return mapping of symbol to ticker id
+        """
+        return dict(self.plan.symbols)
 
     def load(self, source):
+        """ Loads a strategy file and activates its plan.
+
+        The series, built tickers and index graphs of the previous plan
+        are discarded, so that series are built from the new plan when
+        next requested.  Series already handed out, such as those held
+        by the ticker collection of the session, are not rebuilt; they
+        keep the indexes of the previous plan.
+
+        @param source file name or file-like object
+        @return None
+        """
         if not hasattr(source, 'read'):
             source = open(source)
         try:
@@ -115,9 +268,77 @@ class SessionStrategyBuilder(QObject, BasicHandler):
                 call(item)
             except (TypeError, ):
                 logging.debug('Could not load strategy item: %s', item)
+        self.plan = plan = compilePlan(instance, self.parent())
+        for error in plan.errors:
+            logging.debug('Strategy error: %s', error)
+        self.tickerSeries.clear()
+        self.builtTickers.clear()
+        self.indexGraphs.clear()
+        self.activatePlan()
         for tickerId, contract in self.makeContracts():
             self.emit(Signals.contract.created, tickerId, contract)
 
+    def activatePlan(self):
+        """ Starts the runners of the plan and connects them to the session.
+
+        Each message type is connected to a single slot that calls the
+        executors of the 'message' and 'process' runners declared for
+        it.  'thread' and 'process' runners are started, and 'single'
+        runners are called once.  Runners of a previous plan, and the
+        external commands its 'single' runners started, are stopped
+        first.
+
+        @return None
+        """
+        session = self.parent()
+        if session is None:
+            return
+        for typeName, dispatch in self.dispatchers:
+            session.deregister(dispatch, typeName)
+        for executor in self.executors:
+            executor.stop()
+        for runner in self.singles:
+            stopRunner(runner)
+        self.dispatchers = []
+        self.executors = executors = []
+        plan = self.plan
+        self.singles = list(plan.singles)
+        byRunner = {}
+        for runner in plan.runners:
+            if runner.execType != 'single':
+                executor = byRunner[id(runner)] = runnerExecutor(runner)
+                executors.append(executor)
+        self.setTracer(self.tracer)
+        for typeName, runners in plan.messageTable.items():
+            dispatch = messageDispatcher(
+                [byRunner[id(runner)] for runner in runners])
+            session.register(dispatch, typeName)
+            self.dispatchers.append((typeName, dispatch))
+        for executor in executors:
+            executor.start()
+        for runner in plan.singles:
+            callRunner(runner, ())
+
+    def setTracer(self, tracer):
+        """ Sets the latency tracer used by the message runners.
+
+        @param tracer LatencyTracer instance or None
+        @return None
+        """
+        self.tracer = tracer
+        for executor in self.executors:
+            if isinstance(executor, MessageRunner):
+                executor.tracer = tracer
+
+    def runnerMetrics(self):
+        """ Latency and backlog metrics of the running strategy runners.
+
+        @return mapping of runner name to metrics mapping (see
+        RunnerMetrics.summary)
+        """
+        return dict([(e.runner.name, e.metrics.summary())
+                     for e in self.executors])
+
     def load_RunnerItem(self, item):
         pass
 
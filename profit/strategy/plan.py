@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2007 Troy Melhase
+# Distributed under the terms of the GNU General Public License v2
+# Author: Troy Melhase <troy@gci.net>
+
+##
+#
+# This module compiles a strategy document into an ExecutionPlan.
+#
+# A strategy document is the list of mappings written by the strategy
+# designer (see profit.strategy.schema and the toSchema method of the
+# designer tree items).  Compiling it once resolves everything that
+# would otherwise be looked up as each message arrives:
+#
+#     - for each ticker, a TickerPlan listing the series to create for
+#       its fields and the indexes to add to them, with index classes
+#       and line parameters resolved and sorted so that every index is
+#       created after its inputs, and each index created once to check
+#       its parameters against the capacity of its series;
+#
+#     - for each runner, a RunnerPlan with its callables, imported or
+#       compiled, entered in dispatch tables: by message type name for
+#       'message' and 'process' runners, and in lists of 'thread' and
+#       'single' runners (see profit.strategy.runners for execution).
+#
+# Problems found while compiling are collected in the 'errors' list of
+# the plan; the items involved are left out and the rest of the plan
+# is still usable.
+#
+##
+
+import shlex
+from subprocess import Popen
+
+from profit.lib import importItem
+from profit.series import Series, indexTypes
+from profit.series.graph import IndexGraph
+
+
+class IndexStep(object):
+    """ Instruction to add one index to a ticker series.
+
+    """
+    __slots__ = ('key', 'owner', 'cls', 'args')
+
+    def __init__(self, key, owner, cls, args):
+        """ Initializer.
+
+        @param key index key, the name of the index item
+        @param owner name of the series or index that lists the index
+        @param cls index class
+        @param args sequence of (isLine, value) pairs; line values are
+        names of series or indexes of the same ticker
+        """
+        self.key = key
+        self.owner = owner
+        self.cls = cls
+        self.args = tuple(args)
+
+
+class TickerPlan(object):
+    """ Series and indexes to create for one ticker.
+
+    """
+    def __init__(self, tickerId, fields, steps):
+        """ Initializer.
+
+        @param tickerId ticker id
+        @param fields mapping of field id to (name, capacity, typecode)
+        @param steps sequence of IndexStep instances, inputs first
+        """
+        self.tickerId = tickerId
+        self.fields = fields
+        self.steps = tuple(steps)
+
+    def build(self, graph):
+        """ Creates the series of every field of the ticker.
+
+        @param graph IndexGraph instance for the ticker
+        @return mapping of field id to Series instance
+        """
+        named = {}
+        series = {}
+        for field, (name, capacity, typecode) in self.fields.items():
+            named[name] = series[field] = \
+                graph.attach(Series(capacity or None, typecode or None))
+        for step in self.steps:
+            args = [named[v] if isLine else v for isLine, v in step.args]
+            named[step.key] = \
+                named[step.owner].addIndex(step.key, step.cls, *args)
+        return series
+
+
+class RunnerPlan(object):
+    """ Callables of one runner and when to call them.
+
+    """
+    __slots__ = ('name', 'execType', 'interval', 'messageTypes',
+                 'tickerIds', 'calls')
+
+    def __init__(self, name, execType, interval, messageTypes, tickerIds,
+                 calls):
+        """ Initializer.
+
+        @param name runner name
+        @param execType 'message', 'thread', 'process' or 'single'
+        @param interval period in milliseconds for 'thread' runners
+        @param messageTypes set of message type names
+        @param tickerIds set of ticker ids; empty for every ticker
+        @param calls sequence of callables
+        """
+        self.name = name
+        self.execType = execType
+        self.interval = interval
+        self.messageTypes = frozenset(messageTypes)
+        self.tickerIds = frozenset(tickerIds)
+        self.calls = tuple(calls)
+
+
+class ExecutionPlan(object):
+    """ Compiled form of a strategy document.
+
+    """
+    def __init__(self):
+        self.tickers = {}
+        self.symbols = {}
+        self.runners = []
+        self.messageTable = {}
+        self.periodic = []
+        self.processes = []
+        self.singles = []
+        self.errors = []
+
+    def tickerPlan(self, tickerId):
+        """ Returns the plan for a ticker, or None if it has none.
+
+        """
+        return self.tickers.get(tickerId)
+
+
+class ExternalCommand(object):
+    """ Callable that runs an external command for a runner.
+
+    The command is started by the first call and runs once; further
+    calls only reap it once it has exited.  'stop' ends the command if
+    it is still running and reaps it, so that the runner may start it
+    again.
+    """
+    def __init__(self, command):
+        """ Initializer.
+
+        @param command sequence of program name and arguments
+        """
+        self.command = command
+        self.process = None
+        self.started = False
+
+    def __call__(self, *args):
+        if not self.started:
+            self.started = True
+            self.process = Popen(self.command)
+        elif self.process is not None and self.process.poll() is not None:
+            self.process = None
+
+    def __repr__(self):
+        return '<ExternalCommand %s>' % (str.join(' ', self.command), )
+
+    def stop(self):
+        """ Ends and reaps the command.
+
+        @return None
+        """
+        process, self.process = self.process, None
+        self.started = False
+        if process is not None:
+            if process.poll() is None:
+                process.terminate()
+            process.wait()
+
+
+def resolveCallable(item, session=None):
+    """ Creates the callable described by a Callable schema item.
+
+    'object' items name a callable by its dotted path.  'factory'
+    items name a callable that is called with the session to create
+    it.  'source' items give module source, and the location is an
+    expression evaluated in that module to find the callable.
+    'external' and 'file' items name a command that is started by the
+    first call and stopped with the runner (see ExternalCommand).
+
+    @param item Callable item mapping
+    @param session=None Session instance, passed to factories
+    @return callable taking any arguments
+    @raise ValueError if the item cannot be resolved
+    """
+    callType = item.get('callType', '')
+    location = item.get('callLocation', '')
+    if callType == 'object':
+        target = importItem(location)
+    elif callType == 'factory':
+        target = importItem(location)(session)
+    elif callType == 'source':
+        namespace = {'__name__':'strategy_%s' % item.get('name', '')}
+        exec compile(item.get('moduleSource', ''), '<strategy>', 'exec') \
+             in namespace
+        target = eval(location, namespace)
+    elif callType in ('external', 'file'):
+        target = ExternalCommand(shlex.split(location))
+    else:
+        raise ValueError('Unknown call type %r' % (callType, ))
+    if not callable(target):
+        raise ValueError('%s %r is not callable' % (callType, location))
+    return target
+
+
+def compileTicker(item, plan, types):
+    """ Compiles a Ticker item into a TickerPlan.
+
+    Line parameters name a field or index of the same ticker; an empty
+    line parameter refers to the series or index that lists the index.
+
+    @param item Ticker item mapping
+    @param plan ExecutionPlan receiving errors
+    @param types mapping of index class names to index classes
+    @return TickerPlan instance
+    """
+    tickerId = item.get('tickerId')
+    fields = {}
+    pending = []
+    def visit(owner, children):
+        for child in children:
+            pending.append((owner, child))
+            visit(child.get('name'), child.get('children', []))
+    for field in item.get('children', []):
+        name = field.get('name')
+        fields[field.get('id')] = \
+            (name, field.get('capacity', 0), field.get('typecode', ''))
+        visit(name, field.get('children', []))
+    candidates = []
+    for owner, child in pending:
+        key = child.get('name')
+        try:
+            cls = types[child.get('indexType')]
+        except (KeyError, ):
+            plan.errors.append('Ticker %s index %s: unknown type %r' %
+                               (tickerId, key, child.get('indexType')))
+            continue
+        parameters = child.get('parameters', {})
+        args = []
+        for name, spec in cls.params:
+            if spec.get('type') == 'line':
+                args.append((True, parameters.get(name) or owner))
+            elif name in parameters:
+                args.append((False, parameters[name]))
+            elif 'default' in spec:
+                args.append((False, spec['default']))
+            else:
+                plan.errors.append('Ticker %s index %s: no value for %s' %
+                                   (tickerId, key, name))
+                break
+        else:
+            candidates.append(IndexStep(key, owner, cls, args))
+    known = set([name for name, capacity, typecode in fields.values()])
+    steps = []
+    while candidates:
+        ready = [s for s in candidates if s.owner in known and
+                 not [v for isLine, v in s.args if isLine and v not in known]]
+        if not ready:
+            for step in candidates:
+                plan.errors.append('Ticker %s index %s: unresolved inputs' %
+                                   (tickerId, step.key))
+            break
+        for step in ready:
+            candidates.remove(step)
+            known.add(step.key)
+        steps.extend(ready)
+    return TickerPlan(tickerId, fields, checkSteps(tickerId, fields, steps,
+                                                   plan))
+
+
+def checkSteps(tickerId, fields, steps, plan):
+    """ Creates the indexes of a ticker once, leaving out those that fail.
+
+    Construction checks what the item alone does not show, such as a
+    field capacity too small for the periods of an index.  Indexes
+    that read a left out index are left out too.
+
+    @param tickerId ticker id
+    @param fields mapping of field id to (name, capacity, typecode)
+    @param steps sequence of IndexStep instances, inputs first
+    @param plan ExecutionPlan receiving errors
+    @return list of IndexStep instances that can be built
+    """
+    graph = IndexGraph()
+    named = {}
+    for name, capacity, typecode in fields.values():
+        named[name] = graph.attach(Series(capacity or None, typecode or None))
+    valid = []
+    for step in steps:
+        missing = [v for isLine, v in step.args if isLine and v not in named]
+        if step.owner not in named or missing:
+            plan.errors.append('Ticker %s index %s: input %s left out' %
+                               (tickerId, step.key,
+                                (missing or [step.owner])[0]))
+            continue
+        args = [named[v] if isLine else v for isLine, v in step.args]
+        try:
+            named[step.key] = \
+                named[step.owner].addIndex(step.key, step.cls, *args)
+        except (Exception, ), exc:
+            plan.errors.append('Ticker %s index %s: %s' %
+                               (tickerId, step.key, exc))
+            continue
+        valid.append(step)
+    return valid
+
+
+def compileRunner(item, plan, session=None, resolver=resolveCallable):
+    """ Compiles a Runner item into the dispatch tables of a plan.
+
+    @param item Runner item mapping
+    @param plan ExecutionPlan instance
+    @param session=None Session instance, passed to callable factories
+    @param resolver=resolveCallable function creating callables
+    @return None
+    """
+    calls = []
+    def visit(children):
+        for child in children:
+            try:
+                calls.append(resolver(child, session))
+            except (Exception, ), exc:
+                plan.errors.append('Runner %s callable %s: %s' %
+                                   (item.get('name'), child.get('name'), exc))
+            visit(child.get('children', []))
+    visit(item.get('children', []))
+    if not calls:
+        return
+    runner = RunnerPlan(item.get('name'), item.get('execType', 'single'),
+                        item.get('periodInterval', 1000),
+                        item.get('messageTypes', ()),
+                        item.get('tickerIds', ()), calls)
+    plan.runners.append(runner)
+    if runner.execType in ('message', 'process'):
+        table = plan.messageTable
+        for typeName in runner.messageTypes:
+            table[typeName] = table.get(typeName, ()) + (runner, )
+        if runner.execType == 'process':
+            plan.processes.append(runner)
+    elif runner.execType == 'thread':
+        plan.periodic.append(runner)
+    else:
+        plan.singles.append(runner)
+
+
+def compilePlan(schema, session=None, resolver=resolveCallable):
+    """ Compiles a strategy document into an ExecutionPlan.
+
+    @param schema sequence of Ticker and Runner item mappings
+    @param session=None Session instance, passed to callable factories
+    @param resolver=resolveCallable function creating callables
+    @return ExecutionPlan instance
+    """
+    plan = ExecutionPlan()
+    types = indexTypes()
+    for item in schema:
+        itemType = item.get('type', '')
+        if itemType == 'TickerItem':
+            ticker = compileTicker(item, plan, types)
+            plan.tickers[ticker.tickerId] = ticker
+            symbol = item.get('symbol')
+            if symbol is not None and ticker.tickerId is not None:
+                plan.symbols[symbol] = ticker.tickerId
+        elif itemType == 'RunnerItem':
+            compileRunner(item, plan, session, resolver)
+        else:
+            plan.errors.append('Unknown strategy item type %r' % (itemType, ))
+    return plan
@@ -0,0 +1,338 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2007 Troy Melhase
+# Distributed under the terms of the GNU General Public License v2
+# Author: Troy Melhase <troy@gci.net>
+
+##
+#
+# This module executes the runners of a compiled strategy plan.
+#
+# Each RunnerPlan (see profit.strategy.plan) is wrapped in an executor
+# for its execType:
+#
+#     - MessageRunner for 'message' runners, called in the session
+#       thread for each message of the declared types;
+#
+#     - PeriodicRunner for 'thread' runners, a thread that calls the
+#       runner every 'interval' milliseconds;
+#
+#     - ProcessRunner for 'process' runners, a forked process that is
+#       sent the declared messages through a queue and calls the runner
+#       there, so that slow strategy code does not hold up the session.
+#
+# Message and process runners with ticker ids only see messages with
+# one of those ids (messages without a tickerId are always passed).
+# Process runners are fed compact tuples of message values; the field
+# names of each message type are sent once, and the child process
+# rebuilds FeedMessage objects from them.
+#
+# Callables that keep a process running, such as the external commands
+# of profit.strategy.plan, are stopped with their runner: by the
+# session thread, the runner thread, or the runner process that called
+# them.
+#
+# Every executor keeps RunnerMetrics: count of calls, total, maximum
+# and last latency, and backlog.  For message runners the latency is
+# the time spent in the calls.  For process runners it is measured
+# from the time a message was queued, and the backlog is the number of
+# messages queued and not yet processed.  For periodic runners the
+# backlog is the number of intervals skipped because the previous call
+# took too long.  Metrics of process runners are kept in shared memory;
+# the runner process writes only the call counters, and the session
+# process writes the count of messages sent and the backlog, so that
+# no counter has two writers.
+#
+##
+
+import logging
+from multiprocessing import Process, Queue
+from multiprocessing.sharedctypes import RawArray
+from threading import Event, Thread
+from time import time
+
+
+class RunnerMetrics(object):
+    """ Latency and backlog counters for one runner.
+
+    """
+    names = ('calls', 'total', 'maximum', 'last', 'sent', 'backlog',
+             'maxBacklog')
+
+    def __init__(self, shared=False):
+        """ Initializer.
+
+        @param shared=False if True, counters are kept in shared memory
+        so that a forked process may update them; that process may only
+        call 'record', and the process that created the metrics writes
+        'sent' and the backlog, which is 'sent' less 'calls'
+        """
+        size = len(self.names)
+        self.shared = shared
+        self.values = RawArray('d', size) if shared else [0.0] * size
+
+    def record(self, latency):
+        """ Counts one call.
+
+        @param latency seconds spent on the call
+        @return None
+        """
+        values = self.values
+        values[0] += 1
+        values[1] += latency
+        values[3] = latency
+        if latency > values[2]:
+            values[2] = latency
+
+    def queued(self, backlog):
+        """ Records the current backlog.
+
+        @param backlog count of pending messages or skipped intervals
+        @return None
+        """
+        values = self.values
+        values[5] = backlog
+        if backlog > values[6]:
+            values[6] = backlog
+
+    def summary(self):
+        """ Current metric values.
+
+        @return mapping of metric name to value; 'mean' is the average
+        latency in seconds
+        """
+        if self.shared:
+            self.queued(self.values[4] - self.values[0])
+        values = dict(zip(self.names, self.values))
+        calls = values['calls']
+        values['mean'] = values['total'] / calls if calls else 0.0
+        return values
+
+
+def callRunner(runner, args):
+    """ Calls each callable of a runner, logging failures.
+
+    @param runner RunnerPlan instance
+    @param args sequence of arguments for the callables
+    @return None
+    """
+    for call in runner.calls:
+        try:
+            call(*args)
+        except (Exception, ), exc:
+            logging.debug('Strategy runner %s callable %r failed: %s',
+                          runner.name, call, exc)
+
+
+def stopRunner(runner):
+    """ Stops the callables of a runner that keep processes running.
+
+    @param runner RunnerPlan instance
+    @return None
+    """
+    for call in runner.calls:
+        stop = getattr(call, 'stop', None)
+        if stop is not None:
+            try:
+                stop()
+            except (Exception, ), exc:
+                logging.debug('Strategy runner %s callable %r stop '
+                              'failed: %s', runner.name, call, exc)
+
+
+def acceptsTicker(tickerIds, message):
+    """ True if a message is for one of the tickers, or for no ticker.
+
+    """
+    tickerId = getattr(message, 'tickerId', None)
+    return tickerId is None or tickerId in tickerIds
+
+
+class MessageRunner(object):
+    """ Calls a runner for each message, in the calling thread.
+
+    """
+    tracer = None
+
+    def __init__(self, runner):
+        """ Initializer.
+
+        @param runner RunnerPlan instance
+        """
+        self.runner = runner
+        self.tickerIds = runner.tickerIds
+        self.metrics = RunnerMetrics()
+
+    def __call__(self, message):
+        if self.tickerIds and not acceptsTicker(self.tickerIds, message):
+            return
+        if self.tracer is not None:
+            self.tracer.stamp('decision')
+        start = time()
+        callRunner(self.runner, (message, ))
+        self.metrics.record(time() - start)
+
+    def start(self):
+        pass
+
+    def stop(self):
+        stopRunner(self.runner)
+
+
+class PeriodicRunner(Thread):
+    """ Calls a runner every 'interval' milliseconds in a thread.
+
+    """
+    def __init__(self, runner):
+        """ Initializer.
+
+        @param runner RunnerPlan instance
+        """
+        Thread.__init__(self, name='runner-%s' % (runner.name, ))
+        self.setDaemon(True)
+        self.runner = runner
+        self.period = max(runner.interval, 1) / 1000.0
+        self.metrics = RunnerMetrics()
+        self.stopped = Event()
+
+    def run(self):
+        period, runner, metrics = self.period, self.runner, self.metrics
+        wait = self.stopped.wait
+        due = time() + period
+        skipped = 0
+        while True:
+            wait(max(due - time(), 0))
+            if self.stopped.isSet():
+                break
+            start = time()
+            callRunner(runner, ())
+            end = time()
+            metrics.record(end - start)
+            due += period
+            if end > due:
+                missed = int((end - due) / period) + 1
+                skipped += missed
+                due += missed * period
+            metrics.queued(skipped)
+        stopRunner(runner)
+
+    def stop(self):
+        """ Ends the thread after the current call.
+
+        The thread stops the callables of the runner as it ends.
+        """
+        self.stopped.set()
+
+
+class FeedMessage(object):
+    """ Message rebuilt in a runner process from its feed values.
+
+    """
+    def __init__(self, typeName, names, values):
+        self.typeName = typeName
+        self.__dict__.update(zip(names, values))
+
+    def items(self):
+        return [(k, v) for k, v in self.__dict__.items() if k != 'typeName']
+
+    def __repr__(self):
+        return '<%s %s>' % (self.typeName, str.join(', ',
+            ['%s=%s' % item for item in sorted(self.items())]))
+
+
+def processMain(runner, feed, metrics):
+    """ Main function of a runner process.
+
+    Feed items are (sent, typeName, values) tuples, or (None,
+    typeName, names) tuples giving the field names of a message type.
+    The process ends when it reads None.
+
+    @param runner RunnerPlan instance
+    @param feed Queue instance
+    @param metrics shared RunnerMetrics instance; this process only
+    records calls, the backlog is written by the session process
+    @return None
+    """
+    fields = {}
+    get = feed.get
+    while True:
+        item = get()
+        if item is None:
+            break
+        sent, typeName, data = item
+        if sent is None:
+            fields[typeName] = data
+            continue
+        message = FeedMessage(typeName, fields[typeName], data)
+        callRunner(runner, (message, ))
+        metrics.record(time() - sent)
+    stopRunner(runner)
+
+
+class ProcessRunner(object):
+    """ Sends messages for a runner to a separate process.
+
+    """
+    def __init__(self, runner):
+        """ Initializer.
+
+        @param runner RunnerPlan instance
+        """
+        self.runner = runner
+        self.tickerIds = runner.tickerIds
+        self.metrics = RunnerMetrics(shared=True)
+        self.feed = Queue()
+        self.fields = {}
+        self.process = None
+
+    def __call__(self, message):
+        if self.tickerIds and not acceptsTicker(self.tickerIds, message):
+            return
+        typeName = message.typeName
+        items = message.items()
+        try:
+            names = self.fields[typeName]
+        except (KeyError, ):
+            names = self.fields[typeName] = tuple([k for k, v in items])
+            self.feed.put((None, typeName, names))
+        self.feed.put((time(), typeName, tuple([v for k, v in items])))
+        values = self.metrics.values
+        values[4] += 1
+        self.metrics.queued(values[4] - values[0])
+
+    def start(self):
+        """ Forks the runner process.
+
+        """
+        self.process = process = Process(
+            target=processMain, args=(self.runner, self.feed, self.metrics),
+            name='runner-%s' % (self.runner.name, ))
+        process.daemon = True
+        process.start()
+
+    def stop(self):
+        """ Ends the runner process once it has read the messages sent.
+
+        """
+        if self.process is not None:
+            self.feed.put(None)
+            self.process.join(1.0)
+            if self.process.is_alive():
+                self.process.terminate()
+            self.process = None
+
+
+def runnerExecutor(runner):
+    """ Creates the executor for a runner.
+
+    @param runner RunnerPlan instance
+    @return MessageRunner, PeriodicRunner or ProcessRunner instance
+    @raise ValueError if the runner is a 'single' runner
+    """
+    types = {'message':MessageRunner, 'thread':PeriodicRunner,
+             'process':ProcessRunner}
+    try:
+        return types[runner.execType](runner)
+    except (KeyError, ):
+        raise ValueError('No executor for %s runners' % (runner.execType, ))
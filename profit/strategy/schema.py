@@ -33,8 +33,14 @@ class Runner(object):
     The Strategy class turns Runner descriptions into various types of
     callable code; it does the work of importing objects, starting
     threads, and executing out-of-process code.
+
+    The execType is 'single', 'thread' (every periodInterval
+    milliseconds), 'message' (for each message of the messageTypes)
+    or 'process' (like 'message', in a separate process).  Message
+    runners with tickerIds only see messages for those tickers.
     """
-    attrs = dict(execType='single', periodInterval=1000, messageTypes=set())
+    attrs = dict(execType='single', periodInterval=1000, messageTypes=set(),
+                 tickerIds=set())
 
     def allowChildType(self, t):
         return t in [Callable, ]
@@ -58,8 +64,12 @@ class TickerField(object):
     """ TickerField items associate a ticker data field (ask price, bid
     size) with a list of indexes.
 
+    The capacity attribute limits the number of values kept for the
+    field and its indexes; zero keeps every value.  The typecode
+    attribute selects typed storage for the plotted values ('d' or
+    'f', see profit.series.Series); empty uses lists.
     """
-    attrs = dict(id=-1)
+    attrs = dict(id=-1, capacity=0, typecode='')
 
     def allowChildType(self, t):
         return t in [TickerFieldIndex, ]
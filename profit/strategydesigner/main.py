@@ -14,10 +14,10 @@ from PyQt4.QtGui import QLabel, QMainWindow, QMessageBox
 from PyQt4.QtGui import QSizePolicy, QSpinBox, QStandardItem
 from PyQt4.QtGui import QStandardItemModel, QToolBar
 
-from profit import series
 from profit.lib import defaults
 from profit.lib import Settings, Signals
 from profit.lib.widgets.syspathdialog import SysPathDialog
+from profit.series import indexTypes
 from profit.strategydesigner.treeitems import (
     CallableItem, TickerItem, FieldItem, IndexItem, RunnerItem)
 from profit.strategydesigner.widgets.ui_strategydesigner import Ui_StrategyDesigner
@@ -57,17 +57,6 @@ def fieldTypes():
     return dict([(k, v) for k, v in items if v != unknown])
 
 
-def indexTypes():
-    """ Creates mapping of index class names to index types.
-
-    @return index class name to index class mapping.
-    """
-    def isIndexType(obj):
-        return hasattr(obj, 'params')
-    items = [(k, getattr(series, k)) for k in dir(series)]
-    return dict([(k, v) for k, v in items if isIndexType(v)])
-
-
 class LocalIndexLabel(QLabel):
     def __init__(self, text, parent):
         QLabel.__init__(self, text, parent)
@@ -455,7 +444,11 @@ class StrategyDesigner(QMainWindow, Ui_StrategyDesigner):
             Qt.Checked if item.execType=='thread' else Qt.Unchecked)
         self.runnerSingleShot.setChecked(
             Qt.Checked if item.execType=='single' else Qt.Unchecked)
+        self.runnerProcess.setChecked(
+            Qt.Checked if item.execType=='process' else Qt.Unchecked)
         self.runnerPeriodInterval.setValue(item.periodInterval)
+        self.runnerTickerIds.setText(
+            str.join(', ', [str(i) for i in sorted(item.tickerIds)]))
 
     def setupCallableItem(self, item):
         self.callableName.setText(item.text())
@@ -501,6 +494,9 @@ class StrategyDesigner(QMainWindow, Ui_StrategyDesigner):
         """
         combo = self.fieldCombo
         combo.setCurrentIndex(combo.findData(QVariant(item.id)))
+        self.capacitySpin.setValue(item.capacity)
+        combo = self.typecodeCombo
+        combo.setCurrentIndex(combo.findData(QVariant(item.typecode)))
 
     def setupIndexItem(self, item):
         """ Configures index page widgets from given item.
@@ -542,12 +538,18 @@ class StrategyDesigner(QMainWindow, Ui_StrategyDesigner):
         self.fieldCombo.addItem('<none>', QVariant())
         for id, name in sorted(fieldTypes().items()):
             self.fieldCombo.addItem(name, QVariant(id))
+        for typecode, name in [('', 'Python objects'),
+                               ('d', 'Double precision'),
+                               ('f', 'Single precision')]:
+            self.typecodeCombo.addItem(name, QVariant(typecode))
         self.runnerMessageHandler.setProperty(
             'execType', QVariant('message'))
         self.runnerSingleShot.setProperty(
             'execType', QVariant('single'))
         self.runnerThread.setProperty(
             'execType', QVariant('thread'))
+        self.runnerProcess.setProperty(
+            'execType', QVariant('process'))
 
     def showMessage(self, text, duration=3000):
         """ Displays text in the window status bar.
@@ -636,6 +638,30 @@ class StrategyDesigner(QMainWindow, Ui_StrategyDesigner):
 
     # widget signal handlers
 
+    @pyqtSignature('int')
+    def on_capacitySpin_valueChanged(self, value):
+        """ Signal handler for field capacity spin box changes.
+
+        @param value new value of spinbox
+        @return None
+        """
+        item = self.editItem
+        if item:
+            item.capacity = value
+            self.emit(Signals.modified)
+
+    @pyqtSignature('int')
+    def on_typecodeCombo_currentIndexChanged(self, index):
+        """ Signal handler for field storage combobox selection changes.
+
+        @param index selected item index
+        @return None
+        """
+        item = self.editItem
+        if item:
+            item.typecode = str(self.typecodeCombo.itemData(index).toString())
+            self.emit(Signals.modified)
+
     def on_currencyEdit_textEdited(self, text):
         """ Signal handler for ticker currency line edit widget text changes.
 
@@ -1082,6 +1108,7 @@ class StrategyDesigner(QMainWindow, Ui_StrategyDesigner):
     on_runnerSingleShot_clicked = itemSenderPropMatchMethod('execType')
     on_runnerThread_clicked = itemSenderPropMatchMethod('execType')
     on_runnerMessageHandler_clicked = itemSenderPropMatchMethod('execType')
+    on_runnerProcess_clicked = itemSenderPropMatchMethod('execType')
 
     on_runnerName_textEdited = itemEditedNameMatchMethod()
     on_callableName_textEdited = itemEditedNameMatchMethod()
@@ -1093,6 +1120,23 @@ class StrategyDesigner(QMainWindow, Ui_StrategyDesigner):
             item.periodInterval = value
             self.emit(Signals.modified)
 
+    def on_runnerTickerIds_textEdited(self, text):
+        """ Signal handler for runner ticker ids line edit text changes.
+
+        @param text comma-separated ticker ids; invalid ids are ignored
+        @return None
+        """
+        item = self.editItem
+        if item:
+            tickerIds = set()
+            for value in str(text).split(','):
+                try:
+                    tickerIds.add(int(value))
+                except (ValueError, ):
+                    pass
+            item.tickerIds = tickerIds
+            self.emit(Signals.modified)
+
     def on_runnerMessageTypes_itemChanged(self, listItem):
         checked = listItem.checkState()==Qt.Checked
         key = str(listItem.text())
@@ -0,0 +1,485 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2007 Troy Melhase
+# Distributed under the terms of the GNU General Public License v2
+# Author: Troy Melhase <troy@gci.net>
+
+##
+#
+# This module renders ticker plots of a saved session to image files,
+# for end of day reports:
+#
+#     chart_report -s 20070615.session -g strategy.pkl -o charts
+#
+# Reports are drawn without a display server.  Each worker creates its
+# Qt application with the GUI disabled, and no widgets are made: the
+# curves checked in the saved plot settings of each ticker (the plots
+# named 'indexPlot0', 'indexPlot1', ... in the workbench) are drawn as
+# plot items straight onto a QImage or QSvgGenerator, with their saved
+# pens, styles and axes, and the saved grids, canvas color, axis color
+# and axis font.  The axes are scaled to the data drawn.
+#
+# With the '--widgets' option, or when the Qwt build lacks the scale
+# classes used above, each plot is instead built by Plot.setSessionPlot
+# in a widget that is never shown and printed with QwtPlot.print_,
+# which also draws the legend.  Qt 4 on X11 needs a display to create
+# widgets, so only then is DISPLAY checked, and the report fails with a
+# message when it is not set.  Either way, only the plot itself is
+# written, at the requested size, as PNG or SVG.
+#
+# Tickers are divided among a pool of worker processes.  Each worker
+# reads the session file, replays the messages of its own tickers only,
+# and renders them.
+#
+# When a strategy file is given, the series and indexes of its tickers
+# are created as the workbench would create them.  Strategy runners are
+# not started.
+#
+##
+
+import os
+import sys
+from cPickle import UnpicklingError, load
+from multiprocessing import Pool, cpu_count
+from optparse import OptionParser
+
+tickTypes = ('TickPrice', 'TickSize')
+
+
+def sessionTickerIds(filename):
+    """ Ticker ids with price or size messages in a session file.
+
+    @param filename name of file written by Session.save
+    @return sorted list of ticker ids
+    """
+    handle = open(filename, 'rb')
+    try:
+        messages = load(handle)
+    finally:
+        handle.close()
+    tickerIds = set()
+    for item in messages:
+        try:
+            mtime, message = item
+        except (TypeError, ValueError, ):
+            continue
+        if message.typeName in tickTypes:
+            tickerIds.add(message.tickerId)
+    return sorted(tickerIds)
+
+
+def loadStrategy(session, filename):
+    """ Configures the ticker series of a session from a strategy file.
+
+    Only the ticker items of the strategy are used; its runners are
+    neither compiled nor started.
+
+    @param session Session instance
+    @param filename name of strategy file
+    @return None
+    """
+    from profit.strategy.plan import compilePlan
+    handle = open(filename, 'rb')
+    try:
+        items = load(handle)
+    finally:
+        handle.close()
+    items = [i for i in items if i.get('type') == 'TickerItem']
+    session.strategy.plan = compilePlan(items, session)
+
+
+def loadTickers(session, filename, tickerIds):
+    """ Replays the price and size messages of some tickers.
+
+    @param session Session instance
+    @param filename name of file written by Session.save
+    @param tickerIds set of ticker ids
+    @return count of messages replayed
+    """
+    handle = open(filename, 'rb')
+    try:
+        try:
+            messages = load(handle)
+        except (UnpicklingError, ):
+            return 0
+    finally:
+        handle.close()
+    count = 0
+    receive = session.receiveMessage
+    for item in messages:
+        try:
+            mtime, message = item
+        except (TypeError, ValueError, ):
+            continue
+        if message.typeName in tickTypes and message.tickerId in tickerIds:
+            receive(message, mtime)
+            count += 1
+    return count
+
+
+def writeImage(filename, width, height, draw):
+    """ Writes an image file drawn by a callable.
+
+    @param filename name of file to write; SVG if it ends in '.svg',
+    otherwise an image format supported by QImage
+    @param width image width in pixels
+    @param height image height in pixels
+    @param draw callable given a QPainter and the QRect to draw in
+    @return True if the file was written
+    @raise ValueError if SVG output is requested and QtSvg is missing
+    """
+    from PyQt4.QtCore import QRect, QSize, Qt
+    from PyQt4.QtGui import QColor, QImage, QPainter
+    rect = QRect(0, 0, width, height)
+    if filename.lower().endswith('.svg'):
+        try:
+            from PyQt4.QtSvg import QSvgGenerator
+        except (ImportError, ):
+            raise ValueError('SVG output requires PyQt4.QtSvg')
+        generator = QSvgGenerator()
+        generator.setFileName(filename)
+        generator.setSize(QSize(width, height))
+        painter = QPainter(generator)
+        try:
+            draw(painter, rect)
+        finally:
+            painter.end()
+        return True
+    image = QImage(width, height, QImage.Format_ARGB32)
+    image.fill(QColor(Qt.white).rgb())
+    painter = QPainter(image)
+    try:
+        draw(painter, rect)
+    finally:
+        painter.end()
+    return image.save(filename)
+
+
+def renderPlot(plot, filename, width, height):
+    """ Writes the plot of a Plot widget to an image file.
+
+    @param plot Plot instance, after setSessionPlot
+    @param filename name of file to write
+    @param width image width in pixels
+    @param height image height in pixels
+    @return True if the file was written
+    """
+    from PyQt4.QtCore import Qt
+    ## the controls tree is collapsed so that the canvas has the width
+    ## used to reduce the curve points
+    plot.setAttribute(Qt.WA_DontShowOnScreen)
+    plot.resize(width, height)
+    plot.plotSplitter.setSizes([0, width])
+    plot.show()
+    for item in plot.checkedItems():
+        if not item.curve.isVisible():
+            plot.enableCurve(item)
+    plot.updateAxis()
+    plot.setVisibleCurvesData()
+    widget = plot.plot
+    widget.resize(width, height)
+    widget.replot()
+    return writeImage(filename, width, height, widget.print_)
+
+
+def seriesItems(name, series):
+    """ Names and series of a plot control item and its indexes.
+
+    Names are those of the control tree items of a Plot, without the
+    plot name.
+
+    @param name series key, or sequence of keys
+    @param series Series or index instance
+    @return generator of (name, series) two-tuples
+    """
+    try:
+        name + ()
+    except (TypeError, ):
+        pass
+    else:
+        name = '/'.join(name)
+    yield name, series
+    for index in getattr(series, 'indexes', []):
+        for item in seriesItems(index.key, index):
+            yield ('%s/%s' % (name, item[0]), item[1])
+
+
+def drawPlot(settings, plotName, ticker, painter, rect):
+    """ Draws the checked curves of a saved plot without widgets.
+
+    @param settings Settings instance, in the plots group
+    @param plotName name of the plot, as given by Plot.plotName
+    @param ticker Ticker instance
+    @param painter QPainter instance
+    @param rect QRect to draw in
+    @return None
+    """
+    from PyQt4.QtCore import QRect
+    from PyQt4.QtGui import QColor, QFont, QPalette, QPen
+    from PyQt4.Qwt5 import QwtLinearScaleEngine, QwtScaleDraw, QwtScaleMap
+    from ib.ext.TickType import TickType
+    from profit.lib import defaults
+    from profit.lib.widgets.plot import (PlotCurve, PlotGrid,
+                                         loadCurveSettings, xBottom, xTop,
+                                         yLeft, yRight)
+    from profit.series.decimate import CurveSummary
+
+    getv = settings.value
+    checked = settings.valueLoad('%s/checkeditems' % plotName, '') or []
+    curves, ranges = [], {}
+    for field, series in ticker.series.items():
+        for name, item in seriesItems(TickType.getField(field), series):
+            itemName = '%s/%s' % (plotName, name)
+            if itemName not in checked:
+                continue
+            curve = PlotCurve(name)
+            loadCurveSettings(settings, itemName, curve)
+            xs, ys = CurveSummary(item).points(width=rect.width())
+            curve.setData(xs, ys)
+            curves.append(curve)
+            for axis, values in ((curve.xAxis(), xs), (curve.yAxis(), ys)):
+                values = [v for v in values if v == v]
+                if values:
+                    low, high = ranges.get(axis, (values[0], values[0]))
+                    ranges[axis] = (min(low, min(values)),
+                                    max(high, max(values)))
+    ## room for the scale of each axis with curves, or a small margin
+    left = 60 if yLeft in ranges else 10
+    right = 60 if yRight in ranges else 10
+    top = 30 if xTop in ranges else 10
+    bottom = 30 if xBottom in ranges else 10
+    canvas = QRect(rect.left() + left, rect.top() + top,
+                   rect.width() - left - right, rect.height() - top - bottom)
+    color = getv('%s/canvascolor' % plotName, defaults.canvasColor())
+    painter.fillRect(canvas, QColor(color))
+    engine = QwtLinearScaleEngine()
+    divs, maps = {}, {}
+    for axis, (low, high) in ranges.items():
+        if low == high:
+            low, high = low - 0.5, high + 0.5
+        divs[axis] = engine.divideScale(low, high, 8, 5)
+        scaleMap = maps[axis] = QwtScaleMap()
+        if axis in (xBottom, xTop):
+            scaleMap.setPaintInterval(canvas.left(), canvas.right())
+        else:
+            scaleMap.setPaintInterval(canvas.bottom(), canvas.top())
+        scaleMap.setScaleInterval(low, high)
+    xAxis = xBottom if xBottom in maps else xTop
+    yAxis = yRight if yRight in maps else yLeft
+    if xAxis in maps and yAxis in maps:
+        grid = PlotGrid()
+        grid.setMajPen(QPen(
+            getv('%s/major/pen' % plotName, defaults.majorGridPen())))
+        grid.setMinPen(QPen(
+            getv('%s/minor/pen' % plotName, defaults.minorGridPen())))
+        for key, enable in [('%s/major/x/enabled', grid.enableX),
+                            ('%s/major/y/enabled', grid.enableY),
+                            ('%s/minor/x/enabled', grid.enableXMin),
+                            ('%s/minor/y/enabled', grid.enableYMin)]:
+            v = getv(key % plotName)
+            enable(not v.isValid() or v.toBool())
+        grid.setXDiv(divs[xAxis])
+        grid.setYDiv(divs[yAxis])
+        grid.draw(painter, maps[xAxis], maps[yAxis], canvas)
+    painter.save()
+    painter.setClipRect(canvas)
+    for curve in curves:
+        curve.draw(painter, maps[curve.xAxis()], maps[curve.yAxis()], canvas)
+    painter.restore()
+    palette = QPalette()
+    color = getv('%s/axiscolor' % plotName)
+    if color.isValid():
+        palette.setColor(palette.WindowText, QColor(color))
+        palette.setColor(palette.Text, QColor(color))
+    font = getv('%s/axisfont' % plotName)
+    if font.isValid():
+        painter.setFont(QFont(font))
+    width, height = canvas.width(), canvas.height()
+    placement = {
+        xBottom:(QwtScaleDraw.BottomScale, canvas.bottomLeft(), width),
+        xTop:(QwtScaleDraw.TopScale, canvas.topLeft(), width),
+        yLeft:(QwtScaleDraw.LeftScale, canvas.topLeft(), height),
+        yRight:(QwtScaleDraw.RightScale, canvas.topRight(), height),
+    }
+    for axis, div in divs.items():
+        alignment, position, length = placement[axis]
+        scaleDraw = QwtScaleDraw()
+        scaleDraw.setAlignment(alignment)
+        scaleDraw.setScaleDiv(div)
+        scaleDraw.move(position)
+        scaleDraw.setLength(length)
+        scaleDraw.draw(painter, palette)
+
+
+def renderTickers(args):
+    """ Renders the plots of a group of tickers; runs in a worker process.
+
+    @param args two-tuple of options and sequence of ticker ids
+    @return list of (tickerId, filename, error) tuples; error is None
+    for files written
+    """
+    opts, tickerIds = args
+    from PyQt4.QtGui import QApplication
+    from profit.lib import Settings
+    from profit.session import Session
+
+    widgets = opts.widgets or headlessError() is not None
+    app = QApplication.instance() or QApplication(['chart_report'], widgets)
+    app.setApplicationName(Settings.keys.app)
+    session = Session()
+    if opts.strategy:
+        loadStrategy(session, opts.strategy)
+    loadTickers(session, opts.session, set(tickerIds))
+    symbols = dict([(v, k) for k, v in session.strategy.symbols().items()])
+    collection = session.maps.ticker
+    settings = Settings()
+    settings.beginGroup(settings.keys.plots)
+    results = []
+    for tickerId in tickerIds:
+        name = symbols.get(tickerId) or tickerId
+        filename = os.path.join(opts.output, '%s-%s.%s' %
+                                (name, opts.plot, opts.format))
+        plotName = '%s/indexPlot%s' % (tickerId, opts.plot)
+        try:
+            if widgets:
+                written = renderWidget(session, tickerId, opts, filename)
+            else:
+                ticker = collection[tickerId]
+                written = writeImage(
+                    filename, opts.width, opts.height,
+                    lambda painter, rect:drawPlot(
+                        settings, plotName, ticker, painter, rect))
+            if written:
+                results.append((tickerId, filename, None))
+            else:
+                results.append((tickerId, filename, 'not written'))
+        except (Exception, ), exc:
+            results.append((tickerId, filename, str(exc)))
+    return results
+
+
+def renderWidget(session, tickerId, opts, filename):
+    """ Renders the plot of a ticker with a Plot widget.
+
+    @param session Session instance
+    @param tickerId id of ticker
+    @param opts options, as returned by 'options'
+    @param filename name of file to write
+    @return True if the file was written
+    """
+    from PyQt4.QtGui import QApplication
+    from profit.lib.widgets.plot import Plot
+    plot = Plot()
+    plot.setObjectName('indexPlot%s' % opts.plot)
+    try:
+        plot.setSessionPlot(session, session.maps.ticker, tickerId)
+        return renderPlot(plot, filename, opts.width, opts.height)
+    finally:
+        session.deregisterMeta(plot)
+        plot.close()
+        plot.deleteLater()
+        QApplication.processEvents()
+
+
+def headlessError():
+    """ Reason plots cannot be drawn without widgets here, or None.
+
+    @return error message or None
+    """
+    try:
+        from PyQt4.Qwt5 import QwtLinearScaleEngine, QwtScaleDraw
+        from PyQt4.Qwt5 import QwtScaleMap
+    except (ImportError, ), exc:
+        return str(exc)
+    return None
+
+
+def displayError():
+    """ Reason Qt cannot create widgets here, or None.
+
+    Qt 4 on X11 opens the display named by DISPLAY when an application
+    with the GUI enabled is created, even for widgets never shown.
+
+    @return error message or None
+    """
+    from PyQt4.QtCore import QT_VERSION_STR
+    if sys.platform in ('darwin', 'win32', 'cygwin'):
+        return None
+    if os.environ.get('DISPLAY'):
+        return None
+    return ('Qt %s needs an X display to draw with widgets and DISPLAY '
+            'is not set; run without --widgets, or under a virtual X '
+            'server, e.g. "xvfb-run -a chart_report ..."' %
+            (QT_VERSION_STR, ))
+
+
+def options(args=None):
+    parser = OptionParser(usage='%prog [options] -s SESSION')
+    add_option = parser.add_option
+    add_option('-s', '--session', dest='session', metavar='FILE',
+               help='session file to render')
+    add_option('-g', '--strategy', dest='strategy', metavar='FILE',
+               help='strategy file defining ticker series and indexes')
+    add_option('-t', '--tickerid', dest='tickerIds', type='int',
+               action='append', metavar='ID',
+               help='ticker id to render; repeatable [default: all]')
+    add_option('-p', '--plot', dest='plot', type='int', default=0,
+               help='saved plot number of each ticker [default:%default]')
+    add_option('-f', '--format', dest='format', default='png',
+               help='image format, e.g. png or svg [default:%default]')
+    add_option('-W', '--width', dest='width', type='int', default=1200,
+               help='image width in pixels [default:%default]')
+    add_option('-H', '--height', dest='height', type='int', default=600,
+               help='image height in pixels [default:%default]')
+    add_option('-j', '--jobs', dest='jobs', type='int', default=cpu_count(),
+               help='number of worker processes [default:%default]')
+    add_option('-o', '--output', dest='output', default='.', metavar='DIR',
+               help='output directory [default:%default]')
+    add_option('-w', '--widgets', dest='widgets', action='store_true',
+               default=False,
+               help='draw with plot widgets and legends; needs a display')
+    add_option('-v', '--verbose', dest='verbose', action='store_true',
+               default=False, help='echo each file written')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    opts, args = options(args)
+    if not opts.session:
+        sys.stderr.write('No session file given.\n')
+        return 2
+    error = None
+    if opts.widgets or headlessError():
+        error = displayError()
+    if error:
+        sys.stderr.write('%s\n' % (error, ))
+        return 2
+    tickerIds = opts.tickerIds or sessionTickerIds(opts.session)
+    if not tickerIds:
+        sys.stderr.write('No tickers to render.\n')
+        return 1
+    if not os.path.isdir(opts.output):
+        os.makedirs(opts.output)
+    jobs = max(min(opts.jobs, len(tickerIds)), 1)
+    groups = [(opts, tickerIds[i::jobs]) for i in range(jobs)]
+    ## one group per process, so that each has its own application
+    pool = Pool(jobs, maxtasksperchild=1)
+    failures = 0
+    try:
+        for results in pool.imap_unordered(renderTickers, groups):
+            for tickerId, filename, error in results:
+                if error is None:
+                    if opts.verbose:
+                        sys.stdout.write('%s\n' % (filename, ))
+                else:
+                    failures += 1
+                    sys.stderr.write('Ticker %s: %s\n' % (tickerId, error))
+    finally:
+        pool.close()
+        pool.join()
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
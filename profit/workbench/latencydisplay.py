@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+# Copyright 2007 Troy Melhase
+# Distributed under the terms of the GNU General Public License v2
+# Author: Troy Melhase <troy@gci.net>
+
+from PyQt4.QtCore import Qt, pyqtSignature
+from PyQt4.QtGui import QFileDialog, QFrame, QTreeWidgetItem
+
+from profit.lib import BasicHandler
+from profit.workbench.widgets.ui_latencydisplay import Ui_LatencyDisplay
+
+
+class LatencyDisplay(QFrame, Ui_LatencyDisplay, BasicHandler):
+    """ Shows the latency histograms of the session tracer.
+
+    Each stage is a top-level row with its statistics; the histogram
+    buckets of the stage are its child rows.
+    """
+    refreshInterval = 1000
+
+    def __init__(self, parent=None):
+        """ Initializer.
+
+        @param parent ancestor of this object
+        """
+        QFrame.__init__(self, parent)
+        self.setupUi(self)
+        self.requestSession()
+        self.startTimer(self.refreshInterval)
+
+    def setSession(self, session):
+        """ Configures this instance for a session.
+
+        @param session Session instance
+        @return None
+        """
+        self.session = session
+        self.traceCheck.setChecked(session.tracer is not None)
+        self.refresh()
+
+    def refresh(self):
+        """ Redraws the statistics of the tracer.
+
+        @return None
+        """
+        tracer = self.session.tracer if self.session else None
+        self.saveButton.setEnabled(tracer is not None)
+        self.resetButton.setEnabled(tracer is not None)
+        tree = self.latencyTree
+        if tracer is None:
+            self.ingestedLabel.setText('')
+            tree.clear()
+            return
+        self.ingestedLabel.setText('%s messages' % tracer.ingested)
+        expanded = set([str(tree.topLevelItem(i).text(0))
+                        for i in range(tree.topLevelItemCount())
+                        if tree.topLevelItem(i).isExpanded()])
+        tree.clear()
+        for row in tracer.summary():
+            stage, count, times = row[0], row[1], row[2:]
+            item = QTreeWidgetItem(
+                [stage, str(count)] + ['%.1f' % (t * 1e6) for t in times])
+            for bound, bucketCount in tracer.histograms[stage].buckets():
+                child = QTreeWidgetItem(['< %s' % bound, str(bucketCount)])
+                item.addChild(child)
+            for column in range(1, item.columnCount()):
+                item.setTextAlignment(column, Qt.AlignRight)
+            tree.addTopLevelItem(item)
+            item.setExpanded(stage in expanded)
+
+    def timerEvent(self, event):
+        if self.isVisible():
+            self.refresh()
+
+    @pyqtSignature('bool')
+    def on_traceCheck_toggled(self, checked):
+        if self.session:
+            self.session.setTracing(checked)
+            self.refresh()
+
+    @pyqtSignature('')
+    def on_resetButton_clicked(self):
+        tracer = self.session.tracer
+        if tracer is not None:
+            tracer.reset()
+            self.refresh()
+
+    @pyqtSignature('')
+    def on_saveButton_clicked(self):
+        tracer = self.session.tracer
+        if tracer is None:
+            return
+        filename = QFileDialog.getSaveFileName(self, 'Save Latency Trace')
+        if filename:
+            tracer.dump(str(filename))
@@ -30,6 +30,7 @@ from profit.lib.widgets.output import OutputWidget
 from profit.lib.widgets.propertyeditor import PropertyEditor
 from profit.lib.widgets.shell import PythonShell
 from profit.lib.widgets.extendedshell import ExtendedPythonShell
+from profit.series.cache import IndexCache
 from profit.session import Session
 
 from profit.workbench.widgets.ui_main import Ui_ProfitWorkbenchWindow
@@ -137,7 +138,17 @@ class ProfitWorkbenchWindow(QMainWindow, Ui_ProfitWorkbenchWindow):
             self.close()
 
     def createSession(self):
-        self.session = session = Session()
+        settings = Settings()
+        settings.beginGroup(settings.keys.session)
+        workers = settings.value('indexWorkers', QVariant(0)).toInt()[0]
+        ringSize = settings.value('indexRingSize', QVariant(0)).toInt()[0]
+        cacheSize = settings.value('indexCacheSize', QVariant(0)).toInt()[0]
+        tracing = settings.value('traceLatency', QVariant(False)).toBool()
+        settings.endGroup()
+        self.session = session = Session(workers=workers, tracing=tracing,
+                                         ringSize=ringSize or None)
+        if cacheSize:
+            session.strategy.indexCache = IndexCache(limit=cacheSize*2**20)
         app = instance()
         app.emit(Signals.session.created, session)
         bar = self.statusBar()
@@ -4,23 +4,34 @@
 # Copyright 2007 Troy Melhase <troy@gci.net>
 # Distributed under the terms of the GNU General Public License v2
 
+from array import array
+from bisect import bisect_left
+from itertools import chain
 from time import ctime
 
-from PyQt4.QtCore import Qt, QVariant, pyqtSignature
-from PyQt4.QtGui import (QBrush, QColor, QColorDialog, QIcon, QFrame,
-                         QSortFilterProxyModel, QTableWidgetItem, )
+from PyQt4.QtCore import (QModelIndex, QRegExp, QString, QTimer, QVariant,
+                          Qt, pyqtSignature, )
+from PyQt4.QtGui import (QAbstractProxyModel, QBrush, QColor, QColorDialog,
+                         QIcon, QFrame, QTableWidgetItem, )
 
 from ib.opt.message import messageTypeNames
 
-from profit.lib import BasicHandler, Slots, defaults
+from profit.lib import BasicHandler, Signals, Slots, defaults
 from profit.lib.gui import colorIcon
 from profit.models.messages import MessagesTableModel
 from profit.workbench.widgets.ui_messagedisplay import Ui_MessageDisplay
 
 
-class MessagesFilter(QSortFilterProxyModel):
+class MessagesFilter(QAbstractProxyModel):
     """ MessagesFilter -> proxy model for filtering a message model by types
 
+    The rows of each message type are kept in an array of source rows,
+    extended as messages arrive.  The rows shown are the merge of the
+    arrays of the accepted types, so changing the accepted types does
+    not look at each message, and a new message of an accepted type is
+    a single row appended to the merged rows.  When all types are
+    accepted and there is no filter pattern, rows map to source rows
+    directly.
     """
     def __init__(self, messages, parent=None):
         """ Initializer.
@@ -28,24 +39,185 @@ class MessagesFilter(QSortFilterProxyModel):
         @param messages sequence of broker messages
         @param parent ancestor object
         """
-        QSortFilterProxyModel.__init__(self, parent)
+        QAbstractProxyModel.__init__(self, parent)
         self.messages = messages
         self.acceptTypes = None
+        self.typeRows = {}
+        self.indexed = 0
+        self.rows = None
+        self.pattern = None
+        self.filterKeyColumn = 0
 
-    def filterAcceptsRow(self, row, parent):
-        """ Framework hook to filter rows.
+    def setSourceModel(self, model):
+        """ Sets the message model and indexes its rows.
 
-        @param row source model row number
-        @param parent QModelIndex instance
-        @return True if row should be included in view
+        @param model MessagesTableModel instance
+        @return None
+        """
+        QAbstractProxyModel.setSourceModel(self, model)
+        connect = self.connect
+        connect(model, Signals.rowsInserted, self.on_source_rowsInserted)
+        connect(model, Signals.modelReset, self.reset)
+        connect(model, Signals.layoutChanged, self.reset)
+        connect(model, Signals.dataChanged, self.on_source_dataChanged)
+        self.reset()
+
+    def indexRows(self):
+        """ Adds the source rows not yet indexed to their type arrays.
+
+        @return first row added
+        """
+        first = self.indexed
+        count = self.sourceModel().rowCount()
+        messages, typeRows = self.messages, self.typeRows
+        for row in xrange(first, count):
+            typeName = messages[row].typeName
+            try:
+                typeRows[typeName].append(row)
+            except (KeyError, ):
+                typeRows[typeName] = array('l', [row])
+        self.indexed = count
+        return first
+
+    def accepts(self, row):
+        """ True if a source row matches the filter pattern, if any.
+
+        """
+        if self.pattern is None:
+            return True
+        model = self.sourceModel()
+        text = model.data(model.index(row, self.filterKeyColumn),
+                          Qt.DisplayRole).toString()
+        return self.pattern.indexIn(text) != -1
+
+    def mergeRows(self):
+        """ Builds the rows shown from the arrays of the accepted types.
+
+        @return None
         """
-        baseClass = QSortFilterProxyModel
-        baseAccepts = baseClass.filterAcceptsRow(self, row, parent)
-        acceptTypes = self.acceptTypes
+        self.indexRows()
+        acceptTypes, pattern = self.acceptTypes, self.pattern
+        if acceptTypes is None and pattern is None:
+            self.rows = None
+            return
         if acceptTypes is None:
-            return baseAccepts
-        message = self.messages[row]
-        return message.typeName in acceptTypes and baseAccepts
+            lists = self.typeRows.values()
+        else:
+            lists = [self.typeRows[t] for t in acceptTypes
+                     if t in self.typeRows]
+        if len(lists) == 1:
+            rows = array('l', lists[0])
+        else:
+            ## each array is sorted, so this is a merge of sorted runs
+            rows = array('l', sorted(chain(*lists)))
+        if pattern is not None:
+            rows = array('l', [row for row in rows if self.accepts(row)])
+        self.rows = rows
+
+    def reset(self):
+        """ Rebuilds the rows shown and resets attached views.
+
+        """
+        self.mergeRows()
+        QAbstractProxyModel.reset(self)
+
+    def on_source_rowsInserted(self, parent, first, last):
+        """ Appends new messages of the accepted types.
+
+        """
+        rows = self.rows
+        if rows is None:
+            start, count = self.indexed, self.sourceModel().rowCount()
+            if count > start:
+                self.beginInsertRows(QModelIndex(), start, count - 1)
+                self.indexRows()
+                self.endInsertRows()
+            return
+        start = self.indexRows()
+        acceptTypes, messages = self.acceptTypes, self.messages
+        added = [row for row in xrange(start, self.indexed)
+                 if (acceptTypes is None or
+                     messages[row].typeName in acceptTypes)
+                 and self.accepts(row)]
+        if added:
+            count = len(rows)
+            self.beginInsertRows(QModelIndex(), count, count + len(added) - 1)
+            rows.extend(added)
+            self.endInsertRows()
+
+    def on_source_dataChanged(self, topLeft, bottomRight):
+        """ Maps changes of source cells to the rows shown.
+
+        """
+        first = self.mapFromSource(topLeft)
+        last = self.mapFromSource(bottomRight)
+        if first.isValid() and last.isValid():
+            self.emit(Signals.dataChanged, first, last)
+
+    def index(self, row, column, parent=QModelIndex()):
+        if parent.isValid() or not (0 <= row < self.rowCount()):
+            return QModelIndex()
+        return self.createIndex(row, column)
+
+    def parent(self, index=QModelIndex()):
+        return QModelIndex()
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        if self.rows is None:
+            return self.indexed
+        return len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return self.sourceModel().columnCount()
+
+    def mapToSource(self, index):
+        """ Source index of a row shown.
+
+        """
+        if not index.isValid():
+            return QModelIndex()
+        row = index.row()
+        if self.rows is not None:
+            row = self.rows[row]
+        return self.sourceModel().index(row, index.column())
+
+    def mapFromSource(self, index):
+        """ Index of a source row, or an invalid index if not shown.
+
+        """
+        if not index.isValid():
+            return QModelIndex()
+        row = index.row()
+        rows = self.rows
+        if rows is not None:
+            pos = bisect_left(rows, row)
+            if pos == len(rows) or rows[pos] != row:
+                return QModelIndex()
+            row = pos
+        elif row >= self.indexed:
+            return QModelIndex()
+        return self.createIndex(row, index.column())
+
+    def setFilterKeyColumn(self, column):
+        """ Sets the source column matched by the filter pattern.
+
+        """
+        self.filterKeyColumn = column
+
+    def setFilterWildcard(self, pattern):
+        """ Shows only rows matching a wildcard pattern; empty for all.
+
+        """
+        pattern = QString(pattern)
+        if pattern.isEmpty():
+            self.pattern = None
+        else:
+            self.pattern = QRegExp(pattern, Qt.CaseSensitive, QRegExp.Wildcard)
+        self.reset()
 
     def includeAll(self):
         """ Sets filter to accept all message types.
@@ -97,6 +269,11 @@ class MessageDisplay(QFrame, Ui_MessageDisplay, BasicHandler):
         """
         QFrame.__init__(self, parent)
         self.setupUi(self)
+        self.scrollValue = 0
+        self.scrollDown = True
+        self.prefetchTimer = timer = QTimer(self)
+        timer.setSingleShot(True)
+        self.connect(timer, Signals.timeout, self.prefetchRows)
         self.setupWidgets()
         self.setupColors()
         self.requestSession()
@@ -147,6 +324,43 @@ class MessageDisplay(QFrame, Ui_MessageDisplay, BasicHandler):
         self.filterModel.setFilterKeyColumn(sortCol)
         self.filterModel.setSourceModel(self.messagesModel)
         self.messageTable.setModel(self.filterModel)
+        self.connect(self.messageTable.verticalScrollBar(),
+                     Signals.intValueChanged, self.on_messageTable_scrolled)
+
+    def on_messageTable_scrolled(self, value):
+        """ Schedules formatting of the rows about to scroll into view.
+
+        The rows are formatted after the current rows are painted.
+
+        @param value vertical scroll bar value
+        @return None
+        """
+        self.scrollDown = value >= self.scrollValue
+        self.scrollValue = value
+        self.prefetchTimer.start(0)
+
+    def prefetchRows(self):
+        """ Formats the page of rows after (or before, when scrolling up)
+        the visible rows.
+
+        @return None
+        """
+        table, model = self.messageTable, self.filterModel
+        count = model.rowCount()
+        first = table.rowAt(0)
+        if first < 0:
+            return
+        last = table.rowAt(table.viewport().height() - 1)
+        if last < 0:
+            last = count - 1
+        page = last - first + 1
+        if self.scrollDown:
+            rows = range(last + 1, min(last + 1 + page, count))
+        else:
+            rows = range(max(first - page, 0), first)
+        mapToSource, index = model.mapToSource, model.index
+        self.messagesModel.prefetch(
+            [mapToSource(index(row, 0)).row() for row in rows])
 
     @pyqtSignature('int')
     def on_allCheck_stateChanged(self, state):
@@ -24,6 +24,7 @@ displayClasses = {
     'connection' : 'profit.workbench.connectiondisplay.ConnectionDisplay',
     'executions' : 'profit.workbench.executionsdisplay.ExecutionsDisplay',
     'historical data' : 'profit.workbench.historicaldatadisplay.HistoricalDataDisplay',
+    'latency' : 'profit.workbench.latencydisplay.LatencyDisplay',
     'messages' : 'profit.workbench.messagedisplay.MessageDisplay',
     'orders' : 'profit.workbench.orderdisplay.OrderDisplay',
     'portfolio' : 'profit.workbench.portfoliodisplay.PortfolioDisplay',
@@ -36,6 +37,7 @@ iconNameMap = {
     'account':'identity',
     'connection':'server',
     'historical data':'log',
+    'latency':'kchart',
     'messages':'view_text',
     'orders':'klipper_dock',
     'portfolio':'bookcase',